@@ -1,55 +1,142 @@
+import re
 import asyncio
 import logging
+from typing import Dict, List, Optional
+from langchain_core.exceptions import OutputParserException
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from pydantic import ValidationError
 from langgraph.graph import StateGraph, END
 
-from tools.search_tools import search_web
+from tools.knowledge_index import knowledge_search
 from agents import states
 from utils import prompts
+from utils.prompt_builder import build_messages
+from utils.blob_store import offload
+from utils.context_packing import (
+    ContextPacker,
+    format_context,
+    format_sources,
+    number_sources,
+)
+from utils.plan_parser import parse_plan_steps, format_steps, chunk_steps
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "3. Paint the walls", "Step 3: Paint the walls" or just "Paint the walls"
+STEP_REF = re.compile(r"^\s*(?:step\s*)?(\d+)\s*[.):-]?\s*(.*)$", re.I | re.S)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def _same_step(name: str, step_name: str) -> bool:
+    return bool(name) and (name in step_name or step_name in name)
+
+
+def match_estimates(
+    chunk: List[Dict], estimates: List[states.StepCost]
+) -> Dict[int, states.StepCost]:
+    """
+    Step number -> its estimate, matched on the number and name the model
+    copied into `StepCost.step`, never on the position. A number whose name
+    disagrees falls back to the name, estimates that match no step of the
+    chunk, or one already matched, are ignored.
+    """
+    names = {step["number"]: _normalize(step["step"]) for step in chunk}
+    matched = {}
+    for estimate in estimates:
+        reference = STEP_REF.match(estimate.step)
+        number = int(reference.group(1)) if reference else None
+        name = _normalize(reference.group(2) if reference else estimate.step)
+        if number not in names or (name and not _same_step(name, names[number])):
+            open_steps = [n for n in names if n not in matched]
+            number = next(
+                (n for n in open_steps if names[n] == name),
+                next((n for n in open_steps if _same_step(name, names[n])), None),
+            )
+        if number is not None and number not in matched:
+            matched[number] = estimate
+    return matched
+
 
 class EstimatorAgent:
     """
     Takes a plan and estimates the cost for each step and the total cost.
+    Steps are estimated in chunks running concurrently, the total is computed
+    from the per-step table rather than by the LLM.
     """
 
-    def __init__(self, llm):
+    def __init__(
+        self,
+        llm,
+        chunk_size: int = 5,
+        max_fan_out: int = 4,
+        context_packing: Optional[Dict] = None,
+    ):
         self.llm = llm
-        self.web_search_function = search_web
+        self.search_function = knowledge_search
+        self.chunk_size = chunk_size
+        self.max_fan_out = max_fan_out
+        self.packer = ContextPacker(**(context_packing or {}))
 
         build_estimator = StateGraph(states.EstimatorState)
 
-        build_estimator.add_node("search", self.search_node)
+        build_estimator.add_node("split", self.split_node)
         build_estimator.add_node("estimator", self.estimator_node)
+        build_estimator.add_node("merge", self.merge_node)
 
-        build_estimator.set_entry_point("search")
-        build_estimator.add_edge("search", "estimator")
-        build_estimator.add_edge("estimator", END)
+        build_estimator.set_entry_point("split")
+        build_estimator.add_edge("split", "estimator")
+        build_estimator.add_edge("estimator", "merge")
+        build_estimator.add_edge("merge", END)
 
         self.estimator_agent = build_estimator.compile()
 
-    async def search_node(self, state: states.EstimatorState):
-        messages = [
-            SystemMessage(content=prompts.COST_SEARCH_PROMPT),
-            HumanMessage(content=state.get("task", "")),
-        ]
+    def split_node(self, state: states.EstimatorState):
+        steps = parse_plan_steps(state.get("steps", []))
+        if not steps:
+            # no numbered plan to split, estimate the plan (or task) as one step
+            whole = "\n".join(state.get("steps", [])) or state.get("task", "")
+            steps = [{"number": 1, "step": whole, "time": "", "dependency": ""}]
+
+        return {
+            "node_name": "split",
+            "chunks": chunk_steps(steps, self.chunk_size),
+            "task": state.get("task", ""),
+        }
+
+    async def search_chunk(self, task, chunk):
+        if not self.packer.budget("estimator"):
+            # no room for search results in the prompt, don't pay for them
+            return []
+
+        messages = build_messages(
+            prompts.COST_SEARCH_PROMPT,
+            task=task,
+            sections={"Steps": format_steps(chunk)},
+        )
         search_queries = await self.llm.with_structured_output(states.Query).ainvoke(
             messages
         )
 
-        search_results = []
-
+        queries, max_results = self.packer.limit_searches(
+            search_queries.query, search_queries.max_results, "estimator"
+        )
         tasks = [
-            self.web_search_function.ainvoke(
-                {"query": q, "max_results": search_queries.max_results}
+            self.search_function.ainvoke(
+                {
+                    "query": q,
+                    "max_results": max_results,
+                    "agent": "estimator",
+                }
             )
-            for q in search_queries.query
+            for q in queries
         ]
         responses = await asyncio.gather(*tasks)
 
+        search_results = []
         for response in responses:
             for item in response:
                 search_results.append(
@@ -58,27 +145,118 @@ class EstimatorAgent:
                         "content": item.get("content", ""),
                     }
                 )
+        return search_results
+
+    async def estimate_chunk(self, task, chunk, semaphore):
+        async with semaphore:
+            search_results = await self.search_chunk(task, chunk)
+            packed = await self.packer.pack(
+                f"{task}\n{format_steps(chunk)}",
+                search_results,
+                self.packer.budget("estimator"),
+            )
+            sources = number_sources(packed)
+
+            formatted_content_string = format_context(packed, sources)
+            messages = build_messages(
+                prompts.ESTIMATOR_PROMPT,
+                task=task,
+                sections={
+                    "Steps": format_steps(chunk),
+                    "Search results": formatted_content_string,
+                },
+            )
+            try:
+                response = await self.llm.with_structured_output(
+                    states.StepCostEstimates
+                ).ainvoke(messages)
+                estimates = match_estimates(chunk, response.estimates)
+                missing = "No estimate returned"
+            except (OutputParserException, ValidationError) as e:
+                # the other chunks' estimates stay usable
+                logger.warning(
+                    "Unparsable estimate for steps %s: %s",
+                    [step["number"] for step in chunk],
+                    e,
+                )
+                estimates, missing = {}, "No reliable estimate found"
+
+        urls = {s["id"]: s["url"] for s in sources}
+        rows = []
+        for step in chunk:
+            estimate = estimates.get(step["number"])
+            rows.append(
+                {
+                    "number": step["number"],
+                    "step": step["step"],
+                    "cost": estimate.cost if estimate else None,
+                    "note": estimate.note if estimate else missing,
+                    "sources": (
+                        [urls[n] for n in estimate.sources if n in urls]
+                        if estimate
+                        else []
+                    ),
+                }
+            )
+        return rows, search_results
+
+    async def estimator_node(self, state: states.EstimatorState):
+        semaphore = asyncio.Semaphore(self.max_fan_out)
+        results = await asyncio.gather(
+            *[
+                self.estimate_chunk(state.get("task", ""), chunk, semaphore)
+                for chunk in state.get("chunks", [])
+            ]
+        )
+
+        cost_table, retrieved_content = [], []
+        for rows, search_results in results:
+            cost_table.extend(rows)
+            retrieved_content.extend(search_results)
 
         return {
-            "node_name": "search",
-            "retrieved_content": search_results,
+            "node_name": "estimator",
+            "cost_table": cost_table,
+            "retrieved_content": await offload(retrieved_content),
             "task": state.get("task", ""),
         }
 
-    async def estimator_node(self, state: states.EstimatorState):
-        messages = [
-            SystemMessage(content=prompts.ESTIMATOR_PROMPT),
-            HumanMessage(content=state.get("task", "")),
+    def merge_node(self, state: states.EstimatorState):
+        cost_table = sorted(state.get("cost_table", []), key=lambda row: row["number"])
+        priced_rows = [row for row in cost_table if row["cost"] is not None]
+        priced = [row["cost"] for row in priced_rows]
+        total_cost = round(sum(priced), 2)
+
+        lines = [
+            f"Estimated Total Project Cost: ${total_cost:,.2f} "
+            f"(based on {len(priced)} of {len(cost_table)} steps)",
+            "",
         ]
-        response = await self.llm.ainvoke(messages)
+        # one numbering of the cited sources across all chunks
+        sources = number_sources(
+            [{"url": url} for row in cost_table for url in row.get("sources", [])]
+        )
+        ids = {s["url"]: s["id"] for s in sources}
+        for row in cost_table:
+            cost = (
+                f'${row["cost"]:,.2f}'
+                if row["cost"] is not None
+                else "Estimate unavailable"
+            )
+            citations = "".join(f"[{ids[url]}]" for url in row.get("sources", []))
+            lines.append(
+                f'{row["number"]}. {row["step"]} || {cost}'
+                + (f" {citations}" if citations else "")
+            )
+        if sources:
+            lines.extend(["", format_sources(sources)])
 
         return {
             "task": state.get("task", ""),
-            "node_name": "estimator",
+            "node_name": "merge",
             "next_node": state.get("next_node", ""),
-            "estimates": response.content,
+            "cost_table": cost_table,
+            "total_cost": total_cost,
+            "estimates": "\n".join(lines),
             "retrieved_content": state.get("retrieved_content", []),
         }
-
-
-#
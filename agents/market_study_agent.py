@@ -1,12 +1,22 @@
 import asyncio
 import logging
+from typing import Dict, Optional
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from langgraph.graph import StateGraph, END
 from langgraph.types import Command
 
-from tools.search_tools import search_web
+from tools.knowledge_index import knowledge_search
 from agents import states
 from utils import prompts
+from utils.prompt_builder import build_messages
+from utils.blob_store import offload, resolve
+from utils.context_packing import (
+    ContextPacker,
+    cited,
+    format_context,
+    format_sources,
+    number_sources,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,9 +27,10 @@ class MarketStudyAgent:
     Search for trends and competitors, and generate a report.
     """
 
-    def __init__(self, llm):
+    def __init__(self, llm, context_packing: Optional[Dict] = None):
         self.llm = llm
-        self.web_search_function = search_web
+        self.search_function = knowledge_search
+        self.packer = ContextPacker(**(context_packing or {}))
 
         build_market_study = StateGraph(states.MarketStudyState)
 
@@ -33,21 +44,31 @@ class MarketStudyAgent:
         self.market_study_agent = build_market_study.compile()
 
     async def search_node(self, state: states.MarketStudyState):
-        messages = [
-            SystemMessage(content=prompts.SEARCH_MARKET_PROMPT),
-            HumanMessage(content=state.get("task", "")),
-        ]
+        if not self.packer.budget("market_study"):
+            # no room for search results in the prompt, don't pay for them
+            return {"node_name": "search", "retrieved_content": []}
+
+        messages = build_messages(
+            prompts.SEARCH_MARKET_PROMPT, task=state.get("task", "")
+        )
         search_queries = await self.llm.with_structured_output(states.Query).ainvoke(
             messages
         )
 
         search_results = []
 
+        queries, max_results = self.packer.limit_searches(
+            search_queries.query, search_queries.max_results, "market_study"
+        )
         tasks = [
-            self.web_search_function.ainvoke(
-                {"query": q, "max_results": search_queries.max_results}
+            self.search_function.ainvoke(
+                {
+                    "query": q,
+                    "max_results": max_results,
+                    "agent": "market_study",
+                }
             )
-            for q in search_queries.query
+            for q in queries
         ]
         responses = await asyncio.gather(*tasks)
 
@@ -62,19 +83,32 @@ class MarketStudyAgent:
 
         return {
             "node_name": "search",
-            "retrieved_content": search_results,
+            "retrieved_content": await offload(search_results),
             "task": state.get("task", ""),
         }
 
     async def market_study_node(self, state: states.MarketStudyState):
-        messages = [
-            SystemMessage(content=prompts.MARKET_STUDY_PROMPT),
-            HumanMessage(content=state.get("task", "")),
-        ]
+        packed = await self.packer.pack(
+            state.get("task", ""),
+            await resolve(state.get("retrieved_content", [])),
+            self.packer.budget("market_study"),
+        )
+        sources = number_sources(packed)
+        messages = build_messages(
+            prompts.MARKET_STUDY_PROMPT,
+            task=state.get("task", ""),
+            sections={"Search results": format_context(packed, sources)},
+        )
         response = await self.llm.ainvoke(messages)
 
+        citations = cited(response.content, sources)
+        market_study = response.content
+        if citations:
+            market_study = f"{market_study}\n\n{format_sources(citations)}"
+
         return {
             "node_name": "market_studier",
-            "market_study": response.content,
+            "market_study": (await offload([market_study]))[0],
+            "citations": citations,
             "task": state.get("task", ""),
         }
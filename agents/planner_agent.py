@@ -1,12 +1,22 @@
+import time
 import asyncio
+import contextvars
 import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from langgraph.types import Command, interrupt
 
-from tools.search_tools import search_web
+from tools.knowledge_index import knowledge_search
 from agents import states
 from utils import prompts
+from utils.prompt_builder import build_messages
+from utils.blob_store import offload, resolve
+from utils.context_packing import ContextPacker, format_context
+from utils.llm_limiter import llm_priority
+from utils.metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,51 +27,149 @@ logger = logging.getLogger(__name__)
 
 class PlannerAgent:
     """
-    Search -> Generate a plan with clear steps.
+    Search -> Pack the results into a token budget -> Generate a plan with clear steps.
+
+    With speculative_search the searches for the original task run in the
+    background while the thread waits for the human, after the resume only
+    the clarification needs a (delta) search.
     """
 
-    def __init__(self, llm):
+    def __init__(
+        self,
+        llm,
+        context_packing: Optional[Dict] = None,
+        speculative_search: bool = False,
+        prefetch_ttl: float = 3600.0,
+        max_prefetched: int = 256,
+    ):
         self.llm = llm
-        self.web_search_function = search_web
+        self.search_function = knowledge_search
+        self.packer = ContextPacker(**(context_packing or {}))
+        self.speculative_search = speculative_search
+        self.prefetch_ttl = prefetch_ttl
+        self.max_prefetched = max_prefetched
+        # thread_id -> (started_at, task, background search, expiry timer)
+        self.prefetched: "OrderedDict[str, tuple]" = OrderedDict()
+        self.prefetch_outcomes = metrics.counter(
+            "planner_prefetch_total", "Speculative planner searches by outcome"
+        )
 
         build_search = StateGraph(states.PlanState)
 
         build_search.add_node("search", self.search_node)
+        build_search.add_node("pack", self.pack_node)
         build_search.add_node("planner", self.planner_node)
         build_search.add_node("interrupt", self.human_in_the_loop)
 
         build_search.set_entry_point("interrupt")
         build_search.add_edge("interrupt", "search")
-        build_search.add_edge("search", "planner")
+        build_search.add_edge("search", "pack")
+        build_search.add_edge("pack", "planner")
         build_search.add_edge("planner", END)
 
         self.planner_agent = build_search.compile()
 
-    async def human_in_the_loop(self, state: states.PlanState):
-        messages = [
-            SystemMessage(content=prompts.HITL_PROMPT),
-            HumanMessage(content=state.get("task", "")),
-        ]
+    async def human_in_the_loop(
+        self, state: states.PlanState, config: RunnableConfig
+    ):
+        if self.speculative_search:
+            self._start_prefetch(
+                config["configurable"]["thread_id"], state.get("task", "").strip()
+            )
+
+        messages = build_messages(prompts.HITL_PROMPT, task=state.get("task", ""))
         question_to_human = await self.llm.ainvoke(messages)
 
         return interrupt({"query": question_to_human.content})
 
-    async def search_node(self, state: states.PlanState):
-        messages = [
-            SystemMessage(content=prompts.SEARCH_PROMPT),
-            HumanMessage(content=state.get("task", "")),
-        ]
-        search_queries = await self.llm.with_structured_output(states.Query).ainvoke(
-            messages
+    # ---------------- speculative search ----------------
+
+    def _drop_prefetch(self, thread_id: str, outcome: str):
+        _, _, prefetch, timer = self.prefetched.pop(thread_id)
+        prefetch.cancel()
+        timer.cancel()
+        self.prefetch_outcomes.inc(outcome=outcome)
+
+    def _purge_prefetched(self, room: int = 0):
+        """Drop expired searches, and the oldest ones until `room` slots are free."""
+        now = time.monotonic()
+        while self.prefetched and (
+            len(self.prefetched) > self.max_prefetched - room
+            or now - next(iter(self.prefetched.values()))[0] > self.prefetch_ttl
+        ):
+            self._drop_prefetch(next(iter(self.prefetched)), "expired")
+
+    def _expire_prefetch(self, thread_id: str, prefetch: asyncio.Task):
+        # threads that are never resumed would otherwise keep their results
+        entry = self.prefetched.get(thread_id)
+        if entry is not None and entry[2] is prefetch:
+            self._drop_prefetch(thread_id, "expired")
+
+    def _start_prefetch(self, thread_id: str, task: str):
+        # the node runs again on resume, the first run's search is kept
+        if thread_id in self.prefetched:
+            return
+        self._purge_prefetched(room=1)
+        # a fresh context keeps the search out of the interrupt node's run,
+        # its structured output would otherwise stream with the question
+        prefetch = asyncio.create_task(
+            self._prefetch(task), context=contextvars.Context()
         )
-
+        timer = asyncio.get_running_loop().call_later(
+            self.prefetch_ttl, self._expire_prefetch, thread_id, prefetch
+        )
+        self.prefetched[thread_id] = (time.monotonic(), task, prefetch, timer)
+
+    async def _prefetch(self, task: str):
+        # runs while the user answers, nobody waits on it yet
+        with llm_priority("batch"):
+            messages = build_messages(prompts.SEARCH_PROMPT, task=task)
+            search_queries = await self.llm.with_structured_output(
+                states.Query
+            ).ainvoke(messages, config={"callbacks": []})
+            results = await self._search(
+                search_queries.query, search_queries.max_results
+            )
+        return search_queries.query, results
+
+    async def _take_prefetch(self, thread_id: Optional[str], task: str):
+        """(prefetched task, queries, results) or None when there is nothing to use."""
+        self._purge_prefetched()
+        entry = self.prefetched.pop(thread_id, None) if thread_id else None
+        if entry is None:
+            return None
+        _, prefetched_task, prefetch, timer = entry
+        timer.cancel()
+        if not task.startswith(prefetched_task):
+            prefetch.cancel()
+            self.prefetch_outcomes.inc(outcome="stale")
+            return None
+        try:
+            queries, results = await prefetch
+        except Exception as e:
+            logger.warning("Speculative planner search failed: %s", e)
+            self.prefetch_outcomes.inc(outcome="failed")
+            return None
+        self.prefetch_outcomes.inc(outcome="used")
+        return prefetched_task, queries, results
+
+    # ---------------- search ----------------
+
+    async def _search(self, queries: List[str], max_results: int) -> List[Dict]:
         search_results = []
 
+        queries, max_results = self.packer.limit_searches(
+            queries, max_results, "planner"
+        )
         tasks = [
-            self.web_search_function.ainvoke(
-                {"query": q, "max_results": search_queries.max_results}
+            self.search_function.ainvoke(
+                {
+                    "query": q,
+                    "max_results": max_results,
+                    "agent": "planner",
+                }
             )
-            for q in search_queries.query
+            for q in queries
         ]
         responses = await asyncio.gather(*tasks)
 
@@ -73,27 +181,70 @@ class PlannerAgent:
                         "content": item.get("content", ""),
                     }
                 )
+        return search_results
+
+    async def search_node(self, state: states.PlanState, config: RunnableConfig):
+        task = state.get("task", "")
+        prefetched = await self._take_prefetch(
+            config.get("configurable", {}).get("thread_id"), task.strip()
+        )
+
+        if prefetched is None:
+            messages = build_messages(prompts.SEARCH_PROMPT, task=task)
+            search_queries = await self.llm.with_structured_output(
+                states.Query
+            ).ainvoke(messages)
+            search_results = await self._search(
+                search_queries.query, search_queries.max_results
+            )
+        else:
+            # only search for what the clarification added
+            prefetched_task, queries, search_results = prefetched
+            clarification = task.strip()[len(prefetched_task) :].strip()
+            if clarification:
+                messages = build_messages(
+                    prompts.DELTA_SEARCH_PROMPT,
+                    task=prefetched_task,
+                    sections={
+                        "Already searched": "\n".join(queries),
+                        "Clarification": clarification,
+                    },
+                )
+                delta_queries = await self.llm.with_structured_output(
+                    states.Query
+                ).ainvoke(messages)
+                search_results += await self._search(
+                    delta_queries.query, delta_queries.max_results
+                )
 
         return {
             "node_name": "search",
-            "retrieved_content": search_results,
+            "retrieved_content": await offload(search_results),
+            "task": state.get("task", ""),
+        }
+
+    async def pack_node(self, state: states.PlanState):
+        packed = await self.packer.pack(
+            state.get("task", ""),
+            await resolve(state["retrieved_content"]),
+            self.packer.budget("planner"),
+        )
+        return {
+            "node_name": "pack",
+            "packed_context": await offload(packed),
             "task": state.get("task", ""),
         }
 
     async def planner_node(self, state: states.PlanState):
-        formatted_retrieved_content = []
-        for item in state["retrieved_content"]:
-            formatted = f'url: {item["url"]}\ncontent: {item["content"]}'
-            formatted_retrieved_content.append(formatted)
-
-        formatted_content_string = "\n\n".join(formatted_retrieved_content)
-
-        messages = [
-            SystemMessage(content=prompts.PLANNER_PROMPT),
-            HumanMessage(
-                content=f'{state.get("task", "")}\n\n{formatted_content_string}'
-            ),
-        ]
+        formatted_content_string = format_context(
+            await resolve(state.get("packed_context", []))
+        )
+
+        messages = build_messages(
+            prompts.PLANNER_PROMPT,
+            task=state.get("task", ""),
+            sections={"Search results": formatted_content_string},
+        )
         response = await self.llm.ainvoke(messages)
 
         return {
@@ -7,6 +7,9 @@ from langgraph.types import Command
 
 from agents import states
 from utils import prompts
+from utils.prompt_builder import build_messages
+from utils.plan_parser import parse_plan_steps
+from utils.scheduler import build_schedule, format_schedule
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,32 +18,98 @@ logger = logging.getLogger(__name__)
 class ScheduleAgent:
     """
     Takes steps and makes a full schedule for the project including the steps that can be done in parallel.
+    The schedule is computed by the critical path engine, the LLM only narrates it.
     """
 
-    def __init__(self, llm):
+    def __init__(
+        self,
+        llm,
+        max_parallel: int = 3,
+        narrate: bool = True,
+        default_duration: float = 1.0,
+        hours_per_day: float = 8.0,
+        days_per_week: float = 7.0,
+    ):
         self.llm = llm
+        self.narrate = narrate
+        self.engine_settings = {
+            "max_parallel": max_parallel,
+            "default_duration": default_duration,
+            "hours_per_day": hours_per_day,
+            "days_per_week": days_per_week,
+        }
+
+        build_schedule_graph = StateGraph(states.ScheduleState)
 
-        build_schedule = StateGraph(states.ScheduleState)
+        build_schedule_graph.add_node("engine", self.engine_node)
+        build_schedule_graph.add_node("scheduler", self.schedule_node)
 
-        build_schedule.add_node("scheduler", self.schedule_node)
+        build_schedule_graph.set_entry_point("engine")
+        build_schedule_graph.add_edge("engine", "scheduler")
+        build_schedule_graph.add_edge("scheduler", END)
 
-        build_schedule.set_entry_point("scheduler")
-        build_schedule.add_edge("scheduler", END)
+        self.schedule_agent = build_schedule_graph.compile()
 
-        self.schedule_agent = build_schedule.compile()
+    def engine_node(self, state: states.ScheduleState):
+        steps = parse_plan_steps(state.get("steps", []))
+        schedule_data = build_schedule(steps, **self.engine_settings) if steps else {}
+
+        return {
+            "task": state.get("task", ""),
+            "node_name": "engine",
+            "schedule_data": schedule_data,
+        }
 
     async def schedule_node(self, state: states.ScheduleState):
-        messages = [
-            SystemMessage(content=prompts.SCHEDULER_PROMPT),
-            HumanMessage(
-                content=f'{state.get("task", "")}\n\n{state.get("steps", "")}'
-            ),
-        ]
+        schedule_data = state.get("schedule_data") or {}
+
+        if not schedule_data.get("steps"):
+            # plan is not in the step || time stamp || dependency format,
+            # let the LLM work out the schedule from the free text
+            messages = build_messages(
+                prompts.SCHEDULER_PROMPT,
+                task=state.get("task", ""),
+                sections={"Plan": "\n".join(state.get("steps", []))},
+            )
+            response = await self.llm.ainvoke(messages)
+            return {
+                "task": state.get("task", ""),
+                "node_name": "schedule",
+                "schedule": response.content,
+            }
+
+        schedule = format_schedule(schedule_data)
 
-        response = await self.llm.ainvoke(messages)
+        if self.narrate:
+            critical_path = set(schedule_data["critical_path"])
+            most_slack = sorted(
+                schedule_data["steps"], key=lambda s: s["slack"], reverse=True
+            )[:5]
+            summary = (
+                f"Total duration: {schedule_data['project_duration']} days "
+                f"on {schedule_data['lanes']} parallel lanes\n"
+                f"Critical path ({schedule_data['critical_path_duration']} days): "
+                + " -> ".join(
+                    f"Step {s['number']} {s['step']}"
+                    for s in schedule_data["steps"]
+                    if s["number"] in critical_path
+                )
+                + "\nMost slack: "
+                + "; ".join(
+                    f"Step {s['number']} {s['step']} ({s['slack']} days)"
+                    for s in most_slack
+                )
+            )
+            messages = build_messages(
+                prompts.SCHEDULE_NARRATION_PROMPT,
+                task=state.get("task", ""),
+                sections={"Computed schedule": summary},
+            )
+            response = await self.llm.ainvoke(messages)
+            schedule = f"{schedule}\n\n{response.content}"
 
         return {
             "task": state.get("task", ""),
             "node_name": "schedule",
-            "schedule": response.content,
+            "schedule": schedule,
         }
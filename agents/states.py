@@ -2,6 +2,13 @@ from typing import List, Dict, Literal, Annotated, Optional, TypedDict
 from pydantic import BaseModel, Field
 import operator
 
+# ======================= Reducers =======================
+
+
+def _merge_dicts(left: Dict, right: Dict) -> Dict:
+    return {**(left or {}), **(right or {})}
+
+
 # ======================= Validation =======================
 
 
@@ -14,7 +21,27 @@ class Query(BaseModel):
     max_results: int = 3
 
 
+class StepCost(BaseModel):
+    step: str
+    cost: Optional[float] = Field(
+        None, description="Average cost in USD, empty when no reliable estimate exists"
+    )
+    note: str = ""
+    sources: List[int] = Field(
+        default_factory=list,
+        description="Numbers of the search results the estimate is based on",
+    )
+
+
+class StepCostEstimates(BaseModel):
+    estimates: List[StepCost]
+
+
 # ======================= States =======================
+# retrieved_content, packed_context, report and market_study hold blob store
+# references ("sha256:..."), the content itself lives in utils.blob_store.
+# MainState.end holds the reference of the report or market study, the chat
+# reply is kept inline.
 
 
 class PlanState(TypedDict):
@@ -23,7 +50,8 @@ class PlanState(TypedDict):
     plan: List[str]
     node_name: str
     next_node: str
-    retrieved_content: List[Dict]
+    retrieved_content: List[str]
+    packed_context: List[str]
 
 
 class EstimatorState(TypedDict):
@@ -31,8 +59,11 @@ class EstimatorState(TypedDict):
     steps: List[str]
     node_name: str
     next_node: str
-    retrieved_content: List[Dict]
-    estimates: List[str]
+    retrieved_content: List[str]
+    estimates: str
+    chunks: List[List[Dict]]
+    cost_table: List[Dict]
+    total_cost: float
 
 
 class ScheduleState(TypedDict):
@@ -40,6 +71,7 @@ class ScheduleState(TypedDict):
     node_name: str
     steps: List[str]
     schedule: str
+    schedule_data: Dict
 
 
 class ReportState(TypedDict):
@@ -52,8 +84,9 @@ class MarketStudyState(TypedDict):
     task: str
     node_name: str
     next_node: str
-    retrieved_content: List[Dict]
+    retrieved_content: List[str]
     market_study: str
+    citations: List[Dict]
 
 
 class MainState(TypedDict):
@@ -63,10 +96,12 @@ class MainState(TypedDict):
     plan: List[str]
     estimates: str
     schedule: str
-    retrieved_content: List[Dict]
+    retrieved_content: List[str]
     hitl: str
     end: str
     history: List[Dict]
+    history_summary: str
+    branches: Annotated[Dict[str, Dict], _merge_dicts]
     plan_state: PlanState
     schedule_state: ScheduleState
     estimator_state: EstimatorState
@@ -84,25 +119,29 @@ def _initialize_state(Input) -> MainState:
         "node_name": "",
         "next_node": "",
         "plan": [],
-        "estimates": [],
+        "estimates": "",
         "schedule": "",
         "retrieved_content": [],
         "chat": "",
         "hitl": "",
         "end": "",
         "history": [],
+        "history_summary": "",
+        "branches": {},
         "plan_state": {
             "task": "",
             "plan": [],
             "node_name": "",
             "next_node": "",
             "retrieved_content": [],
+            "packed_context": [],
         },
         "schedule_state": {
             "task": "",
             "node_name": "",
             "steps": [],
             "schedule": "",
+            "schedule_data": {},
         },
         "estimator_state": {
             "task": "",
@@ -110,7 +149,10 @@ def _initialize_state(Input) -> MainState:
             "node_name": "",
             "next_node": "",
             "retrieved_content": [],
-            "estimates": [],
+            "estimates": "",
+            "chunks": [],
+            "cost_table": [],
+            "total_cost": 0.0,
         },
         "report_state": {
             "task": "",
@@ -123,5 +165,6 @@ def _initialize_state(Input) -> MainState:
             "next_node": "",
             "retrieved_content": [],
             "market_study": "",
+            "citations": [],
         },
     }
@@ -0,0 +1,227 @@
+import re
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from agents import states
+from tools.search_tools import AsyncSearchClient
+from utils import prompts
+from utils.prompt_builder import _clean
+from utils.tokens import count_tokens
+
+# ===================== Benchmark Fakes =====================
+# Deterministic stand-ins for ChatOllama and the Tavily client. Replies
+# depend only on the prompt, latency only on the settings, so two runs of
+# the benchmark differ by the orchestration code alone.
+
+STEP_LINE = re.compile(r"^(\d+)\. (.+)$", re.M)
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _section(text: str, title: str) -> str:
+    match = re.search(rf"^{title}:\n(.*?)(?:\n\n[A-Z][\w ]*:\n|\Z)", text, re.S | re.M)
+    return match.group(1) if match else ""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model with a fixed time to first token and generation rate, it
+    answers every prompt of the graph with a canned, well formed reply and
+    reports Ollama style token counts and durations.
+    """
+
+    time_to_first_token: float = 0.05
+    tokens_per_second: float = 100.0
+    plan_steps: int = 8
+    filler_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    # ---------------- replies ----------------
+
+    def _plan(self) -> str:
+        lines = ["Steps:"]
+        for n in range(1, self.plan_steps + 1):
+            dependency = "none" if n == 1 else f"step {max(1, n - 1 - n % 2)}"
+            lines.append(
+                f"{n}. step: Work package {n} || time stamp: {1 + n % 3} days "
+                f"|| dependency : {dependency}"
+            )
+        return "\n".join(lines)
+
+    def _reply(self, messages) -> str:
+        system = messages[0].content if messages else ""
+        if system == _clean(prompts.PLANNER_PROMPT):
+            return self._plan()
+        if system == _clean(prompts.HITL_PROMPT):
+            return "What is your budget, preferred style and deadline?"
+        if system == _clean(prompts.HISTORY_SUMMARY_PROMPT):
+            return "The user is planning a project and answered the clarifications."
+        reply = "Here is the requested analysis of the project [1]."
+        if self.filler_tokens:
+            reply += " " + " ".join(["detail"] * self.filler_tokens)
+        return reply
+
+    def _structured(self, schema, messages) -> Any:
+        text = str(messages[-1].content)
+        system = messages[0].content if messages else ""
+        if schema is states.MainRouter:
+            lowered = text.lower()
+            if "market" in lowered:
+                return schema(next_node="market_study_agent")
+            if re.search(r"^(message:\n)?(hi|hello|thanks)\b", lowered, re.M):
+                return schema(next_node="chat")
+            return schema(next_node="planner_agent")
+        if schema is states.Query:
+            if system == _clean(prompts.DELTA_SEARCH_PROMPT):
+                return schema(query=[], max_results=3)
+            topic = " ".join(_section(text, "Project").split()[:6]) or "project"
+            return schema(query=[f"{topic} cost", f"{topic} materials"], max_results=3)
+        if schema is states.StepCostEstimates:
+            steps = STEP_LINE.findall(_section(text, "Steps"))
+            return schema(
+                estimates=[
+                    states.StepCost(
+                        step=step, cost=float(100 + _digest(step) % 900), sources=[1]
+                    )
+                    for _, step in steps
+                ]
+            )
+        return schema.model_construct()
+
+    # ---------------- timing ----------------
+
+    def _info(self, messages, reply: str) -> Dict[str, Any]:
+        prompt_tokens = sum(count_tokens(str(m.content)) for m in messages)
+        completion_tokens = count_tokens(reply)
+        return {
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.time_to_first_token * 1e9),
+            "eval_count": completion_tokens,
+            "eval_duration": int(completion_tokens / self.tokens_per_second * 1e9),
+        }
+
+    def _delay(self, reply: str) -> float:
+        return self.time_to_first_token + count_tokens(reply) / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        time.sleep(self._delay(reply))
+        return self._result(messages, reply)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        await asyncio.sleep(self._delay(reply))
+        return self._result(messages, reply)
+
+    def _result(self, messages, reply: str) -> ChatResult:
+        info = self._info(messages, reply)
+        message = AIMessage(content=reply, response_metadata=info)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        await asyncio.sleep(self.time_to_first_token)
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            token = word if i == len(words) - 1 else word + " "
+            await asyncio.sleep(count_tokens(token) / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="", response_metadata=self._info(messages, reply)
+            )
+        )
+
+    def with_structured_output(self, schema, **kwargs):
+        def invoke(messages):
+            response = self._structured(schema, messages)
+            time.sleep(self._delay(response.model_dump_json()))
+            return response
+
+        async def ainvoke(messages):
+            response = self._structured(schema, messages)
+            await asyncio.sleep(self._delay(response.model_dump_json()))
+            return response
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+
+class FakeSearchClient(AsyncSearchClient):
+    """Tavily stand-in, deterministic results after a fixed latency."""
+
+    def __init__(self, latency: float = 0.2, content_tokens: int = 120):
+        self.latency = latency
+        self.content_tokens = content_tokens
+        self.calls = 0
+
+    async def search(
+        self, query: str, max_results: int = 3, include_raw_content: bool = False
+    ) -> List[Dict]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        seed = _digest(query)
+        results = []
+        for i in range(max_results):
+            # distinct words per result, identical ones would be deduplicated
+            words = " ".join(
+                f"term{(seed + i * 7919 + j * 104729) % 100003}"
+                for j in range(self.content_tokens)
+            )
+            results.append(
+                {
+                    "title": f"{query} ({i})",
+                    "url": f"https://example.com/{seed % 10000}/{i}",
+                    "content": f"{query}: typical cost ${100 * (i + 1)}. {words}.",
+                    "score": round(1.0 - i * 0.1, 2),
+                }
+            )
+        return results
+
+    async def aclose(self):
+        pass
+
+
+def fake_settings(settings: Dict, workdir: str) -> Dict:
+    """
+    Copy of config.yaml settings for offline runs: checkpoints and blobs in
+    `workdir`, no caches or embedding models that would need a download or
+    hide the cost of the graph itself.
+    """
+    settings = dict(settings)
+    checkpointer = dict(settings.get("checkpointer", {}))
+    checkpointer["backend"] = "sqlite"
+    checkpointer["sqlite"] = {
+        **checkpointer.get("sqlite", {}),
+        "path": f"{workdir}/checkpoints.sqlite",
+    }
+    settings["checkpointer"] = checkpointer
+    settings["blob_store"] = {
+        **settings.get("blob_store", {}),
+        "path": f"{workdir}/blobs",
+    }
+    settings["llm_cache"] = {"enabled": False}
+    settings["search_cache"] = {"enabled": False}
+    settings["knowledge_index"] = {"enabled": False}
+    settings["router"] = {**settings.get("router", {}), "embeddings": False}
+    settings["context_packing"] = {
+        **settings.get("context_packing", {}),
+        "embeddings": False,
+    }
+    settings["retention"] = {"enabled": False}
+    return settings
+
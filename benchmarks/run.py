@@ -0,0 +1,304 @@
+import gc
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+from uuid import UUID
+
+import httpx
+import psutil
+from langchain_core.callbacks import BaseCallbackHandler
+
+from benchmarks.fakes import FakeChatModel, FakeSearchClient, fake_settings
+from config import load_config
+from main.main_graph import STREAM_NODES, ProjectManager, RunProjectManager
+from utils.llm_timing import LLMTimingCallback
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===================== Offline Benchmark =====================
+# Drives the graph (RunProjectManager) or the FastAPI app with a fake chat
+# model and search backend, so latency and memory reflect the orchestration
+# layer alone:
+#   python -m benchmarks.run --mode graph --runs 50 --concurrency 8
+#   python -m benchmarks.run --mode api --scenario mix --tokens-per-second 40
+
+SCENARIOS = {
+    # (first message, answer to the clarifying question or None)
+    "planner": (
+        "I want to do finishing works to my room",
+        "Open budget, modern style, done within two months.",
+    ),
+    "market": ("Do a market study for a coffee shop in my city", None),
+    "chat": ("hello", None),
+}
+MIX = ["planner", "planner", "planner", "market", "chat"]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(p * len(ordered)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": round(rank(0.50), 4),
+        "p95": round(rank(0.95), 4),
+        "p99": round(rank(0.99), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Wall time of every graph node run, by node name."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.started: Dict[UUID, tuple] = {}
+        self.durations: Dict[str, List[float]] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node in STREAM_NODES and kwargs.get("name") == node:
+            self.started[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            self.durations.setdefault(node, []).append(time.perf_counter() - start)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # interrupts end the node with an error, they still took the time
+        self.on_chain_end(None, run_id=run_id)
+
+    def reset(self):
+        self.durations = {}
+
+
+class MemorySampler:
+    def __init__(self, interval: float = 0.05):
+        self.process = psutil.Process()
+        self.interval = interval
+        self.start_rss = self.process.memory_info().rss
+        self.peak_rss = self.start_rss
+        self.task: Optional[asyncio.Task] = None
+
+    async def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> Dict[str, float]:
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        gc.collect()
+        end_rss = self.process.memory_info().rss
+        mb = 1024 * 1024
+        return {
+            "start_rss_mb": round(self.start_rss / mb, 1),
+            "peak_rss_mb": round(max(self.peak_rss, end_rss) / mb, 1),
+            "end_rss_mb": round(end_rss / mb, 1),
+        }
+
+
+def _checkpoint_totals() -> Dict[str, float]:
+    snapshot = metrics.snapshot()
+    writes = snapshot.get("checkpoint_write_seconds", {"values": []})["values"]
+    written = snapshot.get("checkpoint_bytes_written_total", {"values": []})["values"]
+    return {
+        "writes": sum(v["count"] for v in writes),
+        "seconds": sum(v["sum"] for v in writes),
+        "bytes": sum(v["value"] for v in written),
+    }
+
+
+# ---------------- drivers ----------------
+
+
+class GraphDriver:
+    def __init__(self, runner: RunProjectManager):
+        self.runner = runner
+
+    async def send(self, task: str, thread_id: Optional[str]) -> Dict:
+        if thread_id:
+            return await self.runner.existing_thread(thread_id, task)
+        return await self.runner.new_thread(task)
+
+
+class ApiDriver:
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def send(self, task: str, thread_id: Optional[str]) -> Dict:
+        response = await self.client.post(
+            "/project_manager/chat", json={"task": task, "thread_id": thread_id}
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+async def _scenario(driver, name: str, latencies: Dict[str, List[float]]):
+    message, answer = SCENARIOS[name]
+    start = time.perf_counter()
+    result = await driver.send(message, None)
+    first = time.perf_counter()
+    latencies.setdefault(f"{name}:first_message", []).append(first - start)
+    if answer is not None:
+        await driver.send(answer, result["thread_id"])
+        latencies.setdefault(f"{name}:resume", []).append(time.perf_counter() - first)
+    latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+
+async def _drive(driver, scenarios: List[str], concurrency: int) -> Dict:
+    latencies: Dict[str, List[float]] = {}
+    errors: List[str] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for name in scenarios:
+        queue.put_nowait(name)
+
+    async def worker():
+        while not queue.empty():
+            name = queue.get_nowait()
+            try:
+                await _scenario(driver, name, latencies)
+            except Exception as e:
+                logger.exception("Scenario %s failed", name)
+                errors.append(f"{name}: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        "wall_seconds": time.perf_counter() - start,
+        "latencies": latencies,
+        "errors": errors,
+    }
+
+
+def _workload(scenario: str, runs: int) -> List[str]:
+    if scenario == "mix":
+        return [MIX[i % len(MIX)] for i in range(runs)]
+    return [scenario] * runs
+
+
+async def benchmark(args) -> Dict:
+    settings = load_config(args.config)
+
+    timer = NodeTimer()
+    workdir = tempfile.mkdtemp(prefix="pm-bench-")
+    build_options = {
+        "settings": fake_settings(settings, workdir),
+        "llm": FakeChatModel(
+            time_to_first_token=args.time_to_first_token,
+            tokens_per_second=args.tokens_per_second,
+            plan_steps=args.plan_steps,
+            callbacks=[LLMTimingCallback()],
+        ),
+        "search_client": FakeSearchClient(latency=args.search_latency),
+        "callbacks": [timer],
+    }
+    memory = MemorySampler()
+    memory.start()
+
+    if args.mode == "graph":
+        project_manager = await ProjectManager.build(**build_options)
+        driver = GraphDriver(RunProjectManager(project_manager))
+        try:
+            result = await _measure(driver, args, timer)
+        finally:
+            await project_manager.close()
+    else:
+        from main import app as app_module
+
+        app_module.build_options = build_options
+        async with app_module.lifespan(app_module.app):
+            transport = httpx.ASGITransport(app=app_module.app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", timeout=None
+            ) as client:
+                result = await _measure(ApiDriver(client), args, timer)
+
+    result["memory"] = await memory.stop()
+    result["settings"] = {
+        key: getattr(args, key)
+        for key in (
+            "mode",
+            "scenario",
+            "runs",
+            "concurrency",
+            "time_to_first_token",
+            "tokens_per_second",
+            "search_latency",
+            "plan_steps",
+        )
+    }
+    result["workdir"] = workdir
+    return result
+
+
+async def _measure(driver, args, timer: NodeTimer) -> Dict:
+    if args.warmup:
+        await _drive(driver, _workload(args.scenario, args.warmup), args.concurrency)
+    timer.reset()
+    checkpoints_before = _checkpoint_totals()
+
+    run = await _drive(driver, _workload(args.scenario, args.runs), args.concurrency)
+
+    checkpoints_after = _checkpoint_totals()
+    checkpoints = {
+        k: checkpoints_after[k] - checkpoints_before[k] for k in checkpoints_after
+    }
+    busy_seconds = sum(sum(v) for k, v in run["latencies"].items() if ":" not in k)
+    scenarios = [k for k in run["latencies"] if ":" not in k]
+    completed = sum(len(run["latencies"][k]) for k in scenarios)
+    return {
+        "throughput_per_second": round(completed / run["wall_seconds"], 3),
+        "wall_seconds": round(run["wall_seconds"], 3),
+        "end_to_end": {k: percentiles(v) for k, v in sorted(run["latencies"].items())},
+        "nodes": {k: percentiles(v) for k, v in sorted(timer.durations.items())},
+        "checkpoints": {
+            "writes": int(checkpoints["writes"]),
+            "seconds": round(checkpoints["seconds"], 4),
+            "bytes": int(checkpoints["bytes"]),
+            "share_of_run_time": (
+                round(checkpoints["seconds"] / busy_seconds, 4) if busy_seconds else 0.0
+            ),
+        },
+        "errors": run["errors"],
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(
+        description="Offline latency / throughput benchmark of the project manager"
+    )
+    parser.add_argument("--config", default=None, help="defaults to config.yaml")
+    parser.add_argument("--mode", choices=("graph", "api"), default="graph")
+    parser.add_argument("--scenario", choices=(*SCENARIOS, "mix"), default="mix")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--time-to-first-token", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--plan-steps", type=int, default=8)
+    parser.add_argument("--output", default=None, help="also write the report here")
+    args = parser.parse_args()
+    text = json.dumps(asyncio.run(benchmark(args)), indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
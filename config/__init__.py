@@ -0,0 +1,21 @@
+import os
+from typing import Dict, Optional
+
+import yaml
+
+# config.yaml next to this file, so the app starts from any working directory,
+# PROJECT_MANAGER_CONFIG points to another file
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+
+_loaded: Dict[str, Dict] = {}
+
+
+def load_config(path: Optional[str] = None, reload: bool = False) -> Dict:
+    """Settings of `path` (default config.yaml), read once per process."""
+    path = os.path.abspath(
+        path or os.environ.get("PROJECT_MANAGER_CONFIG") or DEFAULT_PATH
+    )
+    if reload or path not in _loaded:
+        with open(path, "r") as f:
+            _loaded[path] = yaml.safe_load(f) or {}
+    return _loaded[path]
@@ -1,10 +1,21 @@
 import asyncio
+import json
 import logging
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
+from config import load_config
 from main.main_graph import ProjectManager, RunProjectManager
+from main.batch import BatchRunner
+from main.jobs import JobManager, JobQueueFull
+from main.sessions import SessionBusy, SessionManager
+from main.retention import CheckpointRetention
+from utils.llm_limiter import LLMQueueTimeout
+from utils.metrics import metrics
+from utils.telemetry import get_telemetry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,20 +26,104 @@ class TaskRequest(BaseModel):
     thread_id: Optional[str] = None
 
 
+class BatchRequest(BaseModel):
+    tasks: List[TaskRequest]
+
+
 class AgentResponse(BaseModel):
     response: Any
     thread_id: str
 
 
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    thread_id: Optional[str] = None
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    retry_after: Optional[float] = None
+
+
+# seconds clients are told to wait when the LLM queue or the thread is busy
+RETRY_AFTER = 5
+
+# keyword arguments for ProjectManager.build, the offline benchmarks set their
+# fake LLM and search client here before the app starts
+build_options: Dict[str, Any] = {}
+
+project_manager_instance = None
+sessions = None
+batch_runner = None
+job_manager = None
+retention = None
+warmup_task = None
+# /health answers 503 until the warm-up has loaded the models
+ready = False
+startup_report: Dict[str, Any] = {}
+
+
+async def _warm_up(settings: Dict[str, Any]):
+    global ready
+    start = time.perf_counter()
+    try:
+        startup_report["warmup"] = await project_manager_instance.warmup(**settings)
+    except Exception as e:
+        logger.warning("Warm-up failed, serving cold: %s", e)
+        startup_report["warmup"] = f"failed: {e}"
+    startup_report["warmup_seconds"] = round(time.perf_counter() - start, 3)
+    metrics.gauge("startup_seconds", "Time spent in each startup phase").set(
+        startup_report["warmup_seconds"], phase="warmup"
+    )
+    ready = True
+    logger.info("Warm-up done in %ss", startup_report["warmup_seconds"])
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan"""
 
-    global project_manager_instance
+    global project_manager_instance, sessions, batch_runner, job_manager, retention
+    global warmup_task, ready
 
     logger.info("Starting project manager...")
 
-    project_manager_instance = await ProjectManager.build()
+    ready = False
+    startup_report.clear()
+    options = {"settings": load_config(), **build_options}
+    settings = options["settings"]
+
+    start = time.perf_counter()
+    project_manager_instance = await ProjectManager.build(**options)
+    startup_report["build_seconds"] = round(time.perf_counter() - start, 3)
+    metrics.gauge("startup_seconds", "Time spent in each startup phase").set(
+        startup_report["build_seconds"], phase="build"
+    )
+    logger.info("Graphs compiled in %ss", startup_report["build_seconds"])
+
+    sessions = SessionManager(
+        RunProjectManager(project_manager_instance), **settings.get("sessions", {})
+    )
+    batch_runner = BatchRunner(
+        sessions, project_manager_instance.router, **settings.get("batch", {})
+    )
+    job_manager = JobManager(sessions, **settings.get("jobs", {}))
+    await job_manager.start()
+
+    retention_settings = dict(settings.get("retention", {}))
+    if retention_settings.pop("enabled", True):
+        retention = CheckpointRetention(
+            project_manager_instance.project_manager.checkpointer,
+            **retention_settings,
+        )
+        await retention.start()
+
+    warmup_settings = dict(settings.get("warmup", {}))
+    if warmup_settings.pop("enabled", True):
+        warmup_task = asyncio.create_task(_warm_up(warmup_settings))
+    else:
+        ready = True
 
     logger.info("Project manager started")
 
@@ -36,6 +131,14 @@ async def lifespan(app: FastAPI):
 
     logger.info("Shutting down project manager...")
 
+    if warmup_task is not None:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+        warmup_task = None
+    if retention is not None:
+        await retention.stop()
+    await job_manager.stop()
+
     await project_manager_instance.close()
 
     logger.info("Project manager shutdown complete")
@@ -56,20 +159,43 @@ async def run_agent(request: TaskRequest):
     Main entry to chat with the project manager
     """
 
-    if project_manager_instance is None:
+    if sessions is None:
         raise HTTPException(status_code=500, detail="Chatbot is not initialized")
 
-    runner = RunProjectManager(project_manager_instance)
-    input_text = request.task
-    thread_id = request.thread_id
+    try:
+        result = await sessions.run(request.task, request.thread_id)
+    except (LLMQueueTimeout, SessionBusy) as e:
+        raise _busy(e)
 
-    if thread_id:
-        runner.thread_id = thread_id
-        runner.config = {"configurable": {"thread_id": thread_id}}
-        result = await runner.existing_thread(input_text)
-    else:
-        result = await runner.new_thread(input_text)
+    return _format_result(result)
+
+
+def _busy_status(e: Exception) -> Optional[int]:
+    """HTTP status of errors a client should retry after RETRY_AFTER seconds."""
+    if isinstance(e, LLMQueueTimeout):
+        return 429
+    if isinstance(e, SessionBusy):
+        return 409
+    return None
+
+
+def _busy(e: Exception) -> HTTPException:
+    return HTTPException(
+        status_code=_busy_status(e),
+        detail=str(e),
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
 
+
+def _retry_hint(e: Exception) -> Dict[str, Any]:
+    """Fields added to a stream error event or batch line when busy."""
+    status = _busy_status(e)
+    if status is None:
+        return {}
+    return {"status_code": status, "retry_after": RETRY_AFTER}
+
+
+def _format_result(result: Dict[str, Any]) -> Dict[str, Any]:
     status = result["status"]
     if status == "paused":
         return {
@@ -85,24 +211,213 @@ async def run_agent(request: TaskRequest):
         raise HTTPException(status_code=500, detail="Unknown status returned by agent.")
 
 
+async def _disconnected(request: Request):
+    """Returns once the client has closed the connection."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+@app.post("/project_manager/stream")
+async def stream_agent(request: TaskRequest, http_request: Request):
+    """
+    Same as /project_manager/chat but streams node events and LLM tokens
+    as Server-Sent Events, closing the connection cancels the run.
+    """
+
+    if sessions is None:
+        raise HTTPException(status_code=500, detail="Chatbot is not initialized")
+
+    events = sessions.stream(request.task, request.thread_id)
+
+    async def event_stream():
+        thread_id = request.thread_id
+        # a run can be silent for minutes (searches, estimation), the
+        # disconnect is watched for on its own instead of between events
+        disconnected = asyncio.create_task(_disconnected(http_request))
+        try:
+            while True:
+                next_event = asyncio.ensure_future(anext(events))
+                await asyncio.wait(
+                    {next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not next_event.done():
+                    logger.info("Client disconnected, cancelling %s", thread_id)
+                    next_event.cancel()
+                    await asyncio.gather(next_event, return_exceptions=True)
+                    break
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    break
+                thread_id = event.get("thread_id", thread_id)
+                yield f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+        except Exception as e:
+            if _busy_status(e) is None:
+                logger.exception("Streaming run failed")
+            error = {"event": "error", "detail": str(e), **_retry_hint(e)}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+        finally:
+            disconnected.cancel()
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/project_manager/batch")
+async def run_batch(request: BatchRequest):
+    """
+    Runs many tasks concurrently under the shared batch budget and streams
+    one JSON line per task as it finishes.
+    """
+
+    if batch_runner is None:
+        raise HTTPException(status_code=500, detail="Chatbot is not initialized")
+    if len(request.tasks) > batch_runner.max_tasks:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {batch_runner.max_tasks} tasks per batch",
+        )
+
+    results = batch_runner.run([(t.task, t.thread_id) for t in request.tasks])
+
+    async def lines():
+        try:
+            async for index, result, error in results:
+                line = {"index": index}
+                if error is None:
+                    try:
+                        line.update(_format_result(result), status=result["status"])
+                    except HTTPException as e:
+                        line.update(status="failed", error=e.detail)
+                else:
+                    line.update(status="failed", error=str(error), **_retry_hint(error))
+                yield json.dumps(line, default=str) + "\n"
+        finally:
+            await results.aclose()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/project_manager/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: TaskRequest):
+    """
+    Queue a run in the background and return its job id right away
+    """
+
+    if job_manager is None:
+        raise HTTPException(status_code=500, detail="Chatbot is not initialized")
+
+    try:
+        job = job_manager.submit(request.task, request.thread_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+
+@app.get("/project_manager/jobs/stats")
+async def job_stats():
+    """Queue depth, wait time and run time of background jobs"""
+
+    if job_manager is None:
+        raise HTTPException(status_code=500, detail="Chatbot is not initialized")
+
+    return job_manager.stats()
+
+
+@app.get("/project_manager/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Poll the status of a background job"""
+
+    job = job_manager.get(job_id) if job_manager else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/project_manager/jobs/{job_id}/result", response_model=AgentResponse)
+async def get_job_result(job_id: str):
+    """Fetch the result of a finished job"""
+
+    job = job_manager.get(job_id) if job_manager else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == "failed" and job.retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=job.error,
+            headers={"Retry-After": str(int(job.retry_after))},
+        )
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.result is None:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return _format_result(job.result)
+
+
+@app.delete("/project_manager/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+
+    job = job_manager.cancel(job_id) if job_manager else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
 @app.get("/project_manager/state/{thread_id}")
 async def get_state(thread_id: str):
     """Get current state of the project manager"""
 
-    if project_manager_instance is None:
+    if sessions is None:
         raise HTTPException(status_code=500, detail="Chatbot is not initialized")
 
-    runner = RunProjectManager(project_manager_instance)
     try:
-        snapshot = await runner.get_current_state(thread_id)
+        snapshot = await sessions.get_state(thread_id)
         return snapshot
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/project_manager/state/{thread_id}/storage")
+async def get_storage(thread_id: str):
+    """Checkpoint bytes written for the thread by this process"""
+
+    if project_manager_instance is None:
+        raise HTTPException(status_code=500, detail="Chatbot is not initialized")
+    return project_manager_instance.storage_report(thread_id)
+
+
+@app.get("/project_manager/state/{thread_id}/usage")
+async def get_usage(thread_id: str):
+    """Node time, LLM tokens and cost and tool calls of the thread's runs"""
+
+    telemetry = get_telemetry()
+    if telemetry is None:
+        raise HTTPException(status_code=404, detail="Telemetry is disabled")
+    return telemetry.usage(thread_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """All metrics in the Prometheus text format"""
+
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.get("/health")
 async def health():
-    return {"status": "✅ ✅ ✅ !!"}
+    """Ready once the graphs are compiled and the models warmed up."""
+    if not ready:
+        return JSONResponse(
+            status_code=503, content={"status": "warming up", **startup_report}
+        )
+    return {"status": "✅ ✅ ✅ !!", **startup_report}
 
 
 if __name__ == "__main__":
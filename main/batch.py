@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from main.sessions import SessionManager
+from utils.metrics import metrics
+from utils.router import IntentRouter, RouteDecision, routed
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRunner:
+    """
+    Runs many tasks through the SessionManager at once. All batches share
+    one `max_concurrency` budget, so several large batches can't flood the
+    LLM and search backends, and results are yielded as they finish.
+    """
+
+    def __init__(
+        self,
+        sessions: SessionManager,
+        router: Optional[IntentRouter] = None,
+        max_concurrency: int = 4,
+        max_tasks: int = 100,
+    ):
+        self.sessions = sessions
+        self.router = router
+        self.max_tasks = max_tasks
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.running = metrics.gauge("batch_tasks_running", "Batch tasks running")
+        self.finished = metrics.counter("batch_tasks_total", "Finished batch tasks")
+
+    async def _route(self, tasks: List[str]) -> Dict[str, RouteDecision]:
+        # one embedding call for the whole batch instead of one per run
+        if self.router is None or not tasks:
+            return {}
+        tasks = list(dict.fromkeys(tasks))
+        try:
+            return dict(zip(tasks, await self.router.route_many(tasks)))
+        except Exception as e:
+            logger.warning("Batch routing failed, runs will route themselves: %s", e)
+            return {}
+
+    async def _run_one(
+        self, index: int, task: str, thread_id: Optional[str]
+    ) -> Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]:
+        async with self.semaphore:
+            self.running.inc()
+            try:
+                result = await self.sessions.run(task, thread_id)
+                self.finished.inc(status="completed")
+                return index, result, None
+            except Exception as e:
+                logger.exception("Batch task %s failed", index)
+                self.finished.inc(status="failed")
+                return index, None, e
+            finally:
+                self.running.dec()
+
+    async def run(self, items: List[Tuple[str, Optional[str]]]):
+        """
+        `items` are (task, thread_id) pairs, yields (index, result, exception)
+        in completion order. Closing the generator cancels what is left.
+        The caller enforces `max_tasks`.
+        """
+        decisions = await self._route(
+            [task for task, thread_id in items if not thread_id]
+        )
+
+        # the runs inherit the context, only they reuse the batch's decisions
+        with routed(decisions):
+            pending = [
+                asyncio.create_task(self._run_one(index, task, thread_id))
+                for index, (task, thread_id) in enumerate(items)
+            ]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield await next_done
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
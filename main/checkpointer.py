@@ -0,0 +1,213 @@
+import os
+import time
+import zlib
+import logging
+import contextvars
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+from dotenv import load_dotenv
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+checkpoint_write_seconds = metrics.histogram(
+    "checkpoint_write_seconds", "Latency of checkpoint writes"
+)
+checkpoint_bytes_written = metrics.counter(
+    "checkpoint_bytes_written_total", "Serialized checkpoint bytes written"
+)
+
+# sizes of the payloads serialized by the write in progress, (raw, stored)
+_write_sizes: contextvars.ContextVar[Optional[List[Tuple[int, int]]]] = (
+    contextvars.ContextVar("checkpoint_write_sizes", default=None)
+)
+
+
+class CompressedSerializer:
+    """
+    Wraps the checkpoint serializer, payloads larger than `min_bytes` are
+    zlib compressed and tagged "<type>+zlib" so old checkpoints still load.
+    """
+
+    SUFFIX = "+zlib"
+
+    def __init__(
+        self,
+        serde=None,
+        enabled: bool = True,
+        min_bytes: int = 1024,
+        level: int = 6,
+    ):
+        self.serde = serde or JsonPlusSerializer()
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.serde.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.serde.loads(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        raw = len(data)
+        if self.enabled and raw >= self.min_bytes:
+            type_, data = type_ + self.SUFFIX, zlib.compress(data, self.level)
+        sizes = _write_sizes.get()
+        if sizes is not None:
+            sizes.append((raw, len(data)))
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith(self.SUFFIX):
+            type_, payload = type_[: -len(self.SUFFIX)], zlib.decompress(payload)
+        return self.serde.loads_typed((type_, payload))
+
+
+class _TimedSaverMixin:
+    """
+    Records the latency of every checkpoint and pending-writes write, and
+    the bytes they serialize per thread.
+    """
+
+    backend = ""
+    max_tracked_threads = 10000
+
+    @property
+    def thread_bytes(self) -> "OrderedDict[str, Dict]":
+        if "_thread_bytes" not in self.__dict__:
+            self._thread_bytes = OrderedDict()
+        return self._thread_bytes
+
+    def _record(self, config, op: str, start: float, sizes):
+        checkpoint_write_seconds.observe(
+            time.perf_counter() - start, op=op, backend=self.backend
+        )
+        raw = sum(r for r, _ in sizes)
+        stored = sum(s for _, s in sizes)
+        checkpoint_bytes_written.inc(stored, op=op, backend=self.backend)
+
+        thread_id = str(config.get("configurable", {}).get("thread_id", ""))
+        stats = self.thread_bytes.pop(thread_id, None) or {
+            "writes": 0,
+            "raw_bytes": 0,
+            "stored_bytes": 0,
+        }
+        stats["writes"] += 1
+        stats["raw_bytes"] += raw
+        stats["stored_bytes"] += stored
+        self.thread_bytes[thread_id] = stats
+        while len(self.thread_bytes) > self.max_tracked_threads:
+            self.thread_bytes.popitem(last=False)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        start, sizes = time.perf_counter(), []
+        token = _write_sizes.set(sizes)
+        try:
+            return await super().aput(config, checkpoint, metadata, new_versions)
+        finally:
+            _write_sizes.reset(token)
+            self._record(config, "put", start, sizes)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        start, sizes = time.perf_counter(), []
+        token = _write_sizes.set(sizes)
+        try:
+            return await super().aput_writes(config, writes, task_id, task_path)
+        finally:
+            _write_sizes.reset(token)
+            self._record(config, "put_writes", start, sizes)
+
+    def storage_report(self, thread_id: str) -> Dict:
+        """Bytes this process serialized for the thread since it started."""
+        stats = self.thread_bytes.get(
+            thread_id, {"writes": 0, "raw_bytes": 0, "stored_bytes": 0}
+        )
+        return {"thread_id": thread_id, "backend": self.backend, **stats}
+
+
+class TimedAsyncSqliteSaver(_TimedSaverMixin, AsyncSqliteSaver):
+    backend = "sqlite"
+
+
+async def _open_sqlite(
+    path: str = "checkpoints/checkpoints.sqlite",
+    synchronous: str = "NORMAL",
+    busy_timeout: int = 5000,
+    wal_autocheckpoint: int = 1000,
+    serde=None,
+) -> Tuple[BaseCheckpointSaver, aiosqlite.Connection]:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = await aiosqlite.connect(path, check_same_thread=False)
+    # only takes effect on a new database (or after a full VACUUM), lets the
+    # retention pass hand free pages back with incremental_vacuum
+    await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets readers (aget_state) run while a checkpoint is being written,
+    # synchronous=NORMAL is durable in WAL mode and skips an fsync per commit
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute(f"PRAGMA synchronous={synchronous}")
+    await conn.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+    await conn.execute(f"PRAGMA wal_autocheckpoint={int(wal_autocheckpoint)}")
+    return TimedAsyncSqliteSaver(conn, serde=serde), conn
+
+
+async def _open_postgres(
+    dsn: Optional[str] = None,
+    min_size: int = 2,
+    max_size: int = 10,
+    timeout: float = 30.0,
+    max_idle: float = 300.0,
+    serde=None,
+):
+    # only needed for the postgres backend
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+    class TimedAsyncPostgresSaver(_TimedSaverMixin, AsyncPostgresSaver):
+        backend = "postgres"
+
+    if dsn is None:
+        load_dotenv()
+        dsn = os.getenv("POSTGRES_DSN")
+    if not dsn:
+        raise ValueError("checkpointer.postgres.dsn or POSTGRES_DSN must be set")
+
+    pool = AsyncConnectionPool(
+        conninfo=dsn,
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        max_idle=max_idle,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        open=False,
+    )
+    await pool.open()
+    saver = TimedAsyncPostgresSaver(pool, serde=serde)
+    await saver.setup()
+    return saver, pool
+
+
+async def open_checkpointer(settings: Optional[Dict] = None):
+    """
+    Returns (checkpointer, connection) for the configured backend, the
+    connection (aiosqlite connection or psycopg pool) is closed on shutdown.
+    """
+    settings = dict(settings or {})
+    backend = settings.get("backend", "sqlite")
+    serde = CompressedSerializer(**settings.get("compression", {}))
+    if backend == "sqlite":
+        return await _open_sqlite(serde=serde, **settings.get("sqlite", {}))
+    if backend == "postgres":
+        return await _open_postgres(serde=serde, **settings.get("postgres", {}))
+    raise ValueError(f"Unknown checkpointer backend: {backend}")
@@ -0,0 +1,186 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from main.sessions import SessionBusy, SessionManager
+from utils.llm_limiter import LLMQueueTimeout
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+FINISHED = {"paused", "completed", "failed", "cancelled"}
+# failures caused by load, the same job is likely to pass when resubmitted
+RETRYABLE = (LLMQueueTimeout, SessionBusy)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, task: str, thread_id: Optional[str] = None):
+        self.job_id = str(uuid.uuid4())
+        self.task = task
+        self.thread_id = thread_id
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.retry_after: Optional[float] = None
+        self.handle: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "thread_id": self.thread_id,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "retry_after": self.retry_after,
+        }
+
+
+class JobManager:
+    """
+    Runs graph invocations in the background on a bounded in-process queue,
+    so long planner runs don't hold an HTTP request open.
+    """
+
+    def __init__(
+        self,
+        sessions: SessionManager,
+        workers: int = 2,
+        max_queue: int = 100,
+        max_finished: int = 1000,
+        retry_after: float = 5.0,
+    ):
+        self.sessions = sessions
+        self.retry_after = retry_after
+        self.workers = workers
+        self.queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=max_queue)
+        self.max_finished = max_finished
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.worker_tasks = []
+
+        self.queue_depth = metrics.gauge("jobs_queue_depth", "Jobs waiting for a worker")
+        self.running = metrics.gauge("jobs_running", "Jobs currently running")
+        self.wait_time = metrics.histogram(
+            "job_wait_seconds", "Time between submission and start of a job"
+        )
+        self.run_time = metrics.histogram(
+            "job_run_seconds",
+            "Time a job spent running",
+            buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200),
+        )
+        self.finished = metrics.counter("jobs_total", "Finished jobs by status")
+
+    async def start(self):
+        for i in range(self.workers):
+            self.worker_tasks.append(asyncio.create_task(self._worker(i)))
+        logger.info("Started %s job workers", self.workers)
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job.handle is not None and not job.handle.done():
+                job.handle.cancel()
+        for worker in self.worker_tasks:
+            worker.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+    def submit(self, task: str, thread_id: Optional[str] = None) -> Job:
+        job = Job(task, thread_id)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self.queue.maxsize} jobs)")
+        self.jobs[job.job_id] = job
+        self.queue_depth.set(self.queue.qsize())
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.handle is not None:
+            job.handle.cancel()
+        else:
+            self._finish(job, "cancelled")
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "jobs": statuses,
+            "wait_seconds": self.wait_time.snapshot()["values"],
+            "run_seconds": self.run_time.snapshot()["values"],
+        }
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self.finished.inc(status=status)
+        if job.started_at is not None:
+            self.run_time.observe(job.finished_at - job.started_at)
+
+    def _evict_finished(self):
+        finished = [j for j in self.jobs.values() if j.status in FINISHED]
+        for job in finished[: max(0, len(finished) - self.max_finished)]:
+            self.jobs.pop(job.job_id, None)
+
+    async def _run(self, job: Job) -> Dict[str, Any]:
+        return await self.sessions.run(job.task, job.thread_id)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            self.queue_depth.set(self.queue.qsize())
+            try:
+                if job.status == "cancelled":
+                    continue
+
+                job.status = "running"
+                job.started_at = time.time()
+                self.wait_time.observe(job.started_at - job.submitted_at)
+                self.running.inc()
+                job.handle = asyncio.create_task(self._run(job))
+                try:
+                    job.result = await job.handle
+                    job.thread_id = job.result.get("thread_id", job.thread_id)
+                    status = "paused" if job.result["status"] == "paused" else "completed"
+                    self._finish(job, status)
+                except asyncio.CancelledError:
+                    if not job.handle.cancelled():
+                        raise
+                    self._finish(job, "cancelled")
+                    # the worker itself is being stopped, not just the job
+                    if asyncio.current_task().cancelling():
+                        raise
+                except RETRYABLE as e:
+                    logger.warning("Job %s rejected under load: %s", job.job_id, e)
+                    job.retry_after = self.retry_after
+                    self._finish(job, "failed", str(e))
+                except Exception as e:
+                    logger.exception("Job %s failed", job.job_id)
+                    self._finish(job, "failed", str(e))
+                finally:
+                    self.running.dec()
+            finally:
+                self.queue.task_done()
@@ -1,18 +1,26 @@
 import asyncio
 import logging
+import time
 import uuid
+from typing import Optional
 
-from langchain_ollama import ChatOllama
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from langgraph.types import Command, interrupt
-import yaml
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-import aiosqlite
 
 
 from agents.states import _initialize_state
-from tools.search_tools import search_web
+from config import load_config
+from main.checkpointer import open_checkpointer
+from tools.knowledge_index import configure_knowledge_index, close_knowledge_index
+from tools.search_tools import (
+    AsyncSearchClient,
+    search_web,
+    configure_search_client,
+    configure_search_cache,
+    close_search_client,
+)
 from agents import states
 from agents.planner_agent import PlannerAgent
 from agents.estimator_agent import EstimatorAgent
@@ -20,15 +28,21 @@ from agents.schedule_agent import ScheduleAgent
 from agents.report_agent import ReportAgent
 from agents.market_study_agent import MarketStudyAgent
 from utils import prompts
+from utils.prompt_builder import build_messages
+from utils.llm_timing import LLMTimingCallback
+from utils.telemetry import configure_telemetry
+from utils.llm_cache import CachedLLM, LLMResponseCache
+from utils.router import IntentRouter
+from utils.llm_limiter import ConcurrencyLimitedLLM, PriorityLimiter, llm_priority
+from utils.llm_pool import LLMPool
+from utils.metrics import metrics
+from utils.blob_store import configure_blob_store, offload, resolve
+from utils.history import HistoryManager
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-with open("config/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-
-
 # ===================== Project Manager =====================
 
 
@@ -50,6 +64,10 @@ class ProjectManager(StateGraph):
         # chatbot,
         conn,
         compiled_graph,
+        llm_pool=None,
+        history_manager=None,
+        router=None,
+        callbacks=None,
     ):
         self.llm = llm
         self.planner_agent = planner_agent
@@ -60,24 +78,80 @@ class ProjectManager(StateGraph):
         # self.chatbot = chatbot
         self.conn = conn
         self.project_manager = compiled_graph
+        self.llm_pool = llm_pool
+        self.history_manager = history_manager
+        self.router = router
+        self.callbacks = callbacks
 
     @classmethod
-    async def build(cls):
-        llm = ChatOllama(model=config["model"])
+    async def build(
+        cls,
+        settings: Optional[dict] = None,
+        llm=None,
+        search_client: Optional[AsyncSearchClient] = None,
+        callbacks: Optional[list] = None,
+    ):
+        """
+        `settings` default to config/config.yaml. A chat model passed as
+        `llm` replaces the Ollama pool and `search_client` the Tavily
+        client (the offline benchmarks inject fakes this way), `callbacks`
+        are attached to every run of the graph.
+        """
+        settings = load_config() if settings is None else settings
+        llm_pool = None
+        if llm is None:
+            pool_settings = dict(settings.get("llm_pool", {}))
+            endpoints = pool_settings.pop("endpoints", None) or [{"name": "default"}]
+            for endpoint in endpoints:
+                endpoint.setdefault("model", settings["model"])
+            llm_pool = LLMPool(
+                endpoints, callbacks=[LLMTimingCallback()], **pool_settings
+            )
+            await llm_pool.start()
+            llm = llm_pool
+
+        limiter_settings = dict(settings.get("llm_limiter", {}))
+        if limiter_settings.pop("enabled", True):
+            llm = ConcurrencyLimitedLLM(llm, PriorityLimiter(**limiter_settings))
+        llm_cache_settings = dict(settings.get("llm_cache", {}))
+        if llm_cache_settings.pop("enabled", True):
+            llm = CachedLLM(llm, LLMResponseCache(**llm_cache_settings))
+        configure_search_client(settings.get("search", {}), client=search_client)
+        configure_search_cache(settings.get("search_cache", {}))
+        configure_blob_store(settings.get("blob_store", {}))
+        knowledge_index = configure_knowledge_index(settings.get("knowledge_index", {}))
+        telemetry = configure_telemetry(settings.get("telemetry", {}))
+        callbacks = ([telemetry] if telemetry is not None else []) + list(
+            callbacks or []
+        )
+        if knowledge_index is not None:
+            await knowledge_index.start()
+
+        router_settings = dict(settings.get("router", {}))
+        router = (
+            IntentRouter(llm, **router_settings)
+            if router_settings.pop("enabled", True)
+            else None
+        )
 
         async def main_agent_node(state: states.MainState):
-            messages = [
-                SystemMessage(content=prompts.MANAGER_PROMPT),
-                HumanMessage(content=state.get("task", "")),
-            ]
-            response = await llm.with_structured_output(states.MainRouter).ainvoke(
-                messages
-            )
+            with llm_priority("interactive"):
+                if router is not None:
+                    decision = await router.route(state.get("task", ""))
+                    next_node = decision.next_node
+                else:
+                    messages = build_messages(
+                        prompts.MANAGER_PROMPT, task=state.get("task", "")
+                    )
+                    response = await llm.with_structured_output(
+                        states.MainRouter
+                    ).ainvoke(messages)
+                    next_node = response.next_node
 
             return {
                 "task": state.get("task", ""),
                 "node_name": "main_agent",
-                "next_node": response.next_node,
+                "next_node": next_node,
             }
 
         async def planner_agent_node(state: states.MainState):
@@ -94,116 +168,183 @@ class ProjectManager(StateGraph):
                 "retrieved_content": output.get("retrieved_content", []),
             }
 
+        # schedule and estimator run in parallel and join on report_agent,
+        # with partial_report a branch is cut off after the latency budget
+        join_settings = settings.get("join", {})
+        branch_budget = (
+            join_settings.get("branch_latency_budget")
+            if join_settings.get("partial_report", False)
+            else None
+        )
+        branch_seconds = metrics.histogram(
+            "branch_seconds",
+            "Run time of the parallel planner branches",
+            buckets=(1, 5, 10, 30, 60, 120, 300, 600),
+        )
+
+        async def run_branch(name, agent, branch_state):
+            start = time.perf_counter()
+            try:
+                output = await asyncio.wait_for(
+                    agent.ainvoke(branch_state), branch_budget
+                )
+                status = "completed"
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "%s exceeded the %ss latency budget, reporting without it",
+                    name,
+                    branch_budget,
+                )
+                output, status = None, "timed_out"
+            elapsed = time.perf_counter() - start
+            branch_seconds.observe(elapsed, branch=name, status=status)
+            return output, {name: {"seconds": round(elapsed, 3), "status": status}}
+
         async def estimator_agent_node(state: states.MainState):
             estimator_state = state["estimator_state"]
             estimator_state["task"] = state["task"]
             estimator_state["steps"] = state["plan"]
-            output = await estimator_agent.ainvoke(estimator_state)
+            output, timing = await run_branch(
+                "estimator_agent", estimator_agent, estimator_state
+            )
+            if output is None:
+                return {
+                    "estimates": "Estimates unavailable: the estimator exceeded its latency budget.",
+                    "branches": timing,
+                }
 
             return {
                 "estimator_state": output,
-                "estimates": output.get("estimates", []),
+                "estimates": output.get("estimates", ""),
+                "branches": timing,
             }
 
         async def schedule_agent_node(state: states.MainState):
             schedule_state = state["schedule_state"]
             schedule_state["task"] = state["task"]
             schedule_state["steps"] = state["plan"]
-            output = await schedule_agent.ainvoke(schedule_state)
+            output, timing = await run_branch(
+                "schedule_agent", schedule_agent, schedule_state
+            )
+            if output is None:
+                return {
+                    "schedule": "Schedule unavailable: the scheduler exceeded its latency budget.",
+                    "branches": timing,
+                }
 
             return {
                 "schedule_state": output,
                 "schedule": output.get("schedule", ""),
+                "branches": timing,
             }
 
-        def report_agent_node(state: states.MainState):
-            report_state = state["report_state"]
-            report_state["task"] = state["task"]
-            report_state["report"] = (
-                f"{state.get("schedule", "")}\n\n Price estimations\n\n {state.get('estimates', [])}"
-            )
+        history_manager = HistoryManager(llm, **settings.get("history", {}))
 
-            # Update history
-            new_history = state.get("history", [])
-            new_history.append({"role": "user", "content": state["task"]})
-            new_history.append(
-                {"role": "assistant", "content": report_state.get("report", "")}
+        async def update_history(state: states.MainState, run_config, *messages):
+            thread_id = run_config["configurable"]["thread_id"]
+            history, summary = history_manager.fold(
+                thread_id, state.get("history", []), state.get("history_summary", "")
             )
+            history, summary = await history_manager.append(
+                thread_id, history, summary, *messages
+            )
+            return {"history": history, "history_summary": summary}
+
+        async def report_agent_node(state: states.MainState, config: RunnableConfig):
+            report_state = state["report_state"]
+            report_state["task"] = state["task"]
+            report = f"{state.get('schedule', '')}\n\n Price estimations\n\n {state.get('estimates', '')}"
+            report_state["report"] = (await offload([report]))[0]
+            logger.info("Joined branches: %s", state.get("branches", {}))
 
             return {
                 "node_name": "report_agent",
                 "report_state": report_state,
-                "end": report_state.get("report", ""),
-                "history": new_history,
+                "end": report_state["report"],
+                **await update_history(
+                    state,
+                    config,
+                    {"role": "user", "content": state["task"]},
+                    {"role": "assistant", "content": report},
+                ),
             }
 
-        async def market_study_agent_node(state: states.MainState):
+        async def market_study_agent_node(
+            state: states.MainState, config: RunnableConfig
+        ):
             market_study_state = state["market_study_state"]
             market_study_state["task"] = state["task"]
             output = await market_study_agent.ainvoke(market_study_state)
-
-            # update history
-            new_history = state.get("history", [])
-            new_history.append({"role": "user", "content": state["task"]})
-            new_history.append(
-                {"role": "assistant", "content": output.get("market_study", "")}
-            )
+            market_study = "".join(await resolve([output.get("market_study", "")]))
 
             return {
                 "node_name": "market_study_agent",
                 "market_study_state": output,
-                "market_study": output.get("market_study", ""),
                 "end": output.get("market_study", ""),
                 "retrieved_content": output.get("retrieved_content", []),
-                "history": new_history,
+                **await update_history(
+                    state,
+                    config,
+                    {"role": "user", "content": state["task"]},
+                    {"role": "assistant", "content": market_study},
+                ),
             }
 
-        async def chat_node(state: states.MainState):
-            # Get last 5 messages
-            history = state.get("history", [])[-5:]
+        async def chat_node(state: states.MainState, config: RunnableConfig):
+            thread_id = config["configurable"]["thread_id"]
+            history, summary = history_manager.fold(
+                thread_id, state.get("history", []), state.get("history_summary", "")
+            )
+            summary, recent = history_manager.context(history, summary)
 
-            messages = [
-                SystemMessage(content=prompts.CHAT_PROMPT),
-                *[
+            messages = build_messages(
+                prompts.CHAT_PROMPT,
+                summary=summary,
+                history=[
                     (
                         HumanMessage(content=m["content"])
                         if m["role"] == "user"
                         else AIMessage(content=m["content"])
                     )
-                    for m in history
+                    for m in recent
                 ],
-                HumanMessage(content=f'{state.get("task", "")}'),
-            ]
-            response = await llm.ainvoke(messages)
-
-            # Update history
-            new_history = state.get("history", [])
-            new_history.append({"role": "user", "content": state["task"]})
-            new_history.append({"role": "assistant", "content": response.content})
-
+                sections={"Message": state.get("task", "")},
+            )
+            with llm_priority("interactive"):
+                response = await llm.ainvoke(messages)
+
+            history, summary = await history_manager.append(
+                thread_id,
+                history,
+                summary or "",
+                {"role": "user", "content": state["task"]},
+                {"role": "assistant", "content": response.content},
+            )
             return {
                 "node_name": "chat",
                 "end": response.content,
                 "task": state.get("task", ""),
-                "history": new_history,
+                "history": history,
+                "history_summary": summary,
             }
 
-        async def decision(state: states.MainState):
-            messages = [
-                SystemMessage(content=prompts.DECISION_PROMPT),
-                HumanMessage(content=state.get("task", "")),
-            ]
-            response = await llm.with_structured_output(states.MainRouter).ainvoke(
-                messages
-            )
-
-            return {"next_node": response.next_node}
-
-        planner_agent = PlannerAgent(llm).planner_agent
-        estimator_agent = EstimatorAgent(llm).estimator_agent
-        schedule_agent = ScheduleAgent(llm).schedule_agent
+        planner_agent = PlannerAgent(
+            llm,
+            context_packing=settings.get("context_packing", {}),
+            **settings.get("planner", {}),
+        ).planner_agent
+        estimator_agent = EstimatorAgent(
+            llm,
+            context_packing=settings.get("context_packing", {}),
+            **settings.get("estimator", {}),
+        ).estimator_agent
+        schedule_agent = ScheduleAgent(
+            llm, **settings.get("scheduler", {})
+        ).schedule_agent
         report_agent = ReportAgent(llm).report_agent
-        market_study_agent = MarketStudyAgent(llm).market_study_agent
+        market_study_agent = MarketStudyAgent(
+            llm, context_packing=settings.get("context_packing", {})
+        ).market_study_agent
 
         build_project_manager = StateGraph(states.MainState)
 
@@ -229,14 +370,13 @@ class ProjectManager(StateGraph):
         build_project_manager.set_entry_point("main_agent")
         build_project_manager.add_edge("planner_agent", "estimator_agent")
         build_project_manager.add_edge("planner_agent", "schedule_agent")
-        build_project_manager.add_edge("estimator_agent", "report_agent")
+        build_project_manager.add_edge(
+            ["estimator_agent", "schedule_agent"], "report_agent"
+        )
         build_project_manager.add_edge("market_study_agent", END)
         build_project_manager.add_edge("report_agent", END)
 
-        conn = await aiosqlite.connect(
-            "checkpoints/checkpoints.sqlite", check_same_thread=False
-        )
-        memory = AsyncSqliteSaver(conn)
+        memory, conn = await open_checkpointer(settings.get("checkpointer", {}))
         compile_kwargs = {"checkpointer": memory}
 
         compiled_graph = build_project_manager.compile(**compile_kwargs)
@@ -251,62 +391,192 @@ class ProjectManager(StateGraph):
             # chatbot,
             conn,
             compiled_graph,
+            llm_pool,
+            history_manager,
+            router,
+            callbacks,
         )
 
+    async def warmup(
+        self, prompt: str = "Reply with OK.", timeout: float = 300.0
+    ) -> dict:
+        """
+        Loads what the first request would otherwise wait for: the router's
+        embedding model and centroids, and the LLM on every endpoint.
+        """
+        report = {}
+        if self.router is not None:
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.router.warmup)
+                report["router"] = round(time.perf_counter() - start, 3)
+            except Exception as e:
+                logger.warning("Router warm-up failed: %s", e)
+                report["router"] = f"failed: {e}"
+        if self.llm_pool is not None:
+            try:
+                report["llm"] = await asyncio.wait_for(
+                    self.llm_pool.warmup(prompt), timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("LLM warm-up timed out after %ss", timeout)
+                report["llm"] = f"timed out after {timeout}s"
+        return report
+
+    def storage_report(self, thread_id: str):
+        return self.project_manager.checkpointer.storage_report(thread_id)
+
     async def close(self):
+        await close_knowledge_index()
+        await close_search_client()
+        if self.history_manager is not None:
+            await self.history_manager.close()
+        if self.llm_pool is not None:
+            await self.llm_pool.close()
         if hasattr(self, "conn"):
             await self.conn.close()
 
 
+# nodes reported as node_start / node_end events when streaming
+STREAM_NODES = {
+    "main_agent",
+    "planner_agent",
+    "schedule_agent",
+    "estimator_agent",
+    "report_agent",
+    "market_study_agent",
+    "chat",
+    "interrupt",
+    "search",
+    "pack",
+    "planner",
+    "engine",
+    "scheduler",
+    "split",
+    "estimator",
+    "merge",
+    "market_studier",
+}
+# nodes whose LLM tokens are forwarded when streaming, the estimator is left
+# out since it generates structured JSON per chunk
+TOKEN_NODES = {"interrupt", "planner", "scheduler", "market_studier", "chat"}
+
+
 class RunProjectManager:
+    """
+    Stateless runner, every call takes the thread it runs on so one instance
+    can serve concurrent requests. Serializing runs of the same thread is
+    left to the SessionManager (main/sessions.py).
+    """
+
     def __init__(self, agent: ProjectManager):
         self.agent = agent.project_manager
-        self.threads = []
-        self.thread_id = None
-        self.config = {}
+        self.callbacks = agent.callbacks
+
+    def thread_config(self, thread_id: str) -> dict:
+        config = {"configurable": {"thread_id": thread_id}}
+        if self.callbacks:
+            config["callbacks"] = self.callbacks
+        return config
 
-    async def new_thread(self, Input: str):
-        self.thread_id = str(uuid.uuid4())
-        self.config = {"configurable": {"thread_id": self.thread_id}}
+    async def new_thread(self, Input: str, thread_id: Optional[str] = None):
+        thread_id = thread_id or str(uuid.uuid4())
         state = _initialize_state(Input)
-        result = await self.agent.ainvoke(state, self.config)
-        if result.get("pause"):
+        result = await self.agent.ainvoke(state, self.thread_config(thread_id))
+        return await self._result(thread_id, result)
+
+    async def existing_thread(self, thread_id: str, Input: str):
+        if not thread_id:
+            raise ValueError("No existing thread_id to resume")
+        config = self.thread_config(thread_id)
+        snapshot = await self.agent.aget_state(config)
+        original_task = snapshot.values.get("task", "")
+        command = Command(resume={"task": f"{original_task}\n\n{Input}"})
+        result = await self.agent.ainvoke(command, config=config)
+        return await self._result(thread_id, result)
+
+    @staticmethod
+    def _interrupt_query(interrupts) -> str:
+        value = interrupts[0].value
+        if isinstance(value, dict):
+            return value.get("query", "Human input required")
+        return str(value)
+
+    @staticmethod
+    async def _output(end: str) -> str:
+        # reports and market studies are kept in the blob store, a missing
+        # one is an error rather than an empty answer
+        return "".join(await resolve([end], strict=True))
+
+    async def _result(self, thread_id: str, result: dict) -> dict:
+        # a run stopped at the HITL interrupt returns its interrupts under
+        # "__interrupt__" instead of reaching the end of the graph
+        interrupts = result.get("__interrupt__")
+        if interrupts:
             return {
                 "status": "paused",
-                "thread_id": self.thread_id,
-                "query": result.payload.get("query", "Human input required"),
+                "thread_id": thread_id,
+                "query": self._interrupt_query(interrupts),
             }
 
-        return {"status": "running", "thread_id": self.thread_id, "output": result}
+        output = {**result, "end": await self._output(result.get("end", ""))}
+        return {"status": "completed", "thread_id": thread_id, "output": output}
 
-    async def existing_thread(self, Input: str):
-        if not self.thread_id:
+    async def stream_new_thread(self, Input: str, thread_id: Optional[str] = None):
+        thread_id = thread_id or str(uuid.uuid4())
+        state = _initialize_state(Input)
+        async for event in self._stream(state, thread_id):
+            yield event
+
+    async def stream_existing_thread(self, thread_id: str, Input: str):
+        if not thread_id:
             raise ValueError("No existing thread_id to resume")
-        snapshot = await self.agent.aget_state(self.config)
-        state = dict(snapshot.values)
-        original_task = state.get("task", "")
-        updated = f"{original_task}\n\n{Input}"
-        state["task"] = updated
-        state["plan_state"]["task"] = updated
-
-        command = Command(resume={"task": state["task"]})
-        result = await self.agent.ainvoke(command, config=self.config)
-        if isinstance(result, Command):
-            return {
-                "status": "paused",
-                "thread_id": self.thread_id,
-                "query": result.payload.get("query", "Human input requested"),
+        snapshot = await self.agent.aget_state(self.thread_config(thread_id))
+        original_task = snapshot.values.get("task", "")
+        command = Command(resume={"task": f"{original_task}\n\n{Input}"})
+        async for event in self._stream(command, thread_id):
+            yield event
+
+    async def _stream(self, graph_input, thread_id: str):
+        """
+        Runs the graph with astream_events and yields node start/end events
+        and LLM tokens, then a final paused or completed event.
+        """
+        config = self.thread_config(thread_id)
+        yield {"event": "thread", "thread_id": thread_id}
+
+        async for event in self.agent.astream_events(graph_input, config, version="v2"):
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+
+            if kind in ("on_chain_start", "on_chain_end"):
+                if event["name"] in STREAM_NODES and event["name"] == node:
+                    yield {
+                        "event": "node_start" if kind == "on_chain_start" else "node_end",
+                        "node": node,
+                    }
+            elif kind == "on_chat_model_stream" and node in TOKEN_NODES:
+                content = event["data"]["chunk"].content
+                if content:
+                    yield {"event": "token", "node": node, "content": content}
+
+        snapshot = await self.agent.aget_state(config)
+        interrupts = [i for task in snapshot.tasks for i in task.interrupts]
+        if interrupts:
+            yield {
+                "event": "paused",
+                "thread_id": thread_id,
+                "query": self._interrupt_query(interrupts),
+            }
+        else:
+            yield {
+                "event": "completed",
+                "thread_id": thread_id,
+                "output": await self._output(snapshot.values.get("end", "")),
             }
-
-        return {
-            "status": "completed",
-            "thread_id": self.thread_id,
-            "output": result,
-        }
 
     async def get_current_state(self, thread_id: str):
-        config = {"configurable": {"thread_id": thread_id}}
-        return await self.agent.aget_state(config)
+        return await self.agent.aget_state(self.thread_config(thread_id))
 
 
 # test on new thread
@@ -326,7 +596,7 @@ if __name__ == "__main__":
 
         # Simulate Human-in-the-loop
         human_answer = "Full finishing works, open budget, and the flat is completely empty, i want modern style, and want to enjoy life."
-        response = await runner.existing_thread(human_answer)
+        response = await runner.existing_thread(response["thread_id"], human_answer)
         print("Agent continued execution:")
         print(response)
 
@@ -0,0 +1,345 @@
+import time
+import uuid
+import zlib
+import json
+import asyncio
+import logging
+import argparse
+from typing import Dict, Iterable, List, Optional, Set
+
+from config import load_config
+from main.checkpointer import CompressedSerializer, open_checkpointer
+from utils.blob_store import REF_PATTERN, configure_blob_store, get_blob_store
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===================== Checkpoint Retention =====================
+# keep the latest N checkpoints of every thread / namespace, drop threads
+# idle for longer than the TTL, drop blobs no checkpoint refers to anymore,
+# then vacuum. Runs as a lifespan task of the app or once from the CLI:
+#   python -m main.retention --keep-last 10 --thread-ttl-days 14
+# The background pass only runs an incremental vacuum of a few pages; a full
+# VACUUM rewrites the database and blocks checkpoint writes until it is done,
+# so it is left to the CLI (--full-vacuum) at a quiet time.
+
+# 100ns intervals between the UUID epoch (1582-10-15) and the unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def checkpoint_timestamp(checkpoint_id: str) -> float:
+    """Unix time of a checkpoint id, langgraph checkpoint ids are uuid6."""
+    high = uuid.UUID(checkpoint_id).int >> 64
+    ticks = ((high >> 16) << 12) | (high & 0x0FFF)
+    return (ticks - _UUID_EPOCH_OFFSET) / 1e7
+
+
+def _references(rows: Iterable) -> Set[str]:
+    refs = set()
+    for type_, payload in rows:
+        if payload is None:
+            continue
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        if type_ and type_.endswith(CompressedSerializer.SUFFIX):
+            payload = zlib.decompress(payload)
+        refs.update(m.decode() for m in REF_PATTERN.findall(bytes(payload)))
+    return refs
+
+
+class _SqliteStore:
+    def __init__(self, saver):
+        self.saver = saver
+        self.conn = saver.conn
+
+    async def _fetchall(self, query: str, params=()):
+        async with self.conn.execute(query, params) as cursor:
+            return await cursor.fetchall()
+
+    async def prune(self, keep_last: int) -> int:
+        async with self.saver.lock:
+            cursor = await self.conn.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns
+                            ORDER BY checkpoint_id DESC
+                        ) AS position
+                        FROM checkpoints
+                    ) WHERE position > ?
+                )
+                """,
+                (keep_last,),
+            )
+            pruned = cursor.rowcount
+            await self.conn.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns
+                    AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+            await self.conn.commit()
+        return pruned
+
+    async def last_checkpoints(self) -> Dict[str, str]:
+        rows = await self._fetchall(
+            "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+        )
+        return {thread_id: checkpoint_id for thread_id, checkpoint_id in rows}
+
+    async def delete_threads(self, thread_ids: List[str]):
+        async with self.saver.lock:
+            for thread_id in thread_ids:
+                await self.conn.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,)
+                )
+                await self.conn.execute(
+                    "DELETE FROM writes WHERE thread_id = ?", (thread_id,)
+                )
+            await self.conn.commit()
+
+    async def referenced_blobs(self) -> Set[str]:
+        rows = await self._fetchall("SELECT type, checkpoint FROM checkpoints")
+        rows += await self._fetchall("SELECT type, value FROM writes")
+        return _references(rows)
+
+    async def vacuum(self, full: bool = False, pages: int = 1000):
+        async with self.saver.lock:
+            await self.conn.commit()
+            if full:
+                # also turns on auto_vacuum=INCREMENTAL for databases created
+                # before the checkpointer set it
+                await self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                await self.conn.execute("VACUUM")
+            else:
+                # a no-op unless the database has auto_vacuum=INCREMENTAL; it
+                # frees one page per step and execute() only runs the first
+                await self.conn.executescript(
+                    f"PRAGMA incremental_vacuum({int(pages)});"
+                )
+            await self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class _PostgresStore:
+    def __init__(self, saver):
+        self.pool = saver.conn
+
+    async def _execute(self, query: str, params=None) -> int:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(query, params)
+            return cursor.rowcount
+
+    async def _fetchall(self, query: str, params=None):
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(query, params)
+            return await cursor.fetchall()
+
+    async def prune(self, keep_last: int) -> int:
+        pruned = await self._execute(
+            """
+            DELETE FROM checkpoints c USING (
+                SELECT thread_id, checkpoint_ns, checkpoint_id, ROW_NUMBER() OVER (
+                    PARTITION BY thread_id, checkpoint_ns
+                    ORDER BY checkpoint_id DESC
+                ) AS position
+                FROM checkpoints
+            ) r
+            WHERE c.thread_id = r.thread_id
+            AND c.checkpoint_ns = r.checkpoint_ns
+            AND c.checkpoint_id = r.checkpoint_id
+            AND r.position > %s
+            """,
+            (keep_last,),
+        )
+        await self._execute(
+            """
+            DELETE FROM checkpoint_writes w WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints c
+                WHERE c.thread_id = w.thread_id
+                AND c.checkpoint_ns = w.checkpoint_ns
+                AND c.checkpoint_id = w.checkpoint_id
+            )
+            """
+        )
+        # channel values are stored once per version, drop versions no
+        # remaining checkpoint points to
+        await self._execute(
+            """
+            DELETE FROM checkpoint_blobs b WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints c
+                WHERE c.thread_id = b.thread_id
+                AND c.checkpoint_ns = b.checkpoint_ns
+                AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+            )
+            """
+        )
+        return pruned
+
+    async def last_checkpoints(self) -> Dict[str, str]:
+        rows = await self._fetchall(
+            "SELECT thread_id, MAX(checkpoint_id) AS checkpoint_id "
+            "FROM checkpoints GROUP BY thread_id"
+        )
+        return {row["thread_id"]: row["checkpoint_id"] for row in rows}
+
+    async def delete_threads(self, thread_ids: List[str]):
+        for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+            await self._execute(
+                f"DELETE FROM {table} WHERE thread_id = ANY(%s)", (thread_ids,)
+            )
+
+    async def referenced_blobs(self) -> Set[str]:
+        rows = await self._fetchall(
+            "SELECT NULL AS type, checkpoint::text AS payload FROM checkpoints "
+            "UNION ALL SELECT type, blob FROM checkpoint_blobs "
+            "UNION ALL SELECT type, blob FROM checkpoint_writes"
+        )
+        return _references((row["type"], row["payload"]) for row in rows)
+
+    async def vacuum(self, full: bool = False, pages: int = 1000):
+        # the pool connections run in autocommit mode, VACUUM can't run in a
+        # transaction; a plain VACUUM doesn't block writes, FULL does
+        options = "FULL, ANALYZE" if full else "ANALYZE"
+        for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+            await self._execute(f"VACUUM ({options}) {table}")
+
+
+class CheckpointRetention:
+    """
+    Prunes the checkpoint store of the compiled graph's checkpointer, either
+    once (`run_once`) or every `interval` seconds in the background.
+    """
+
+    def __init__(
+        self,
+        saver,
+        keep_last: int = 20,
+        thread_ttl: Optional[float] = 30 * 86400,
+        vacuum: bool = True,
+        full_vacuum: bool = False,
+        vacuum_pages: int = 1000,
+        blob_grace: float = 3600.0,
+        interval: float = 3600.0,
+    ):
+        if saver.backend == "postgres":
+            self.store = _PostgresStore(saver)
+        else:
+            self.store = _SqliteStore(saver)
+        self.keep_last = keep_last
+        self.thread_ttl = thread_ttl
+        self.vacuum = vacuum
+        self.full_vacuum = full_vacuum
+        self.vacuum_pages = vacuum_pages
+        self.blob_grace = blob_grace
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+        self.removed = metrics.counter(
+            "retention_removed_total", "Checkpoints, threads and blobs removed"
+        )
+        self.run_seconds = metrics.histogram(
+            "retention_run_seconds",
+            "Duration of a retention pass",
+            buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300),
+        )
+
+    async def run_once(self) -> Dict:
+        start = time.perf_counter()
+        report = {}
+
+        if self.thread_ttl:
+            cutoff = time.time() - self.thread_ttl
+            expired = [
+                thread_id
+                for thread_id, checkpoint_id in (
+                    await self.store.last_checkpoints()
+                ).items()
+                if checkpoint_timestamp(checkpoint_id) < cutoff
+            ]
+            if expired:
+                await self.store.delete_threads(expired)
+            report["threads_expired"] = len(expired)
+
+        if self.keep_last:
+            report["checkpoints_pruned"] = await self.store.prune(self.keep_last)
+
+        referenced = await self.store.referenced_blobs()
+        report.update(
+            await asyncio.to_thread(
+                get_blob_store().sweep, referenced, self.blob_grace
+            )
+        )
+
+        if self.vacuum:
+            await self.store.vacuum(self.full_vacuum, self.vacuum_pages)
+
+        for kind in ("threads_expired", "checkpoints_pruned", "blobs_deleted"):
+            self.removed.inc(report.get(kind, 0), kind=kind)
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        self.run_seconds.observe(report["seconds"])
+        logger.info("Checkpoint retention: %s", report)
+        return report
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning("Checkpoint retention failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.task is None and self.interval:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+async def _main(args):
+    config = load_config(args.config)
+    settings = dict(config.get("retention", {}))
+    settings.pop("enabled", None)
+    settings.pop("interval", None)
+    if args.keep_last is not None:
+        settings["keep_last"] = args.keep_last
+    if args.thread_ttl_days is not None:
+        settings["thread_ttl"] = args.thread_ttl_days * 86400
+    if args.no_vacuum:
+        settings["vacuum"] = False
+    if args.full_vacuum:
+        settings["full_vacuum"] = True
+
+    configure_blob_store(config.get("blob_store", {}))
+    saver, conn = await open_checkpointer(config.get("checkpointer", {}))
+    try:
+        await saver.setup()
+        report = await CheckpointRetention(saver, interval=0, **settings).run_once()
+        print(json.dumps(report, indent=2))
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Prune, expire and vacuum the checkpoint store"
+    )
+    parser.add_argument("--config", default=None, help="defaults to config.yaml")
+    parser.add_argument("--keep-last", type=int, default=None)
+    parser.add_argument("--thread-ttl-days", type=float, default=None)
+    parser.add_argument("--no-vacuum", action="store_true")
+    parser.add_argument(
+        "--full-vacuum",
+        action="store_true",
+        help="rewrite the whole database, blocks checkpoint writes while it runs",
+    )
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,177 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from main.main_graph import RunProjectManager
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===================== Sessions =====================
+# One asyncio lock per thread, so two requests never resume the same
+# checkpoint at once while runs on different threads stay fully concurrent.
+# Locks only exist while a thread has callers, the registry is as large as
+# the number of busy threads. Identical submissions (same thread, same
+# message) share one run instead of appending the message twice.
+
+
+class SessionBusy(Exception):
+    pass
+
+
+class _Session:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class _SharedRun:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SessionManager:
+    """
+    Serializes runs per thread on top of the stateless RunProjectManager and
+    coalesces duplicate submissions: a message already running on a thread
+    (or finished within `dedupe_window` seconds) returns that run's result.
+    """
+
+    def __init__(
+        self,
+        runner: RunProjectManager,
+        dedupe_window: float = 10.0,
+        max_recent: int = 1000,
+        lock_timeout: Optional[float] = None,
+    ):
+        self.runner = runner
+        self.dedupe_window = dedupe_window
+        self.max_recent = max_recent
+        self.lock_timeout = lock_timeout
+        self.sessions: Dict[str, _Session] = {}
+        self.inflight: Dict[Tuple[str, str], _SharedRun] = {}
+        self.recent: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = OrderedDict()
+
+        self.active = metrics.gauge(
+            "sessions_active", "Threads with a queued or running call"
+        )
+        self.lock_wait = metrics.histogram(
+            "session_lock_wait_seconds", "Time a call waited for its thread to be free"
+        )
+        self.coalesced = metrics.counter(
+            "sessions_coalesced_total", "Duplicate submissions served by another run"
+        )
+
+    @asynccontextmanager
+    async def lock(self, thread_id: str):
+        """Exclusive access to a thread, released sessions are dropped."""
+        session = self.sessions.get(thread_id)
+        if session is None:
+            session = self.sessions[thread_id] = _Session()
+            self.active.inc()
+        session.users += 1
+        start = time.perf_counter()
+        try:
+            try:
+                await asyncio.wait_for(session.lock.acquire(), self.lock_timeout)
+            except asyncio.TimeoutError:
+                raise SessionBusy(f"Thread {thread_id} is busy, try again later")
+            self.lock_wait.observe(time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                session.lock.release()
+        finally:
+            session.users -= 1
+            if session.users == 0:
+                del self.sessions[thread_id]
+                self.active.dec()
+
+    async def new_thread(self, task: str) -> Dict[str, Any]:
+        thread_id = str(uuid.uuid4())
+        async with self.lock(thread_id):
+            return await self.runner.new_thread(task, thread_id)
+
+    async def existing_thread(self, thread_id: str, task: str) -> Dict[str, Any]:
+        key = (thread_id, task)
+        recent = self._recent(key)
+        if recent is not None:
+            self.coalesced.inc(outcome="recent")
+            return recent
+
+        shared = self.inflight.get(key)
+        if shared is None:
+            shared = self.inflight[key] = _SharedRun(
+                asyncio.create_task(self._resume(key))
+            )
+        else:
+            self.coalesced.inc(outcome="in_flight")
+
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        except asyncio.CancelledError:
+            # the run is only cancelled once nobody is waiting for it anymore
+            if shared.waiters == 1 and not shared.task.done():
+                shared.task.cancel()
+            raise
+        finally:
+            shared.waiters -= 1
+
+    async def _resume(self, key: Tuple[str, str]) -> Dict[str, Any]:
+        thread_id, task = key
+        try:
+            async with self.lock(thread_id):
+                result = await self.runner.existing_thread(thread_id, task)
+            if self.dedupe_window:
+                self.recent[key] = (time.monotonic(), result)
+                self.recent.move_to_end(key)
+                while len(self.recent) > self.max_recent:
+                    self.recent.popitem(last=False)
+            return result
+        finally:
+            self.inflight.pop(key, None)
+
+    def _recent(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        cutoff = time.monotonic() - self.dedupe_window
+        while self.recent:
+            finished_at, _ = next(iter(self.recent.values()))
+            if finished_at >= cutoff:
+                break
+            self.recent.popitem(last=False)
+        entry = self.recent.get(key)
+        return entry[1] if entry else None
+
+    async def run(self, task: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
+        if thread_id:
+            return await self.existing_thread(thread_id, task)
+        return await self.new_thread(task)
+
+    async def stream(self, task: str, thread_id: Optional[str] = None):
+        """
+        Streamed runs hold the thread's lock for as long as the client reads,
+        they are not coalesced since every client needs its own events.
+        """
+        if thread_id:
+            events = self.runner.stream_existing_thread(thread_id, task)
+        else:
+            thread_id = str(uuid.uuid4())
+            events = self.runner.stream_new_thread(task, thread_id)
+        async with self.lock(thread_id):
+            try:
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+
+    async def get_state(self, thread_id: str):
+        return await self.runner.get_current_state(thread_id)
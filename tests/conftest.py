@@ -0,0 +1,49 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import FakeChatModel, FakeSearchClient, fake_settings
+from config import load_config
+from utils import embeddings
+
+
+@pytest.fixture
+def build_options(tmp_path):
+    """ProjectManager.build keyword arguments for an offline graph."""
+    return {
+        "settings": fake_settings(load_config(), str(tmp_path)),
+        "llm": FakeChatModel(time_to_first_token=0.0, tokens_per_second=1e6),
+        "search_client": FakeSearchClient(latency=0.0),
+    }
+
+
+def _bag_of_words(texts):
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.split():
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+    return vectors
+
+
+class FlakyEmbeddings:
+    """Stand-in for the local embedding model, `fail` simulates an outage."""
+
+    def __init__(self):
+        self.fail = False
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("embedding model unavailable")
+        return _bag_of_words(texts)
+
+
+@pytest.fixture
+def embedding_function():
+    function = FlakyEmbeddings()
+    previous = embeddings._embedding_function
+    embeddings.set_embedding_function(function)
+    yield function
+    embeddings.set_embedding_function(previous)
@@ -0,0 +1,261 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from benchmarks.run import SCENARIOS
+from main import app as app_module
+from main.main_graph import ProjectManager
+from utils.llm_limiter import LLMQueueTimeout
+
+
+class OverloadedSessions:
+    async def run(self, task, thread_id=None):
+        raise LLMQueueTimeout("LLM queue is full")
+
+    async def stream(self, task, thread_id=None):
+        yield {"event": "thread", "thread_id": "t"}
+        raise LLMQueueTimeout("LLM queue is full")
+
+
+@pytest.fixture
+def client(build_options):
+    """The app on the offline graph, requests go through the ASGI transport."""
+
+    def request(*calls):
+        async def run():
+            app_module.build_options = build_options
+            async with app_module.lifespan(app_module.app):
+                transport = httpx.ASGITransport(app=app_module.app)
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as http:
+                    return [await call(http) for call in calls]
+
+        try:
+            return asyncio.run(run())
+        finally:
+            app_module.build_options = {}
+
+    return request
+
+
+def _overloaded():
+    sessions = OverloadedSessions()
+    app_module.sessions = sessions
+    app_module.batch_runner.sessions = sessions
+    app_module.job_manager.sessions = sessions
+
+
+def test_queue_timeouts_ask_every_client_to_retry(client):
+    async def chat(http):
+        _overloaded()
+        return await http.post("/project_manager/chat", json={"task": "plan"})
+
+    async def stream(http):
+        return await http.post("/project_manager/stream", json={"task": "plan"})
+
+    async def batch(http):
+        return await http.post(
+            "/project_manager/batch", json={"tasks": [{"task": "plan"}]}
+        )
+
+    async def job(http):
+        submitted = await http.post("/project_manager/jobs", json={"task": "plan"})
+        job_id = submitted.json()["job_id"]
+        for _ in range(100):
+            status = (await http.get(f"/project_manager/jobs/{job_id}")).json()
+            if status["status"] == "failed":
+                break
+            await asyncio.sleep(0.01)
+        return status, await http.get(f"/project_manager/jobs/{job_id}/result")
+
+    chat, stream, batch, (status, result) = client(chat, stream, batch, job)
+
+    assert chat.status_code == 429
+    assert chat.headers["Retry-After"] == "5"
+
+    error = [line for line in stream.text.splitlines() if line.startswith("data:")][-1]
+    assert json.loads(error[5:]) == {
+        "event": "error",
+        "detail": "LLM queue is full",
+        "status_code": 429,
+        "retry_after": 5,
+    }
+
+    assert json.loads(batch.text) == {
+        "index": 0,
+        "status": "failed",
+        "error": "LLM queue is full",
+        "status_code": 429,
+        "retry_after": 5,
+    }
+
+    assert status["status"] == "failed"
+    assert status["retry_after"] == 5
+    assert result.status_code == 429
+    assert result.headers["Retry-After"] == "5"
+
+
+def test_metrics_and_usage_endpoints(client):
+    async def chat_then_read(http):
+        reply = await http.post("/project_manager/chat", json={"task": "hello"})
+        reply = reply.json()
+        usage = await http.get(f"/project_manager/state/{reply['thread_id']}/usage")
+        return reply, usage, await http.get("/metrics")
+
+    ((reply, usage, exported),) = client(chat_then_read)
+
+    assert usage.status_code == 200
+    usage = usage.json()
+    assert usage["thread_id"] == reply["thread_id"]
+    assert usage["nodes"]["chat"]["runs"] == 1
+    assert usage["llm"]["calls"] >= 1
+    assert usage["llm"]["completion_tokens"] > 0
+
+    assert exported.status_code == 200
+    assert exported.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'node_runs_total{node="chat",outcome="ok"}' in exported.text
+    assert "# TYPE node_seconds histogram" in exported.text
+
+
+def _events(response):
+    return [
+        json.loads(line[5:])
+        for line in response.text.splitlines()
+        if line.startswith("data:")
+    ]
+
+
+def test_stream_events_in_order(client):
+    message, answer = SCENARIOS["planner"]
+
+    async def stream(http):
+        paused = await http.post("/project_manager/stream", json={"task": message})
+        thread_id = _events(paused)[0]["thread_id"]
+        resumed = await http.post(
+            "/project_manager/stream", json={"task": answer, "thread_id": thread_id}
+        )
+        return paused, resumed
+
+    ((paused, resumed),) = client(stream)
+    assert paused.headers["content-type"].startswith("text/event-stream")
+
+    events = _events(paused)
+    assert events[0]["event"] == "thread"
+    assert events[-1] == {
+        "event": "paused",
+        "thread_id": events[0]["thread_id"],
+        "query": "What is your budget, preferred style and deadline?",
+    }
+    starts = [e["node"] for e in events if e["event"] == "node_start"]
+    assert starts[:3] == ["main_agent", "planner_agent", "interrupt"]
+    tokens = [e for e in events if e["event"] == "token"]
+    assert {e["node"] for e in tokens} == {"interrupt"}
+    assert "".join(e["content"] for e in tokens) == events[-1]["query"]
+
+    events = _events(resumed)
+    assert events[0] == {
+        "event": "thread",
+        "thread_id": _events(paused)[0]["thread_id"],
+    }
+    assert events[-1]["event"] == "completed"
+    assert events[-1]["output"]
+    ends = [e["node"] for e in events if e["event"] == "node_end"]
+    assert ends.index("planner") < ends.index("estimator_agent")
+    assert ends.index("schedule_agent") < ends.index("report_agent")
+
+
+class SilentSessions:
+    """A run that goes quiet after its first event, like a long web search."""
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+
+    async def stream(self, task, thread_id=None):
+        try:
+            yield {"event": "thread", "thread_id": "t"}
+            await asyncio.sleep(3600)
+        finally:
+            self.closed.set()
+
+
+def test_stream_is_cancelled_when_the_client_disconnects(build_options):
+    sessions = SilentSessions()
+
+    async def run():
+        app_module.build_options = build_options
+        async with app_module.lifespan(app_module.app):
+            app_module.sessions = sessions
+            first_chunk, requests = asyncio.Event(), [
+                {
+                    "type": "http.request",
+                    "body": json.dumps({"task": "plan"}).encode(),
+                    "more_body": False,
+                }
+            ]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                await first_chunk.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.body" and message.get("body"):
+                    first_chunk.set()
+
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0", "spec_version": "2.4"},
+                "http_version": "1.1",
+                "method": "POST",
+                "scheme": "http",
+                "path": "/project_manager/stream",
+                "raw_path": b"/project_manager/stream",
+                "query_string": b"",
+                "root_path": "",
+                "headers": [(b"content-type", b"application/json")],
+                "client": ("test", 1),
+                "server": ("test", 80),
+            }
+            response = asyncio.create_task(app_module.app(scope, receive, send))
+            await asyncio.wait({response}, timeout=5)
+            closed = sessions.closed.is_set()
+            response.cancel()
+            await asyncio.gather(response, return_exceptions=True)
+            return closed
+
+    try:
+        assert asyncio.run(run())
+    finally:
+        app_module.build_options = {}
+
+
+@pytest.mark.parametrize("fails", [False, True])
+def test_health_is_503_until_the_warm_up_ends(client, monkeypatch, fails):
+    warming = asyncio.Event()
+
+    async def warmup(self, **settings):
+        await warming.wait()
+        if fails:
+            raise RuntimeError("model not found")
+        return {"llm": {"default": 0.1}}
+
+    monkeypatch.setattr(ProjectManager, "warmup", warmup)
+
+    async def during(http):
+        return await http.get("/health")
+
+    async def after(http):
+        warming.set()
+        await app_module.warmup_task
+        return await http.get("/health")
+
+    during, after = client(during, after)
+    assert during.status_code == 503
+    assert during.json()["status"] == "warming up"
+    assert after.status_code == 200
+    expected = "failed: model not found" if fails else {"llm": {"default": 0.1}}
+    assert after.json()["warmup"] == expected
@@ -0,0 +1,41 @@
+import asyncio
+
+from main.batch import BatchRunner
+from main.main_graph import ProjectManager, RunProjectManager
+from main.sessions import SessionManager
+from utils.metrics import metrics
+
+TASKS = [
+    "hello",
+    "Do a market study for a coffee shop in my city",
+    "Do a market study for a coffee shop in my city",
+]
+
+
+def _decisions():
+    values = metrics.snapshot().get("router_decisions_total", {"values": []})["values"]
+    return sum(v["value"] for v in values)
+
+
+def test_batch_decisions_stay_inside_the_batch(build_options):
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            runner = RunProjectManager(project_manager)
+            batch = BatchRunner(SessionManager(runner), project_manager.router)
+            before = _decisions()
+            results = [item async for item in batch.run([(t, None) for t in TASKS])]
+            in_batch = _decisions() - before
+
+            await runner.new_thread(TASKS[1])
+            return results, in_batch, _decisions() - before - in_batch
+        finally:
+            await project_manager.close()
+
+    results, in_batch, after = asyncio.run(run())
+    assert sorted(index for index, _, _ in results) == [0, 1, 2]
+    assert all(error is None for _, _, error in results)
+    # routed once per distinct text up front, the runs reuse it
+    assert in_batch == 2
+    # a later run outside the batch routes again
+    assert after == 1
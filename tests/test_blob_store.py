@@ -0,0 +1,42 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.blob_store import BlobStore
+
+
+def _files(path):
+    return [name for _, _, files in os.walk(path) for name in files]
+
+
+def test_concurrent_puts_of_the_same_value(tmp_path):
+    store = BlobStore(path=str(tmp_path))
+    value = {"title": "tiles", "content": "ceramic tiles cost $20 per m2" * 50}
+    barrier = threading.Barrier(16)
+
+    def put(_):
+        barrier.wait()
+        return store.put(value)
+
+    with ThreadPoolExecutor(16) as pool:
+        refs = list(pool.map(put, range(16)))
+
+    assert len(set(refs)) == 1
+    assert len(_files(tmp_path)) == 1
+    assert not any(name.endswith(".tmp") for name in _files(tmp_path))
+    assert BlobStore(path=str(tmp_path)).get(refs[0]) == value
+
+
+def test_concurrent_aput_many(tmp_path):
+    store = BlobStore(path=str(tmp_path), cache_entries=4)
+    values = [{"n": i} for i in range(20)]
+
+    async def run():
+        return await asyncio.gather(*(store.aput_many(values) for _ in range(8)))
+
+    results = asyncio.run(run())
+    assert all(refs == results[0] for refs in results)
+    assert len(_files(tmp_path)) == len(values)
+    assert len(store.cache) <= 4
+    assert [store.get(ref) for ref in results[0]] == values
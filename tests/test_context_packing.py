@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from utils.context_packing import ContextPacker
+
+CHUNKS = [
+    {"content": "ceramic floor tiles cost per square meter"},
+    {"content": "opening hours of the city library"},
+]
+
+
+def test_embedding_errors_back_off_instead_of_disabling(embedding_function):
+    packer = ContextPacker(retry_backoff=0.1)
+
+    async def run():
+        embedding_function.fail = True
+        await packer.scores("ceramic floor tiles", CHUNKS)
+        calls = embedding_function.calls
+        lexical = await packer.scores("ceramic floor tiles", CHUNKS)
+        assert embedding_function.calls == calls  # not retried while backing off
+
+        embedding_function.fail = False
+        await asyncio.sleep(0.15)
+        await packer.scores("ceramic floor tiles", CHUNKS)
+        return lexical, embedding_function.calls - calls
+
+    lexical, retried = asyncio.run(run())
+    assert lexical[0] > lexical[1]
+    assert retried == 1
+
+
+def test_chunk_tokens_must_be_positive():
+    with pytest.raises(ValueError):
+        ContextPacker(chunk_tokens=0)
@@ -0,0 +1,100 @@
+import asyncio
+
+from langchain_core.exceptions import OutputParserException
+
+from agents.estimator_agent import EstimatorAgent, match_estimates
+from agents.states import StepCost, StepCostEstimates
+from benchmarks.fakes import FakeChatModel
+
+
+def _step(number, step):
+    return {"number": number, "step": step, "time": "", "dependency": ""}
+
+
+CHUNK = [
+    _step(1, "Remove the old tiles"),
+    _step(2, "Paint the walls"),
+    _step(3, "Install the lights"),
+]
+
+
+def test_estimates_are_matched_by_step_not_position():
+    matched = match_estimates(
+        CHUNK,
+        [
+            StepCost(step="3. Install the lights", cost=300),
+            StepCost(step="Paint the walls", cost=200),
+        ],
+    )
+    assert {n: e.cost for n, e in matched.items()} == {2: 200, 3: 300}
+
+
+def test_wrong_numbers_and_unknown_steps_are_not_assigned():
+    matched = match_estimates(
+        CHUNK,
+        [
+            # number of another step, the name wins
+            StepCost(step="1. Paint the walls", cost=200),
+            StepCost(step="Steps 1 and 3 combined", cost=999),
+            StepCost(step="7. Clean up", cost=50),
+            StepCost(step="Step 1", cost=100),
+        ],
+    )
+    assert {n: e.cost for n, e in matched.items()} == {1: 100, 2: 200}
+
+
+class ShuffledEstimates(FakeChatModel):
+    """Skips the first step and answers the others in reverse order."""
+
+    def _structured(self, schema, messages):
+        return schema(
+            estimates=[
+                StepCost(step="Install the lights", cost=300),
+                StepCost(step="Paint the walls", cost=200),
+            ]
+        )
+
+
+def test_skipped_steps_are_unavailable_and_left_out_of_the_total():
+    agent = EstimatorAgent(
+        ShuffledEstimates(time_to_first_token=0.0, tokens_per_second=1e6),
+        context_packing={"agent_budgets": {"estimator": 0}},
+    )
+
+    async def run():
+        rows, _ = await agent.estimate_chunk("Renovate", CHUNK, asyncio.Semaphore(1))
+        return agent.merge_node({"cost_table": rows})
+
+    merged = asyncio.run(run())
+    assert [row["cost"] for row in merged["cost_table"]] == [None, 200, 300]
+    assert merged["total_cost"] == 500
+    assert "1. Remove the old tiles || Estimate unavailable" in merged["estimates"]
+
+
+class UnparsableChunk(FakeChatModel):
+    """Answers with junk for the chunk holding step 1."""
+
+    def _structured(self, schema, messages):
+        if schema is StepCostEstimates and "1. Remove" in messages[-1].content:
+            raise OutputParserException("Invalid json output: {'estim")
+        return super()._structured(schema, messages)
+
+
+def test_an_unparsable_chunk_keeps_the_other_estimates():
+    agent = EstimatorAgent(
+        UnparsableChunk(time_to_first_token=0.0, tokens_per_second=1e6),
+        chunk_size=1,
+        context_packing={"agent_budgets": {"estimator": 0}},
+    )
+
+    async def run():
+        estimated = await agent.estimator_node(
+            {"task": "Renovate", "chunks": [[step] for step in CHUNK]}
+        )
+        return agent.merge_node(estimated)
+
+    merged = asyncio.run(run())
+    assert merged["cost_table"][0]["note"] == "No reliable estimate found"
+    assert merged["cost_table"][0]["cost"] is None
+    assert all(row["cost"] is not None for row in merged["cost_table"][1:])
+    assert "(based on 2 of 3 steps)" in merged["estimates"]
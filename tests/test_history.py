@@ -0,0 +1,104 @@
+import asyncio
+
+from langchain_core.runnables import RunnableLambda
+
+from benchmarks.fakes import FakeChatModel
+from utils.history import HistoryManager
+from utils.metrics import metrics
+
+
+def _llm():
+    return FakeChatModel(time_to_first_token=0.0, tokens_per_second=1e6)
+
+
+def _turn(n):
+    return (
+        {"role": "user", "content": f"question {n}"},
+        {"role": "assistant", "content": f"answer {n}"},
+    )
+
+
+def test_background_summary_is_folded_on_the_next_turn():
+    manager = HistoryManager(_llm(), window=4)
+
+    async def run():
+        history, summary = [], ""
+        for n in range(3):
+            history, summary = manager.fold("t", history, summary)
+            history, summary = await manager.append("t", history, summary, *_turn(n))
+            await asyncio.sleep(0.01)
+        return manager.fold("t", history, summary)
+
+    history, summary = asyncio.run(run())
+    assert summary.startswith("The user is planning")
+    assert len(history) == 4
+    assert history[-1]["content"] == "answer 2"
+
+
+def _dropped():
+    return sum(v["value"] for v in metrics.snapshot()["history_dropped_total"]["values"])
+
+
+def test_turns_on_other_workers_are_summarized_not_dropped():
+    HistoryManager(_llm())
+    dropped = _dropped()
+
+    async def run():
+        history, summary = [], ""
+        for n in range(10):
+            # every turn lands on a fresh process, pending summaries are lost
+            manager = HistoryManager(_llm(), window=4, hard_limit=2)
+            history, summary = manager.fold("t", history, summary)
+            history, summary = await manager.append("t", history, summary, *_turn(n))
+            await manager.close()
+        return history, summary
+
+    history, summary = asyncio.run(run())
+    assert summary
+    assert len(history) <= 8
+    assert history[-1]["content"] == "answer 9"
+    assert _dropped() == dropped
+
+
+def test_pending_summaries_are_bounded():
+    manager = HistoryManager(_llm(), window=4, max_pending=2)
+
+    async def run():
+        tasks = []
+        for thread_id in ("a", "b", "c"):
+            history = [m for n in range(2) for m in _turn(n)]
+            await manager.append(thread_id, history, "", *_turn(2))
+            tasks.append(manager.pending[thread_id][1])
+        await asyncio.sleep(0)
+        pending = list(manager.pending)
+        await manager.close()
+        return pending, tasks
+
+    pending, tasks = asyncio.run(run())
+    assert pending == ["b", "c"]
+    assert tasks[0].cancelled()
+
+
+def test_summaries_do_not_stream_into_the_calling_run():
+    manager = HistoryManager(_llm(), window=2, hard_limit=2)
+
+    async def chat(history):
+        history, _ = await manager.append("t", history, "", *_turn(9))
+        await asyncio.sleep(0.01)
+        return history
+
+    async def run(history):
+        events = [
+            event["event"]
+            async for event in RunnableLambda(chat).astream_events(
+                history, version="v2"
+            )
+        ]
+        await manager.close()
+        return events
+
+    # background summary, then the inline one at the hard limit
+    for history in (list(_turn(0)), [m for n in range(2) for m in _turn(n)]):
+        events = asyncio.run(run(history))
+        assert "on_chat_model_start" not in events
+        assert "on_chat_model_stream" not in events
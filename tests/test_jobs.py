@@ -0,0 +1,79 @@
+import asyncio
+
+from benchmarks.run import SCENARIOS
+from main.jobs import JobManager
+from main.main_graph import ProjectManager, RunProjectManager
+from main.sessions import SessionManager
+
+
+class BlockingSessions:
+    """Sessions whose runs never finish on their own."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def run(self, task, thread_id=None):
+        self.started.set()
+        await asyncio.Event().wait()
+
+
+async def _wait_for(job, statuses, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while job.status not in statuses:
+        assert asyncio.get_running_loop().time() < deadline, job.status
+        await asyncio.sleep(0.01)
+
+
+def test_stop_with_a_running_job():
+    async def run():
+        sessions = BlockingSessions()
+        jobs = JobManager(sessions, workers=2)
+        await jobs.start()
+        job = jobs.submit("plan my kitchen")
+        await asyncio.wait_for(sessions.started.wait(), 5)
+        await asyncio.wait_for(jobs.stop(), 5)
+        return jobs, job
+
+    jobs, job = asyncio.run(run())
+    assert job.status == "cancelled"
+    assert jobs.worker_tasks == []
+
+
+def test_cancel_keeps_the_worker_running():
+    async def run():
+        sessions = BlockingSessions()
+        jobs = JobManager(sessions, workers=1)
+        await jobs.start()
+        job = jobs.submit("plan my kitchen")
+        await asyncio.wait_for(sessions.started.wait(), 5)
+        jobs.cancel(job.job_id)
+        await _wait_for(job, {"cancelled"})
+        alive = not jobs.worker_tasks[0].done()
+        await asyncio.wait_for(jobs.stop(), 5)
+        return alive
+
+    assert asyncio.run(run())
+
+
+def test_paused_and_completed_jobs(build_options):
+    message, answer = SCENARIOS["planner"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        jobs = JobManager(SessionManager(RunProjectManager(project_manager)))
+        await jobs.start()
+        try:
+            first = jobs.submit(message)
+            await _wait_for(first, {"paused", "completed", "failed"})
+            second = jobs.submit(answer, first.thread_id)
+            await _wait_for(second, {"paused", "completed", "failed"})
+            return first, second
+        finally:
+            await jobs.stop()
+            await project_manager.close()
+
+    first, second = asyncio.run(run())
+    assert first.status == "paused"
+    assert first.result["query"]
+    assert second.status == "completed"
+    assert second.thread_id == first.thread_id
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from benchmarks.run import SCENARIOS
+from main.main_graph import ProjectManager, RunProjectManager
+from tools.knowledge_index import KnowledgeIndex, get_knowledge_index
+from tools.search_cache import SearchCache, cache_key
+
+RESULTS = [
+    {"title": "Tiles", "url": "https://a", "content": "ceramic floor tiles cost"},
+    {"title": "Paint", "url": "https://b", "content": "ceramic floor tiles price"},
+]
+
+
+def test_transient_errors_back_off_instead_of_disabling(tmp_path, embedding_function):
+    index = KnowledgeIndex(
+        path=str(tmp_path), flush_interval=0.01, retry_backoff=0.1, min_similarity=0.3
+    )
+
+    async def run():
+        await index.start()
+        embedding_function.fail = True
+        assert await index.search("ceramic floor tiles", agent="planner") == []
+        index.ingest(RESULTS, agent="planner")  # skipped while backing off
+        assert index.queue.qsize() == 0
+
+        embedding_function.fail = False
+        await asyncio.sleep(0.15)
+        index.ingest(RESULTS, agent="planner")
+        await index.flush()
+        hits = await index.search("ceramic floor tiles", agent="planner")
+        await index.aclose()
+        return hits
+
+    assert {hit["url"] for hit in asyncio.run(run())} == {"https://a", "https://b"}
+
+
+def test_only_search_results_are_indexed(tmp_path, build_options, embedding_function):
+    build_options["settings"]["knowledge_index"] = {
+        "path": str(tmp_path / "knowledge"),
+        "flush_interval": 0.01,
+    }
+    message, answer = SCENARIOS["planner"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            runner = RunProjectManager(project_manager)
+            paused = await runner.new_thread(message)
+            await runner.existing_thread(paused["thread_id"], answer)
+            index = get_knowledge_index()
+            await index.flush()
+            return index._get_collection().get()["metadatas"]
+        finally:
+            await project_manager.close()
+
+    metadatas = asyncio.run(run())
+    assert metadatas
+    assert {m["kind"] for m in metadatas} == {"search"}
+
+
+def test_cached_results_keep_their_fetch_time(tmp_path, embedding_function):
+    index = KnowledgeIndex(
+        path=str(tmp_path / "knowledge"),
+        flush_interval=0.01,
+        min_similarity=0.3,
+        ttl={"planner": 3600, "estimator": 60},
+    )
+    cache = SearchCache(sqlite_path=str(tmp_path / "search_cache.sqlite"))
+    key = cache_key("ceramic floor tiles", 3, False)
+
+    async def run():
+        await index.start()
+        await cache.set(key, RESULTS)
+        await cache.conn.execute(
+            "UPDATE search_cache SET created_at = ?", (time.time() - 600,)
+        )
+        await cache.conn.commit()
+        cache.memory.clear()
+        cached = await cache.get(key, agent="estimator")
+        # a fresh ingestion, but the results were fetched 10 minutes ago
+        index.ingest(cached, agent="estimator")
+        await index.flush()
+        hits = {
+            agent: await index.search("ceramic floor tiles", agent=agent)
+            for agent in ("planner", "estimator")
+        }
+        await index.aclose()
+        await cache.aclose()
+        return hits
+
+    hits = asyncio.run(run())
+    assert len(hits["planner"]) == 2
+    assert hits["planner"][0]["fetched_at"] < time.time() - 500
+    assert hits["estimator"] == []
+
+
+def test_lookups_skip_documents_of_agents_with_a_longer_ttl(
+    tmp_path, embedding_function
+):
+    index = KnowledgeIndex(
+        path=str(tmp_path),
+        flush_interval=0.01,
+        min_similarity=0.3,
+        ttl={"planner": 3600, "estimator": 60},
+    )
+
+    async def run():
+        await index.start()
+        index.ingest(RESULTS, agent="planner")
+        await index.flush()
+        hits = {
+            agent: await index.search("ceramic floor tiles", agent=agent)
+            for agent in ("planner", "estimator")
+        }
+        await index.aclose()
+        return hits
+
+    hits = asyncio.run(run())
+    assert len(hits["planner"]) == 2
+    assert hits["estimator"] == []
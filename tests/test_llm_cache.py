@@ -0,0 +1,71 @@
+import asyncio
+import uuid
+
+from utils.llm_cache import LLMResponseCache
+
+
+def _cache(**kwargs):
+    return LLMResponseCache(collection_name=f"test-{uuid.uuid4().hex}", **kwargs)
+
+
+PLAN = "plan: paint the walls, tile the floor, install lights in the living room"
+SIMILAR_PLAN = "plan: paint the walls, tile the floor, install lights in the bed room"
+
+
+def test_semantic_tier_only_for_allowed_schemas(embedding_function):
+    cache = _cache(similarity_threshold=0.8)
+
+    async def run():
+        query = cache.namespace("m", "search prompt", "Query")
+        await cache.set(query, PLAN, "Query", {"query": ["tiles"]})
+        estimate = cache.namespace("m", "estimate prompt", "StepCostEstimates")
+        await cache.set(estimate, PLAN, "StepCostEstimates", {"estimates": []})
+        return (
+            await cache.get(query, SIMILAR_PLAN, "Query"),
+            await cache.get(estimate, SIMILAR_PLAN, "StepCostEstimates"),
+            await cache.get(estimate, PLAN.upper(), "StepCostEstimates"),
+        )
+
+    similar_query, similar_estimate, exact_estimate = asyncio.run(run())
+    assert similar_query == {"query": ["tiles"]}
+    assert similar_estimate is None
+    assert exact_estimate == {"estimates": []}
+
+
+def test_semantic_tier_backs_off_after_errors(embedding_function):
+    cache = _cache(retry_backoff=0.2, max_backoff=1.0)
+    namespace = cache.namespace("m", "search prompt", "Query")
+
+    async def run():
+        embedding_function.fail = True
+        assert await cache.get(namespace, PLAN, "Query") is None
+        calls = embedding_function.calls
+        # skipped while backing off, the exact tier still works
+        await cache.set(namespace, PLAN, "Query", {"query": ["a"]})
+        assert await cache.get(namespace, SIMILAR_PLAN, "Query") is None
+        assert embedding_function.calls == calls
+
+        embedding_function.fail = False
+        await asyncio.sleep(0.25)
+        await cache.set(namespace, PLAN, "Query", {"query": ["a"]})
+        assert embedding_function.calls == calls + 1
+        return await cache.get(namespace, PLAN + " now", "Query")
+
+    assert asyncio.run(run()) == {"query": ["a"]}
+    assert cache.semantic
+
+
+def test_semantic_tier_is_bounded(embedding_function):
+    cache = _cache(semantic_max_entries=10)
+    namespace = cache.namespace("m", "search prompt", "Query")
+
+    async def run():
+        for n in range(25):
+            await cache.set(namespace, f"{PLAN} {n}", "Query", {"query": [str(n)]})
+        return cache._get_collection().get(include=["documents"])["documents"]
+
+    documents = asyncio.run(run())
+    assert len(documents) <= 10
+    # the newest text survives, the oldest went first
+    assert f"{PLAN} 24" in documents
+    assert f"{PLAN} 0" not in documents
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from utils.llm_limiter import LLMQueueTimeout, PriorityLimiter
+
+
+def test_waiters_are_served_by_priority():
+    async def run():
+        limiter = PriorityLimiter(max_in_flight=1)
+        await limiter.acquire("batch")
+        order = []
+
+        async def call(priority):
+            await limiter.acquire(priority)
+            order.append(priority)
+            limiter.release()
+
+        tasks = [asyncio.create_task(call("batch"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("interactive")))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return limiter, order
+
+    limiter, order = asyncio.run(run())
+    assert order == ["interactive", "batch"]
+    assert limiter.in_flight == 0
+
+
+def test_queue_timeout_per_class():
+    async def run():
+        limiter = PriorityLimiter(
+            max_in_flight=1, queue_timeout={"interactive": 0.05, "batch": None}
+        )
+        await limiter.acquire("batch")
+        with pytest.raises(LLMQueueTimeout):
+            await limiter.acquire("interactive")
+        waiter = asyncio.create_task(limiter.acquire("batch"))
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        limiter.release()
+        await waiter
+        limiter.release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter.in_flight == 0
+    assert limiter.waiters == []
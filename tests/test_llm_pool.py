@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from utils.llm_pool import LLMPool
+
+
+class OllamaStub:
+    """Minimal Ollama server: /api/version and /api/chat, or HTTP 500 when dead."""
+
+    def __init__(self, delay: float = 0.0, dead: bool = False):
+        self.delay = delay
+        self.dead = dead
+        self.chats = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if stub.dead:
+                    return self._reply(500, b"{}", "application/json")
+                self._reply(200, b'{"version": "0.6.0"}', "application/json")
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                request = json.loads(self.rfile.read(length))
+                stub.chats += 1
+                if stub.dead:
+                    body = b'{"error": "model crashed"}'
+                    return self._reply(500, body, "application/json")
+                time.sleep(stub.delay)
+                stream = request.get("stream", True)
+                done = {
+                    "model": request["model"],
+                    "created_at": "2025-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": "" if stream else "OK"},
+                    "done": True,
+                    "done_reason": "stop",
+                    "prompt_eval_count": 3,
+                    "eval_count": 1,
+                }
+                if not stream:
+                    body = json.dumps(done).encode()
+                    return self._reply(200, body, "application/json")
+                token = {**done, "message": {"role": "assistant", "content": "OK"}}
+                token["done"] = False
+                lines = [json.dumps(token), json.dumps(done)]
+                body = "\n".join(lines).encode() + b"\n"
+                self._reply(200, body, "application/x-ndjson")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    started = []
+
+    def start(**kwargs):
+        stub = OllamaStub(**kwargs)
+        started.append(stub)
+        return stub
+
+    yield start
+    for stub in started:
+        stub.close()
+
+
+def _pool(*endpoints, **kwargs):
+    return LLMPool(
+        [
+            {"name": f"e{i}", "model": "stub", "base_url": stub.url, "weight": weight}
+            for i, (stub, weight) in enumerate(endpoints)
+        ],
+        health_check_interval=0,
+        **kwargs,
+    )
+
+
+def _ask(pool):
+    return pool.ainvoke([HumanMessage(content="hello")])
+
+
+def test_requests_are_balanced(stubs):
+    first, second = stubs(delay=0.05), stubs(delay=0.05)
+    pool = _pool((first, 1), (second, 1))
+
+    async def run():
+        return await asyncio.gather(*(_ask(pool) for _ in range(8)))
+
+    replies = asyncio.run(run())
+    assert [r.content for r in replies] == ["OK"] * 8
+    assert first.chats == second.chats == 4
+
+
+def test_failover_and_cooldown(stubs):
+    # the dead endpoint has the larger weight, it is picked whenever eligible
+    dead, live = stubs(dead=True), stubs()
+    pool = _pool((dead, 10), (live, 1), failure_cooldown=0.3)
+
+    async def run():
+        assert (await _ask(pool)).content == "OK"
+        assert dead.chats == 1
+        await _ask(pool)
+        assert dead.chats == 1  # cooling down
+
+        await asyncio.sleep(0.35)
+        await _ask(pool)
+        assert dead.chats == 2  # retried once after the cooldown
+        await _ask(pool)
+        await _ask(pool)
+        assert dead.chats == 2  # the failure restarted the cooldown
+
+    asyncio.run(run())
+    assert live.chats == 5
+
+
+def test_health_checks_keep_a_dead_endpoint_cooling_down(stubs):
+    dead, live = stubs(dead=True), stubs()
+    pool = _pool((dead, 10), (live, 1), failure_cooldown=0.2)
+
+    async def run():
+        await pool.check_health()
+        await asyncio.sleep(0.25)
+        await pool.check_health()
+        await _ask(pool)
+
+    asyncio.run(run())
+    assert dead.chats == 0
+    assert live.chats == 1
+    assert [e["healthy"] for e in pool.status()] == [False, True]
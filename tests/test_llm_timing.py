@@ -0,0 +1,24 @@
+import time
+from uuid import uuid4
+
+from utils.llm_timing import LLMTimingCallback
+
+
+def _start(callback, run_id=None):
+    run_id = run_id or uuid4()
+    callback.on_chat_model_start({}, [], run_id=run_id, metadata={})
+    return run_id
+
+
+def test_unfinished_calls_are_bounded():
+    callback = LLMTimingCallback(max_runs=3)
+    run_ids = [_start(callback) for _ in range(5)]
+    assert list(callback.runs) == run_ids[2:]
+
+
+def test_stale_calls_are_dropped():
+    callback = LLMTimingCallback(stale_after=60)
+    abandoned = _start(callback)
+    callback.runs[abandoned]["start"] = time.perf_counter() - 120
+    current = _start(callback)
+    assert list(callback.runs) == [current]
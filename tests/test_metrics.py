@@ -0,0 +1,50 @@
+import threading
+
+from utils.metrics import MetricsRegistry
+
+
+def test_snapshots_while_worker_threads_record():
+    registry = MetricsRegistry()
+    counter = registry.counter("writes_total")
+    histogram = registry.histogram("write_seconds")
+    done = threading.Event()
+
+    def record():
+        for n in range(20000):
+            counter.inc(blob=n)
+            histogram.observe(0.01, blob=n)
+        done.set()
+
+    worker = threading.Thread(target=record)
+    worker.start()
+    while not done.is_set():
+        registry.snapshot()
+        registry.render_prometheus()
+    worker.join()
+
+    snapshot = registry.snapshot()
+    assert len(snapshot["writes_total"]["values"]) == 20000
+    assert len(snapshot["write_seconds"]["values"]) == 20000
+
+
+def test_render_prometheus():
+    registry = MetricsRegistry()
+    registry.counter("searches_total", "Searches\nby outcome").inc(2, outcome="web")
+    registry.gauge("queue_depth").set(3)
+    histogram = registry.histogram("call_seconds", buckets=(0.1, 1))
+    histogram.observe(0.05, node='say "hi"')
+    histogram.observe(0.5, node='say "hi"')
+
+    assert registry.render_prometheus().splitlines() == [
+        "# TYPE call_seconds histogram",
+        'call_seconds_bucket{le="0.1",node="say \\"hi\\""} 1',
+        'call_seconds_bucket{le="1",node="say \\"hi\\""} 2',
+        'call_seconds_bucket{le="+Inf",node="say \\"hi\\""} 2',
+        'call_seconds_sum{node="say \\"hi\\""} 0.55',
+        'call_seconds_count{node="say \\"hi\\""} 2',
+        "# TYPE queue_depth gauge",
+        "queue_depth 3",
+        "# HELP searches_total Searches\\nby outcome",
+        "# TYPE searches_total counter",
+        'searches_total{outcome="web"} 2',
+    ]
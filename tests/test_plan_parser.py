@@ -0,0 +1,52 @@
+from utils.plan_parser import chunk_steps, format_steps, parse_plan_steps
+
+PLAN = """Here is the plan:
+1. step: Research the market || time stamp: 2-3 days || dependency : none
+2) **Step**: Pick a location || Time Stamp: 1 week || Dependencies: Step 1
+- 3. Sign the lease
+not a step
+4. step:  || time stamp: 1 day
+5. **Step:** Demolition || **Time stamp:** 2 days || **Dependency:** Step 3
+6. **Step: Clean up** || time stamp: **1 day**
+"""
+
+
+def test_parse_plan_steps():
+    steps = parse_plan_steps(PLAN)
+    assert steps == [
+        {
+            "number": 1,
+            "step": "Research the market",
+            "time": "2-3 days",
+            "dependency": "none",
+        },
+        {
+            "number": 2,
+            "step": "Pick a location",
+            "time": "1 week",
+            "dependency": "Step 1",
+        },
+        {"number": 3, "step": "Sign the lease", "time": "", "dependency": ""},
+        {
+            "number": 5,
+            "step": "Demolition",
+            "time": "2 days",
+            "dependency": "Step 3",
+        },
+        {"number": 6, "step": "Clean up", "time": "1 day", "dependency": ""},
+    ]
+    assert parse_plan_steps(PLAN.splitlines()) == steps
+    assert parse_plan_steps("") == []
+
+
+def test_format_and_chunk_steps():
+    steps = parse_plan_steps(PLAN)
+    assert format_steps(steps).splitlines() == [
+        "1. Research the market",
+        "2. Pick a location",
+        "3. Sign the lease",
+        "5. Demolition",
+        "6. Clean up",
+    ]
+    assert [len(chunk) for chunk in chunk_steps(steps, 2)] == [2, 2, 1]
+    assert len(chunk_steps(steps, 0)) == 5
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from agents.planner_agent import PlannerAgent
+from agents.states import _initialize_state
+from benchmarks.run import SCENARIOS
+from main.main_graph import ProjectManager
+
+TASK = "I want to do finishing works to my room"
+
+
+def _planner(build_options, **kwargs):
+    return PlannerAgent(build_options["llm"], speculative_search=True, **kwargs)
+
+
+def test_unused_prefetch_expires_without_further_traffic(build_options):
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            planner = _planner(build_options, prefetch_ttl=0.05)
+            planner._start_prefetch("t", TASK)
+            prefetch = planner.prefetched["t"][2]
+            await asyncio.sleep(0.1)
+            return planner, prefetch
+        finally:
+            await project_manager.close()
+
+    planner, prefetch = asyncio.run(run())
+    assert not planner.prefetched
+    assert prefetch.done()
+
+
+def test_expired_prefetches_are_purged_on_lookup(build_options):
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            planner = _planner(build_options, prefetch_ttl=60)
+            planner._start_prefetch("old", TASK)
+            planner._start_prefetch("new", TASK)
+            old = planner.prefetched["old"]
+            planner.prefetched["old"] = (time.monotonic() - 120, *old[1:])
+            taken = await planner._take_prefetch("new", TASK)
+            await asyncio.sleep(0)
+            return planner, old[2], taken
+        finally:
+            await project_manager.close()
+
+    planner, abandoned, taken = asyncio.run(run())
+    assert not planner.prefetched
+    assert abandoned.cancelled()
+    assert taken is not None and taken[0] == TASK
+
+
+def test_prefetch_stays_out_of_the_interrupt_node_events(build_options):
+    message, _ = SCENARIOS["planner"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            graph = project_manager.project_manager
+            config = {"configurable": {"thread_id": "t"}}
+            events = [
+                event
+                async for event in graph.astream_events(
+                    _initialize_state(message), config, version="v2"
+                )
+            ]
+            return events
+        finally:
+            await project_manager.close()
+
+    events = asyncio.run(run())
+    interrupt_events = {
+        event["event"]
+        for event in events
+        if event.get("metadata", {}).get("langgraph_node") == "interrupt"
+    }
+    assert "on_tool_start" not in interrupt_events
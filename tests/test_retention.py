@@ -0,0 +1,76 @@
+import asyncio
+
+from main.checkpointer import open_checkpointer
+from main.retention import CheckpointRetention
+from utils.blob_store import configure_blob_store
+
+
+async def _pragma(conn, name):
+    async with conn.execute(f"PRAGMA {name}") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def _free_pages(conn):
+    await conn.execute("CREATE TABLE padding (data BLOB)")
+    for _ in range(200):
+        await conn.execute("INSERT INTO padding VALUES (randomblob(8000))")
+    await conn.execute("DELETE FROM padding")
+    await conn.commit()
+    return await _pragma(conn, "freelist_count")
+
+
+def _retention(saver, **kwargs):
+    return CheckpointRetention(saver, thread_ttl=None, interval=0, **kwargs)
+
+
+def test_background_pass_vacuums_incrementally(tmp_path):
+    configure_blob_store({"path": str(tmp_path / "blobs")})
+
+    async def run():
+        saver, conn = await open_checkpointer(
+            {"sqlite": {"path": str(tmp_path / "checkpoints.sqlite")}}
+        )
+        try:
+            await saver.setup()
+            mode = await _pragma(conn, "auto_vacuum")
+            free = await _free_pages(conn)
+            await _retention(saver, vacuum_pages=50).run_once()
+            return mode, free, await _pragma(conn, "freelist_count")
+        finally:
+            await conn.close()
+
+    mode, before, after = asyncio.run(run())
+    assert mode == 2  # INCREMENTAL
+    assert before > 50
+    assert after == before - 50
+
+
+def test_full_vacuum_converts_an_existing_database(tmp_path):
+    configure_blob_store({"path": str(tmp_path / "blobs")})
+    path = str(tmp_path / "checkpoints.sqlite")
+
+    async def run():
+        import aiosqlite
+
+        # a database created before auto_vacuum was set
+        async with aiosqlite.connect(path) as conn:
+            await conn.execute("CREATE TABLE legacy (x)")
+            await conn.commit()
+        saver, conn = await open_checkpointer({"sqlite": {"path": path}})
+        try:
+            await saver.setup()
+            before = await _pragma(conn, "auto_vacuum")
+            await _free_pages(conn)
+            await _retention(saver).run_once()
+            unchanged = await _pragma(conn, "auto_vacuum")
+            await _retention(saver, full_vacuum=True).run_once()
+            return before, unchanged, await _pragma(conn, "auto_vacuum"), (
+                await _pragma(conn, "freelist_count")
+            )
+        finally:
+            await conn.close()
+
+    before, unchanged, after, free = asyncio.run(run())
+    assert before == unchanged == 0
+    assert after == 2
+    assert free == 0
@@ -0,0 +1,25 @@
+import asyncio
+
+from benchmarks.fakes import FakeChatModel
+from utils.router import IntentRouter
+
+
+def test_embedding_errors_back_off_instead_of_disabling(embedding_function):
+    router = IntentRouter(FakeChatModel(), retry_backoff=0.1)
+
+    async def run():
+        embedding_function.fail = True
+        failed = await router.classify("Plan the renovation of my kitchen")
+        calls = embedding_function.calls
+        skipped = await router.classify("Plan the renovation of my kitchen")
+        assert embedding_function.calls == calls  # not retried while backing off
+
+        embedding_function.fail = False
+        await asyncio.sleep(0.15)
+        recovered = await router.classify("Plan the renovation of my kitchen")
+        return failed, skipped, recovered
+
+    failed, skipped, recovered = asyncio.run(run())
+    assert failed.source == skipped.source == "rules"
+    assert recovered.source == "rules+embeddings"
+    assert recovered.next_node == "planner_agent"
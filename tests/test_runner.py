@@ -0,0 +1,133 @@
+import asyncio
+import shutil
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from agents.states import StepCostEstimates
+from benchmarks.fakes import FakeChatModel
+from benchmarks.run import SCENARIOS
+from main.main_graph import ProjectManager, RunProjectManager
+from utils.blob_store import BlobNotFound, get_blob_store, is_ref
+
+
+def test_hitl_pause_and_resume(build_options):
+    message, answer = SCENARIOS["planner"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            runner = RunProjectManager(project_manager)
+            paused = await runner.new_thread(message)
+            resumed = await runner.existing_thread(paused["thread_id"], answer)
+            return paused, resumed
+        finally:
+            await project_manager.close()
+
+    paused, resumed = asyncio.run(run())
+    assert paused["status"] == "paused"
+    assert paused["query"] == "What is your budget, preferred style and deadline?"
+    assert resumed["status"] == "completed"
+    assert resumed["thread_id"] == paused["thread_id"]
+    assert resumed["output"]["end"]
+
+
+def test_run_without_interrupt_completes(build_options):
+    message, _ = SCENARIOS["chat"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            return await RunProjectManager(project_manager).new_thread(message)
+        finally:
+            await project_manager.close()
+
+    result = asyncio.run(run())
+    assert result["status"] == "completed"
+    assert "__interrupt__" not in result["output"]
+
+
+def test_reports_are_checkpointed_as_blob_refs(build_options):
+    message, _ = SCENARIOS["market"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            runner = RunProjectManager(project_manager)
+            result = await runner.new_thread(message)
+            snapshot = await runner.get_current_state(result["thread_id"])
+            streamed = [event async for event in runner.stream_new_thread(message)]
+            return result, snapshot.values, streamed[-1]
+        finally:
+            await project_manager.close()
+
+    result, values, completed = asyncio.run(run())
+    assert is_ref(values["end"])
+    assert "market_study" not in values
+    assert result["output"]["end"].startswith("Here is the requested analysis")
+    assert completed["output"] == result["output"]["end"]
+
+
+def test_a_missing_report_blob_is_an_error(build_options):
+    message, _ = SCENARIOS["market"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            runner = RunProjectManager(project_manager)
+            result = await runner.new_thread(message)
+            snapshot = await runner.get_current_state(result["thread_id"])
+            # a replica without the shared blob volume
+            store = get_blob_store()
+            shutil.rmtree(store.path)
+            store.cache.clear()
+            with pytest.raises(BlobNotFound):
+                await runner._result(result["thread_id"], snapshot.values)
+        finally:
+            await project_manager.close()
+
+    asyncio.run(run())
+
+
+class SlowEstimates(FakeChatModel):
+    """Cost estimates take far longer than the branch latency budget."""
+
+    def with_structured_output(self, schema, **kwargs):
+        runnable = super().with_structured_output(schema, **kwargs)
+        if schema is not StepCostEstimates:
+            return runnable
+
+        async def slow(messages):
+            await asyncio.sleep(30)
+            return await runnable.ainvoke(messages)
+
+        return RunnableLambda(slow)
+
+
+def test_partial_report_when_the_estimator_exceeds_its_budget(build_options):
+    build_options["settings"]["join"] = {
+        "partial_report": True,
+        "branch_latency_budget": 0.5,
+    }
+    build_options["llm"] = SlowEstimates(time_to_first_token=0.0, tokens_per_second=1e6)
+    message, answer = SCENARIOS["planner"]
+
+    async def run():
+        project_manager = await ProjectManager.build(**build_options)
+        try:
+            runner = RunProjectManager(project_manager)
+            paused = await runner.new_thread(message)
+            return await asyncio.wait_for(
+                runner.existing_thread(paused["thread_id"], answer), 10
+            )
+        finally:
+            await project_manager.close()
+
+    output = asyncio.run(run())["output"]
+    assert output["branches"]["estimator_agent"]["status"] == "timed_out"
+    assert output["branches"]["schedule_agent"]["status"] == "completed"
+    assert output["schedule"] and output["schedule"] in output["end"]
+    assert (
+        "Estimates unavailable: the estimator exceeded its latency budget."
+        in output["end"]
+    )
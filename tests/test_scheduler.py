@@ -0,0 +1,74 @@
+import pytest
+
+from utils.scheduler import (
+    build_schedule,
+    format_schedule,
+    parse_dependencies,
+    parse_duration,
+)
+
+
+def _step(number, step, time="1 day", dependency=""):
+    return {"number": number, "step": step, "time": time, "dependency": dependency}
+
+
+@pytest.mark.parametrize(
+    "text, days",
+    [
+        ("2-3 days", 2.5),
+        ("4 hours", 0.5),
+        ("1 week", 7),
+        ("half a day", 0.5),
+        ("2 months", 60),
+        ("soon", 1.0),
+    ],
+)
+def test_parse_duration(text, days):
+    assert parse_duration(text) == pytest.approx(days)
+
+
+def test_parse_dependencies():
+    steps = {1: _step(1, "Research"), 2: _step(2, "Design"), 3: _step(3, "Build")}
+    assert parse_dependencies("None", steps) == []
+    assert parse_dependencies("Steps 1 and 2, step 1", steps) == [1, 2]
+    assert parse_dependencies("Step 9", steps) == []
+    assert parse_dependencies("after the design", steps) == [2]
+
+
+def test_build_schedule_critical_path_and_levelling():
+    steps = [
+        _step(1, "Research", "2 days"),
+        _step(2, "Design", "1 day", "1"),
+        _step(3, "Permits", "4 days", "1"),
+        _step(4, "Build", "1 day", "2, 3"),
+    ]
+    schedule = build_schedule(steps)
+    assert schedule["critical_path"] == [1, 3, 4]
+    assert schedule["critical_path_duration"] == 7
+    assert schedule["project_duration"] == 7
+    assert schedule["lanes"] == 2
+    by_number = {s["number"]: s for s in schedule["steps"]}
+    assert by_number[2]["slack"] == 3
+    assert by_number[4]["start"] == 6
+
+    # a single lane runs everything back to back
+    serial = build_schedule(steps, max_parallel=1)
+    assert serial["lanes"] == 1
+    assert serial["project_duration"] == 8
+
+    text = format_schedule(schedule)
+    assert "Estimated Total Project Duration: 7 days" in text
+    assert "Step 1 -> Step 3 -> Step 4" in text
+
+
+def test_build_schedule_breaks_cycles_and_duplicates():
+    steps = [
+        _step(1, "A", dependency="2"),
+        _step(2, "B", dependency="1"),
+        _step(2, "B again"),
+    ]
+    schedule = build_schedule(steps)
+    assert [s["number"] for s in schedule["steps"]] == [1, 2]
+    assert schedule["steps"][1]["dependencies"] == [1]
+    assert len(schedule["warnings"]) == 2
+    assert schedule["project_duration"] == 2
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from tools.search_cache import SearchCache, cache_key
+
+
+async def _rows(cache):
+    async with cache.conn.execute("SELECT key FROM search_cache") as cursor:
+        return {row[0] for row in await cursor.fetchall()}
+
+
+def test_sqlite_tier_drops_expired_rows_and_keeps_the_newest(tmp_path):
+    path = str(tmp_path / "search_cache.sqlite")
+    keys = [cache_key(f"tiles {n}", 3, False) for n in range(6)]
+
+    async def run():
+        cache = SearchCache(
+            sqlite_path=path,
+            default_ttl=60,
+            ttl={"planner": 120},
+            max_disk_entries=3,
+            prune_every=2,
+        )
+        for key in keys[:4]:
+            await cache.set(key, [{"url": key}])
+        # an entry older than every agent's TTL
+        await cache.conn.execute(
+            "UPDATE search_cache SET created_at = ? WHERE key = ?",
+            (time.time() - 600, keys[3]),
+        )
+        await cache.conn.commit()
+        await cache.set(keys[4], [{"url": keys[4]}])
+        await cache.set(keys[5], [{"url": keys[5]}])
+        rows = await _rows(cache)
+        await cache.aclose()
+        return rows
+
+    assert asyncio.run(run()) == {keys[2], keys[4], keys[5]}
+
+
+def test_expired_rows_are_pruned_on_connect(tmp_path):
+    path = str(tmp_path / "search_cache.sqlite")
+    key = cache_key("paint", 3, False)
+
+    async def run():
+        cache = SearchCache(sqlite_path=path, default_ttl=60)
+        await cache.set(key, [{"url": "a"}])
+        await cache.conn.execute("UPDATE search_cache SET created_at = 0")
+        await cache.conn.commit()
+        await cache.aclose()
+
+        reopened = SearchCache(sqlite_path=path, default_ttl=60)
+        assert await reopened.get(key) is None
+        rows = await _rows(reopened)
+        await reopened.aclose()
+        return rows
+
+    assert asyncio.run(run()) == set()
@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.fakes import FakeSearchClient
+from tools import search_tools
+from tools.search_cache import cache_key
+from tools.search_tools import AsyncSearchClient, search_web
+
+
+@pytest.fixture
+def search_globals():
+    """Restore the module-wide client, settings and cache after the test."""
+    saved = (
+        search_tools._search_settings,
+        search_tools._search_client,
+        search_tools._search_cache,
+    )
+    search_tools.configure_search_cache({"enabled": False})
+    yield
+    (
+        search_tools._search_settings,
+        search_tools._search_client,
+        search_tools._search_cache,
+    ) = saved
+    search_tools._search_inflight.clear()
+
+
+def test_search_client_is_created_once(search_globals):
+    search_tools.configure_search_client({"api_key": "test", "max_in_flight": 2})
+    client = search_tools.get_search_client()
+
+    assert search_tools.get_search_client() is client
+    assert client.api_key == "test"
+    asyncio.run(search_tools.close_search_client())
+    assert search_tools._search_client is None
+
+
+def test_in_flight_requests_are_capped():
+    state = {"running": 0, "peak": 0}
+
+    async def handler(request):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.02)
+        state["running"] -= 1
+        return httpx.Response(
+            200, json={"results": [{"title": "t", "url": "u", "raw_content": None}]}
+        )
+
+    async def run():
+        client = AsyncSearchClient(api_key="test", max_in_flight=2)
+        await client.client.aclose()
+        client.client = httpx.AsyncClient(
+            base_url=search_tools.TAVILY_API_URL,
+            transport=httpx.MockTransport(handler),
+        )
+        results = await asyncio.gather(*(client.search(f"query {n}") for n in range(6)))
+        await client.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert state["peak"] == 2
+    assert results[0] == [{"title": "t", "url": "u", "content": "", "score": 0.0}]
+
+
+def test_identical_searches_share_one_request(search_globals):
+    fake = FakeSearchClient(latency=0.05)
+    search_tools.configure_search_client(client=fake)
+    query = {"query": "tile prices", "max_results": 2}
+
+    async def run():
+        return await asyncio.gather(*(search_web.ainvoke(query) for _ in range(3)))
+
+    first, second, third = asyncio.run(run())
+    assert fake.calls == 1
+    assert first == second == third
+    assert len(first) == 2
+    assert not search_tools._search_inflight
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_request(search_globals):
+    fake = FakeSearchClient(latency=0.05)
+    search_tools.configure_search_client(client=fake)
+    key = cache_key("paint", 3, False)
+
+    async def run():
+        first = asyncio.create_task(search_tools._search_once(key, "paint", 3, False))
+        second = asyncio.create_task(search_tools._search_once(key, "paint", 3, False))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        results = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return results
+
+    results = asyncio.run(run())
+    assert fake.calls == 1
+    assert len(results) == 3
+    assert not search_tools._search_inflight
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from main.sessions import SessionBusy, SessionManager
+
+
+class CountingRunner:
+    """Runner that blocks every resume until released."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def existing_thread(self, thread_id, task):
+        self.calls += 1
+        await self.release.wait()
+        return {"status": "completed", "thread_id": thread_id, "output": task}
+
+
+def test_duplicate_submissions_share_one_run():
+    async def run():
+        runner = CountingRunner()
+        sessions = SessionManager(runner, dedupe_window=10)
+        first = asyncio.create_task(sessions.existing_thread("t1", "hello"))
+        second = asyncio.create_task(sessions.existing_thread("t1", "hello"))
+        await asyncio.sleep(0.01)
+        runner.release.set()
+        a, b = await asyncio.gather(first, second)
+        # finished within the window, served from the recent results
+        c = await sessions.existing_thread("t1", "hello")
+        return runner, sessions, a, b, c
+
+    runner, sessions, a, b, c = asyncio.run(run())
+    assert runner.calls == 1
+    assert a is b is c
+    assert sessions.inflight == {}
+    assert sessions.sessions == {}
+
+
+def test_locks_are_dropped_and_busy_threads_time_out():
+    async def run():
+        runner = CountingRunner()
+        sessions = SessionManager(runner, dedupe_window=0, lock_timeout=0.05)
+        first = asyncio.create_task(sessions.existing_thread("t1", "one"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SessionBusy):
+            await sessions.existing_thread("t1", "two")
+        runner.release.set()
+        await first
+        return sessions
+
+    sessions = asyncio.run(run())
+    assert sessions.sessions == {}
+    assert sessions.recent == {}
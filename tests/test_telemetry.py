@@ -0,0 +1,43 @@
+import time
+from uuid import uuid4
+
+from utils.telemetry import RunTelemetry
+
+
+def _chain_start(telemetry, name, parent_run_id=None, node=""):
+    run_id = uuid4()
+    telemetry.on_chain_start(
+        {},
+        {},
+        run_id=run_id,
+        parent_run_id=parent_run_id,
+        metadata={"langgraph_node": node, "thread_id": "t"},
+        name=name,
+    )
+    return run_id
+
+
+def test_abandoned_runs_are_dropped():
+    telemetry = RunTelemetry(stale_after=60)
+    # a stream closed mid-run: the graph, its node and a runnable inside it
+    # never report an end
+    graph = _chain_start(telemetry, "LangGraph")
+    node = _chain_start(telemetry, "planner", graph, node="planner")
+    inner = _chain_start(telemetry, "RunnableSequence", node, node="planner")
+    assert set(telemetry.runs) == {graph, node} and set(telemetry.parents) == {inner}
+
+    for run_id in (graph, node):
+        telemetry.runs[run_id]["start"] = time.perf_counter() - 120
+    telemetry.parents[inner] = (node, time.perf_counter() - 120)
+    current = _chain_start(telemetry, "LangGraph")
+    assert list(telemetry.runs) == [current]
+    assert not telemetry.parents
+
+
+def test_unfinished_runs_are_bounded():
+    telemetry = RunTelemetry(max_runs=3)
+    graph = _chain_start(telemetry, "LangGraph")
+    inner = [_chain_start(telemetry, "RunnableLambda", graph) for _ in range(5)]
+    roots = [_chain_start(telemetry, "LangGraph") for _ in range(3)]
+    assert list(telemetry.parents) == inner[2:]
+    assert list(telemetry.runs) == roots
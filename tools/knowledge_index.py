@@ -0,0 +1,290 @@
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+import chromadb
+from chromadb.config import Settings
+from langchain.tools import tool
+
+from tools.search_tools import SearchInput, search_web
+from utils.backoff import Backoff
+from utils.embeddings import aembed, to_list
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# ====================== Knowledge Index =======================
+class KnowledgeIndex:
+    """
+    Persistent chromadb index of past web search results. Plans and
+    estimates are not indexed, the model's own guesses would come back to
+    later runs as sources. Lookups only count documents fetched (not
+    ingested) within the agent's TTL and ingested by agents whose TTL is no
+    longer than the caller's, so stale prices fall through to the web and
+    are refreshed by the re-ingestion. Ingestion is queued and written in
+    batches by a background task. After a chromadb or embedding error the
+    index is skipped for `retry_backoff` seconds, doubling up to
+    `max_backoff`.
+    """
+
+    def __init__(
+        self,
+        path: str = "vector_store/knowledge",
+        collection_name: str = "knowledge",
+        min_similarity: float = 0.55,
+        min_results: int = 2,
+        default_ttl: float = 90 * 86400,
+        ttl: Optional[Dict[str, float]] = None,
+        batch_size: int = 32,
+        flush_interval: float = 2.0,
+        max_queue: int = 2000,
+        retry_backoff: float = 30.0,
+        max_backoff: float = 600.0,
+    ):
+        self.path = path
+        self.collection_name = collection_name
+        self.min_similarity = min_similarity
+        self.min_results = min_results
+        self.default_ttl = default_ttl
+        self.ttl = ttl or {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.collection = None
+        self.backoff = Backoff(retry_backoff, max_backoff)
+        self.worker: Optional[asyncio.Task] = None
+
+        self.lookups = metrics.counter(
+            "knowledge_lookups_total", "Knowledge index lookups per agent and outcome"
+        )
+        self.ingested = metrics.counter(
+            "knowledge_ingested_total", "Documents written to the knowledge index"
+        )
+        self.dropped = metrics.counter(
+            "knowledge_dropped_total",
+            "Documents dropped because the queue was full or the index failed",
+        )
+
+    def _get_collection(self):
+        if self.collection is None:
+            client = chromadb.PersistentClient(
+                path=self.path, settings=Settings(anonymized_telemetry=False)
+            )
+            self.collection = client.get_or_create_collection(
+                name=self.collection_name, metadata={"hnsw:space": "cosine"}
+            )
+        return self.collection
+
+    def _failed(self, e: Exception):
+        delay = self.backoff.failed()
+        logger.warning(
+            "Knowledge index unavailable, searching the web only for %ss: %s", delay, e
+        )
+
+    def _ttl(self, agent: Optional[str]) -> float:
+        return self.ttl.get(agent, self.default_ttl) if agent else self.default_ttl
+
+    def _sources(self, agent: Optional[str]) -> List[str]:
+        """Agents whose documents `agent` may use: those kept at least as fresh."""
+        ttl = self._ttl(agent)
+        return sorted(a for a in {"", agent or "", *self.ttl} if self._ttl(a) <= ttl)
+
+    async def search(
+        self, query: str, agent: Optional[str] = None, n_results: int = 3
+    ) -> List[Dict]:
+        """Fresh documents within `min_similarity` of the query, best first."""
+        if not self.backoff.available():
+            return []
+        cutoff = time.time() - self._ttl(agent)
+        try:
+            embedding = await aembed([query])
+            result = await asyncio.to_thread(
+                self._get_collection().query,
+                query_embeddings=to_list(embedding),
+                n_results=n_results,
+                where={
+                    "$and": [
+                        {"kind": "search"},
+                        {"agent": {"$in": self._sources(agent)}},
+                        {"fetched_at": {"$gte": cutoff}},
+                    ]
+                },
+            )
+        except Exception as e:
+            self._failed(e)
+            return []
+        self.backoff.succeeded()
+
+        hits = []
+        for document, metadata, distance in zip(
+            result["documents"][0], result["metadatas"][0], result["distances"][0]
+        ):
+            similarity = 1.0 - distance
+            if similarity < self.min_similarity:
+                continue
+            hits.append(
+                {
+                    "title": metadata.get("title", ""),
+                    "url": metadata.get("url", ""),
+                    "content": document,
+                    "score": round(similarity, 4),
+                    "fetched_at": metadata["fetched_at"],
+                }
+            )
+        return hits
+
+    def ingest(self, documents: List[Dict], agent: Optional[str] = None):
+        """
+        Queues web search results ({"content", "url", "title"}) for the
+        index, never blocks the caller. Results served from the search
+        cache keep their original "fetched_at", the others are stamped now.
+        """
+        if not self.backoff.available():
+            return
+        kind = "search"
+        now = time.time()
+        for document in documents:
+            content = document.get("content", "")
+            if not content:
+                continue
+            key = f'{kind}\n{document.get("url", "")}\n{content}'
+            try:
+                self.queue.put_nowait(
+                    {
+                        "id": hashlib.sha256(key.encode("utf-8")).hexdigest(),
+                        "content": content,
+                        "metadata": {
+                            "kind": kind,
+                            "agent": agent or "",
+                            "url": document.get("url", ""),
+                            "title": document.get("title", ""),
+                            "fetched_at": float(document.get("fetched_at", now)),
+                        },
+                    }
+                )
+            except asyncio.QueueFull:
+                self.dropped.inc()
+
+    async def _write(self, batch: List[Dict]):
+        # the same document may be queued twice in one batch, upsert needs unique ids
+        batch = list({item["id"]: item for item in batch}.values())
+        embeddings = await aembed([item["content"] for item in batch])
+        await asyncio.to_thread(
+            self._get_collection().upsert,
+            ids=[item["id"] for item in batch],
+            embeddings=to_list(embeddings),
+            documents=[item["content"] for item in batch],
+            metadatas=[item["metadata"] for item in batch],
+        )
+        for item in batch:
+            self.ingested.inc(kind=item["metadata"]["kind"])
+
+    async def _next_batch(self) -> List[Dict]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                if self.backoff.available():
+                    await self._write(batch)
+                    self.backoff.succeeded()
+                else:
+                    self.dropped.inc(len(batch))
+            except Exception as e:
+                self.dropped.inc(len(batch))
+                self._failed(e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def start(self):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+
+    async def flush(self):
+        if self.worker is not None:
+            await self.queue.join()
+
+    async def aclose(self):
+        if self.worker is not None:
+            try:
+                await asyncio.wait_for(self.flush(), self.flush_interval * 5)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Knowledge index closed with %s queued", self.queue.qsize()
+                )
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+
+_knowledge_index: Optional[KnowledgeIndex] = None
+
+
+def configure_knowledge_index(settings: Optional[Dict] = None):
+    """Enable the knowledge index, `enabled: false` turns it off."""
+    global _knowledge_index
+    settings = dict(settings or {})
+    if not settings.pop("enabled", True):
+        _knowledge_index = None
+        return None
+    _knowledge_index = KnowledgeIndex(**settings)
+    return _knowledge_index
+
+
+def get_knowledge_index() -> Optional[KnowledgeIndex]:
+    return _knowledge_index
+
+
+async def close_knowledge_index():
+    global _knowledge_index
+    if _knowledge_index is not None:
+        await _knowledge_index.aclose()
+        _knowledge_index = None
+
+
+# ====================== Knowledge Search Tool =======================
+@tool(args_schema=SearchInput)
+async def knowledge_search(
+    query: str,
+    max_results: int = 3,
+    include_raw_content: bool = False,
+    agent: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Searches the local knowledge index first and the web only when the
+    index doesn't recall enough fresh, relevant results.
+    """
+    index = get_knowledge_index()
+    if index is not None and not include_raw_content:
+        hits = await index.search(query, agent=agent, n_results=max_results)
+        if len(hits) >= min(index.min_results, max_results):
+            index.lookups.inc(agent=agent or "", outcome="hit")
+            return hits
+        index.lookups.inc(agent=agent or "", outcome="miss")
+
+    results = await search_web.ainvoke(
+        {
+            "query": query,
+            "max_results": max_results,
+            "include_raw_content": include_raw_content,
+            "agent": agent,
+        }
+    )
+    if index is not None:
+        index.ingest(results, agent=agent)
+    return results
@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, List
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?.!")
+
+
+def cache_key(query: str, max_results: int, include_raw_content: bool) -> str:
+    payload = json.dumps(
+        [normalize_query(query), int(max_results), bool(include_raw_content)]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """
+    Content-addressed cache for search results.
+    In-memory LRU tier in front of an optional on-disk SQLite tier,
+    entries are checked against the TTL of the agent that reads them.
+    Rows older than the longest TTL are deleted on connect and every
+    `prune_every` writes, the newest `max_disk_entries` rows are kept.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        sqlite_path: Optional[str] = None,
+        default_ttl: float = 86400,
+        ttl: Optional[Dict[str, float]] = None,
+        max_disk_entries: int = 100000,
+        prune_every: int = 100,
+    ):
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self.default_ttl = default_ttl
+        self.ttl = dict(ttl or {})
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = prune_every
+        self.memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.conn: Optional[aiosqlite.Connection] = None
+        self.lock = asyncio.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.stores = 0
+
+    def ttl_for(self, agent: Optional[str]) -> float:
+        return self.ttl.get(agent, self.default_ttl) if agent else self.default_ttl
+
+    async def _connect(self) -> Optional[aiosqlite.Connection]:
+        if not self.sqlite_path:
+            return None
+        async with self.lock:
+            if self.conn is None:
+                directory = os.path.dirname(self.sqlite_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self.conn = await aiosqlite.connect(self.sqlite_path)
+                await self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS search_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                await self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS search_cache_created_at "
+                    "ON search_cache (created_at)"
+                )
+                await self.conn.commit()
+                await self._prune(self.conn)
+        return self.conn
+
+    async def _prune(self, conn: aiosqlite.Connection) -> int:
+        """Delete rows no agent would accept anymore and the oldest past the cap."""
+        max_ttl = max([self.default_ttl, *self.ttl.values()])
+        cursor = await conn.execute(
+            "DELETE FROM search_cache WHERE created_at < ?", (time.time() - max_ttl,)
+        )
+        deleted = cursor.rowcount
+        cursor = await conn.execute(
+            "DELETE FROM search_cache WHERE key IN ("
+            "SELECT key FROM search_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+        deleted += cursor.rowcount
+        await conn.commit()
+        if deleted:
+            logger.info("Pruned %s search cache rows", deleted)
+        return deleted
+
+    def _remember(self, key: str, created_at: float, results: List[Dict]):
+        self.memory[key] = (created_at, results)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    @staticmethod
+    def _stamped(created_at: float, results: List[Dict]) -> List[Dict]:
+        # cached results keep the time they were fetched, the knowledge
+        # index decides their freshness on it
+        return [{"fetched_at": created_at, **result} for result in results]
+
+    async def get(self, key: str, agent: Optional[str] = None) -> Optional[List[Dict]]:
+        ttl = self.ttl_for(agent)
+        now = time.time()
+
+        entry = self.memory.get(key)
+        if entry is not None and now - entry[0] < ttl:
+            self.memory.move_to_end(key)
+            self.hits["memory"] += 1
+            return self._stamped(*entry)
+
+        conn = await self._connect()
+        if conn is not None:
+            async with conn.execute(
+                "SELECT value, created_at FROM search_cache WHERE key = ?", (key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is not None and now - row[1] < ttl:
+                results = json.loads(row[0])
+                self._remember(key, row[1], results)
+                self.hits["disk"] += 1
+                return self._stamped(row[1], results)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, results: List[Dict]):
+        created_at = time.time()
+        self._remember(key, created_at, results)
+        self.stores += 1
+
+        conn = await self._connect()
+        if conn is not None:
+            await conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(results), created_at),
+            )
+            await conn.commit()
+            if self.prune_every and self.stores % self.prune_every == 0:
+                await self._prune(conn)
+
+    def stats(self) -> Dict:
+        lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+        return {
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+    async def aclose(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
@@ -1,11 +1,184 @@
 import os
+import time
 import asyncio
+import logging
+import httpx
 from dotenv import load_dotenv
 from typing import Optional, Dict, List
 from langchain.tools import tool
-from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
 from pydantic import BaseModel, Field
 
+from tools.search_cache import SearchCache, cache_key
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TAVILY_API_URL = "https://api.tavily.com"
+
+
+# ====================== Search Client =======================
+class AsyncSearchClient:
+    """
+    Process-wide async Tavily client.
+    Keeps one pooled keep-alive HTTP session for every search_web call
+    and caps the number of in-flight requests.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_in_flight: int = 8,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        search_depth: str = "advanced",
+    ):
+        if api_key is None:
+            load_dotenv()
+            api_key = os.getenv("TAVILY_API_KEY")
+        self.api_key = api_key
+        self.search_depth = search_depth
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.client = httpx.AsyncClient(
+            base_url=TAVILY_API_URL,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+
+    async def search(
+        self, query: str, max_results: int = 3, include_raw_content: bool = False
+    ) -> List[Dict]:
+        params = {
+            "api_key": self.api_key,
+            "query": query,
+            "max_results": max_results,
+            "search_depth": self.search_depth,
+            "include_answer": False,
+            "include_raw_content": include_raw_content,
+            "include_images": False,
+        }
+        async with self.semaphore:
+            response = await self.client.post("/search", json=params)
+        response.raise_for_status()
+        return self._clean_results(response.json().get("results", []))
+
+    @staticmethod
+    def _clean_results(results: List[Dict]) -> List[Dict]:
+        clean_results = []
+        for result in results:
+            clean_result = {
+                "title": result.get("title", ""),
+                "url": result.get("url", ""),
+                "content": result.get("content", ""),
+                "score": result.get("score", 0.0),
+            }
+            if raw_content := result.get("raw_content"):
+                clean_result["raw_content"] = raw_content
+            clean_results.append(clean_result)
+        return clean_results
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_search_settings: Dict = {}
+_search_client: Optional[AsyncSearchClient] = None
+
+
+def configure_search_client(
+    settings: Optional[Dict] = None, client: Optional[AsyncSearchClient] = None
+):
+    """
+    Set the search client settings, call once at startup before any search.
+    A ready `client` is used as is instead of one built from the settings.
+    """
+    global _search_settings, _search_client
+    load_dotenv()
+    _search_settings = dict(settings or {})
+    _search_client = client
+
+
+def get_search_client() -> AsyncSearchClient:
+    global _search_client
+    if _search_client is None:
+        _search_client = AsyncSearchClient(**_search_settings)
+        logger.info("Search client created with settings: %s", _search_settings)
+    return _search_client
+
+
+# ====================== Search Cache =======================
+_search_cache: Optional[SearchCache] = None
+
+
+def configure_search_cache(settings: Optional[Dict] = None):
+    """Enable the search result cache, `enabled: false` turns it off."""
+    global _search_cache
+    settings = dict(settings or {})
+    if not settings.pop("enabled", True):
+        _search_cache = None
+        return
+    _search_cache = SearchCache(**settings)
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    return _search_cache
+
+
+async def close_search_client():
+    global _search_client, _search_cache
+    if _search_client is not None:
+        await _search_client.aclose()
+        _search_client = None
+    if _search_cache is not None:
+        await _search_cache.aclose()
+        _search_cache = None
+
+
+# ====================== In-flight Dedupe =======================
+# identical searches running at the same time (e.g. a batch of similar
+# projects) share one request, the cache only helps once the first returns
+_search_inflight: Dict[str, asyncio.Task] = {}
+_coalesced = metrics.counter(
+    "search_coalesced_total", "Searches served by an identical in-flight request"
+)
+_search_requests = metrics.counter(
+    "search_requests_total", "search_web calls by agent and outcome"
+)
+_search_seconds = metrics.histogram(
+    "search_seconds", "Latency of search_web calls by outcome"
+)
+
+
+async def _fetch(key: str, query: str, max_results: int, include_raw_content: bool):
+    results = await get_search_client().search(
+        query=query,
+        max_results=max_results,
+        include_raw_content=include_raw_content,
+    )
+    cache = get_search_cache()
+    if cache is not None:
+        await cache.set(key, results)
+    return results
+
+
+async def _search_once(
+    key: str, query: str, max_results: int, include_raw_content: bool
+) -> List[Dict]:
+    task = _search_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch(key, query, max_results, include_raw_content))
+        _search_inflight[key] = task
+        task.add_done_callback(lambda _: _search_inflight.pop(key, None))
+    else:
+        _coalesced.inc()
+    # one caller giving up doesn't cancel the request for the others
+    return await asyncio.shield(task)
+
 
 # ====================== Web Search Tool =======================
 class SearchInput(BaseModel):
@@ -14,25 +187,37 @@ class SearchInput(BaseModel):
     include_raw_content: Optional[bool] = Field(
         False, description="Flag to return more content"
     )
+    agent: Optional[str] = Field(
+        None, description="Calling agent, selects the cache TTL."
+    )
 
 
 @tool(args_schema=SearchInput)
 async def search_web(
-    query: str, max_results: int = 3, include_raw_content: bool = False
+    query: str,
+    max_results: int = 3,
+    include_raw_content: bool = False,
+    agent: Optional[str] = None,
 ) -> List[Dict]:
     """
     Asynchronous web search for real time information.
     """
+    start, outcome = time.perf_counter(), "web"
     try:
-        load_dotenv()
-        search = TavilySearchAPIWrapper(tavily_api_key=os.getenv("TAVILY_API_KEY"))
-
-        results = await asyncio.to_thread(
-            search.results,
-            query=query,
-            max_results=max_results,
-            include_raw_content=include_raw_content,
-        )
-        return results
+        cache = get_search_cache()
+        key = cache_key(query, max_results, include_raw_content)
+        if cache is not None:
+            cached = await cache.get(key, agent=agent)
+            if cached is not None:
+                outcome = "cache_hit"
+                return cached
+
+        if key in _search_inflight:
+            outcome = "coalesced"
+        return await _search_once(key, query, max_results, include_raw_content)
     except Exception as e:
+        outcome = "error"
         return [{"ERROR": str(e)}]
+    finally:
+        _search_requests.inc(agent=agent or "", outcome=outcome)
+        _search_seconds.observe(time.perf_counter() - start, outcome=outcome)
@@ -0,0 +1,27 @@
+import time
+
+
+class Backoff:
+    """
+    Skips an optional backend (chromadb, the embedding model) after it
+    fails: for `initial` seconds after the first failure, doubling on each
+    further failure up to `maximum`. A success resets it.
+    """
+
+    def __init__(self, initial: float = 30.0, maximum: float = 600.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = 0.0
+        self.retry_at = 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.retry_at
+
+    def failed(self) -> float:
+        self.delay = min(self.maximum, self.delay * 2 if self.delay else self.initial)
+        self.retry_at = time.monotonic() + self.delay
+        return self.delay
+
+    def succeeded(self):
+        self.delay = 0.0
+        self.retry_at = 0.0
@@ -0,0 +1,220 @@
+import os
+import re
+import time
+import json
+import zlib
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===================== Blob Store =====================
+# Content addressed side store for bulky state values (search results,
+# reports). The graph state keeps the "sha256:<hex>" reference and the value
+# is written once, no matter how many states or checkpoints point to it.
+
+REF_PREFIX = "sha256:"
+REF_PATTERN = re.compile(rb"sha256:[0-9a-f]{64}")
+
+
+class BlobNotFound(KeyError):
+    """A referenced blob is not in the store (pruned, or not on this volume)."""
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+class BlobStore:
+    def __init__(
+        self,
+        path: str = "checkpoints/blobs",
+        compress: bool = True,
+        cache_entries: int = 512,
+    ):
+        self.path = path
+        self.compress = compress
+        self.cache_entries = cache_entries
+        self.cache: "OrderedDict[str, Any]" = OrderedDict()
+        # puts and gets run in worker threads (aput_many / aget_many)
+        self.lock = threading.Lock()
+
+        self.bytes_written = metrics.counter(
+            "blob_bytes_written_total", "Bytes written to the blob store"
+        )
+        self.blobs = metrics.counter(
+            "blob_writes_total", "Blob store puts, deduplicated or written"
+        )
+
+    def _file(self, digest: str, compressed: bool) -> str:
+        suffix = ".json.z" if compressed else ".json"
+        return os.path.join(self.path, digest[:2], digest + suffix)
+
+    def _remember(self, ref: str, value: Any):
+        with self.lock:
+            self.cache[ref] = value
+            self.cache.move_to_end(ref)
+            while len(self.cache) > self.cache_entries:
+                self.cache.popitem(last=False)
+
+    def _cached(self, ref: str) -> Any:
+        with self.lock:
+            if ref not in self.cache:
+                raise KeyError(ref)
+            self.cache.move_to_end(ref)
+            return self.cache[ref]
+
+    def _deduplicated(self, ref: str, value: Any) -> str:
+        self.blobs.inc(outcome="deduplicated")
+        self._remember(ref, value)
+        return ref
+
+    def put(self, value: Any) -> str:
+        data = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        ref = REF_PREFIX + digest
+        for compressed in (True, False):
+            existing = self._file(digest, compressed)
+            try:
+                # refresh the mtime, the retention sweep keeps recently used blobs
+                os.utime(existing)
+            except FileNotFoundError:
+                continue
+            return self._deduplicated(ref, value)
+
+        if self.compress:
+            data = zlib.compress(data)
+        path = self._file(digest, self.compress)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, readers never see a partial blob; the temp file is
+        # unique per call since threads may put the same value at once
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            if os.path.exists(path):
+                # another put of the same value finished first
+                os.remove(tmp)
+                return self._deduplicated(ref, value)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        self.blobs.inc(outcome="written")
+        self.bytes_written.inc(len(data))
+        self._remember(ref, value)
+        return ref
+
+    def get(self, ref: str) -> Any:
+        try:
+            return self._cached(ref)
+        except KeyError:
+            pass
+        digest = ref[len(REF_PREFIX) :]
+        for compressed in (True, False):
+            path = self._file(digest, compressed)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    data = f.read()
+                value = json.loads(zlib.decompress(data) if compressed else data)
+                self._remember(ref, value)
+                return value
+        raise BlobNotFound(f"Blob not found: {ref}")
+
+    async def aput_many(self, values: List[Any]) -> List[str]:
+        return await asyncio.to_thread(lambda: [self.put(v) for v in values])
+
+    async def aget_many(self, refs: List[str]) -> List[Any]:
+        def load():
+            values = []
+            for ref in refs:
+                try:
+                    values.append(self.get(ref))
+                except KeyError:
+                    logger.warning("Missing blob %s", ref)
+                    values.append(None)
+            return values
+
+        return await asyncio.to_thread(load)
+
+    def sweep(self, referenced: Set[str], grace: float = 3600.0) -> Dict[str, int]:
+        """
+        Delete blobs that no reference points to, blobs touched within
+        `grace` seconds are kept since a running graph may not have
+        checkpointed their reference yet.
+        """
+        cutoff = time.time() - grace
+        deleted, freed = 0, 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith((".json", ".json.z")):
+                    continue
+                ref = REF_PREFIX + name.split(".", 1)[0]
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    if ref in referenced or stat.st_mtime > cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                with self.lock:
+                    self.cache.pop(ref, None)
+                deleted += 1
+                freed += stat.st_size
+        return {"blobs_deleted": deleted, "blob_bytes_freed": freed}
+
+    def sizes(self) -> Dict[str, int]:
+        count, size = 0, 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith((".json", ".json.z")):
+                    count += 1
+                    size += os.path.getsize(os.path.join(root, name))
+        return {"blobs": count, "bytes": size}
+
+
+_store: Optional[BlobStore] = None
+
+
+def configure_blob_store(settings: Optional[Dict] = None) -> BlobStore:
+    global _store
+    _store = BlobStore(**(settings or {}))
+    return _store
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        _store = BlobStore()
+    return _store
+
+
+async def offload(values: List[Any]) -> List[str]:
+    """Store the values and return their references."""
+    return await get_blob_store().aput_many(values)
+
+
+async def resolve(refs: List[Any], strict: bool = False) -> List[Any]:
+    """
+    Load referenced values, entries that are not references (state written
+    before the blob store existed) are returned as they are, missing blobs
+    are dropped, or raise BlobNotFound with `strict`.
+    """
+    refs = refs or []
+    loaded = iter(await get_blob_store().aget_many([r for r in refs if is_ref(r)]))
+    values = [next(loaded) if is_ref(r) else r for r in refs]
+    if strict:
+        missing = [r for r, v in zip(refs, values) if v is None]
+        if missing:
+            raise BlobNotFound(f"Blob not found: {', '.join(missing)}")
+    return [v for v in values if v is not None]
@@ -0,0 +1,261 @@
+import re
+import math
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.backoff import Backoff
+from utils.embeddings import aembed, cosine_similarity
+from utils.metrics import metrics
+from utils.tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# ===================== Context Packing =====================
+# search results -> dedupe near-identical snippets -> sentence aligned chunks
+# -> rerank against the task (local embeddings, lexical overlap as fallback)
+# -> best chunks that fit the token budget, in source order.
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD = re.compile(r"[a-z0-9$]+")
+STOPWORDS = set(
+    "a an and are as at be by for from how i in is it my of on or that the "
+    "this to want what with you your".split()
+)
+
+packed_tokens = metrics.histogram(
+    "context_tokens",
+    "Tokens of retrieved content before and after packing",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+skipped_searches = metrics.counter(
+    "context_searches_skipped_total",
+    "Search queries not run because the context budget can't use their results",
+)
+packing_seconds = metrics.histogram(
+    "context_packing_seconds",
+    "Time spent deduplicating, chunking and reranking retrieved content",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+
+
+def _words(text: str) -> List[str]:
+    return WORD.findall((text or "").lower())
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _words(text)
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe(items: List[Dict], threshold: float = 0.85) -> List[Dict]:
+    """Drops results whose content mostly repeats an earlier result (Jaccard)."""
+    kept, kept_shingles = [], []
+    for item in items:
+        shingles = _shingles(item.get("content", ""))
+        if not shingles or shingles == {""}:
+            continue
+        if any(
+            len(shingles & other) / len(shingles | other) >= threshold
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(item)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def chunk(items: List[Dict], chunk_tokens: int = 200, overlap_tokens: int = 30):
+    """Splits each result on sentence boundaries into ~chunk_tokens pieces."""
+    chunks = []
+    for source, item in enumerate(items):
+        sentences = []
+        for sentence in SENTENCE_END.split(item.get("content", "")):
+            sentence = sentence.strip()
+            # a single sentence longer than a chunk is cut into pieces
+            while count_tokens(sentence) > chunk_tokens:
+                piece = truncate_tokens(sentence, chunk_tokens, suffix="")
+                sentences.append(piece)
+                sentence = sentence[len(piece) :].strip()
+            if sentence:
+                sentences.append(sentence)
+
+        current, tokens = [], 0
+        for sentence in sentences:
+            size = count_tokens(sentence)
+            if current and tokens + size > chunk_tokens:
+                chunks.append(_chunk(item, source, len(chunks), current))
+                # carry the tail over so a chunk doesn't start mid-thought
+                carried, carried_tokens = [], 0
+                for previous in reversed(current):
+                    carried_tokens += count_tokens(previous)
+                    if carried_tokens > overlap_tokens:
+                        break
+                    carried.insert(0, previous)
+                current, tokens = carried, sum(count_tokens(s) for s in carried)
+            current.append(sentence)
+            tokens += size
+        if current:
+            chunks.append(_chunk(item, source, len(chunks), current))
+    return chunks
+
+
+def _chunk(item: Dict, source: int, position: int, sentences: List[str]) -> Dict:
+    content = " ".join(sentences)
+    return {
+        "url": item.get("url", ""),
+        "content": content,
+        "source": source,
+        "position": position,
+        "tokens": count_tokens(content),
+    }
+
+
+def lexical_scores(query: str, texts: Sequence[str]) -> List[float]:
+    terms = {w for w in _words(query) if w not in STOPWORDS}
+    scores = []
+    for text in texts:
+        words = _words(text)
+        if not words or not terms:
+            scores.append(0.0)
+            continue
+        hits = sum(1 for w in words if w in terms)
+        scores.append(hits / len(words) ** 0.5)
+    return scores
+
+
+class ContextPacker:
+    """
+    Turns retrieved search results into the context of a generation prompt,
+    bounded by `token_budget` or the agent's entry in `agent_budgets`.
+    After an embedding error the rerank is lexical for `retry_backoff`
+    seconds, doubling up to `max_backoff`.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 1500,
+        chunk_tokens: int = 200,
+        overlap_tokens: int = 30,
+        dedupe_threshold: float = 0.85,
+        max_chunks_per_source: Optional[int] = 3,
+        embeddings: bool = True,
+        agent_budgets: Optional[Dict[str, int]] = None,
+        oversample: float = 2.0,
+        retry_backoff: float = 30.0,
+        max_backoff: float = 600.0,
+    ):
+        if chunk_tokens <= 0:
+            raise ValueError(f"chunk_tokens must be positive, got {chunk_tokens}")
+        self.token_budget = token_budget
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.max_chunks_per_source = max_chunks_per_source
+        self.use_embeddings = embeddings
+        self.agent_budgets = agent_budgets or {}
+        self.oversample = oversample
+        self.backoff = Backoff(retry_backoff, max_backoff)
+
+    def budget(self, agent: Optional[str] = None) -> int:
+        return self.agent_budgets.get(agent, self.token_budget)
+
+    def limit_searches(
+        self, queries: List[str], max_results: int, agent: Optional[str] = None
+    ) -> Tuple[List[str], int]:
+        """
+        Trims the queries / results per query to what the agent's budget
+        can hold (with `oversample` times headroom for the rerank), an agent
+        without budget gets no searches at all.
+        """
+        budget = self.budget(agent)
+        allowance = (
+            math.ceil(budget / self.chunk_tokens * self.oversample) if budget > 0 else 0
+        )
+        if not allowance:
+            skipped_searches.inc(len(queries), agent=agent or "")
+            return [], 0
+        max_results = max(1, min(max_results, allowance))
+        kept = queries[: max(1, allowance // max_results)]
+        if len(kept) < len(queries):
+            skipped_searches.inc(len(queries) - len(kept), agent=agent or "")
+        return kept, max_results
+
+    async def scores(self, query: str, chunks: List[Dict]) -> List[float]:
+        texts = [c["content"] for c in chunks]
+        if self.use_embeddings and self.backoff.available():
+            try:
+                vectors = await aembed([query] + texts)
+                scores = cosine_similarity(vectors[:1], vectors[1:])[0].tolist()
+            except Exception as e:
+                delay = self.backoff.failed()
+                logger.warning(
+                    "Embedding rerank unavailable, using lexical for %ss: %s", delay, e
+                )
+            else:
+                self.backoff.succeeded()
+                return scores
+        return await asyncio.to_thread(lexical_scores, query, texts)
+
+    async def pack(
+        self, query: str, items: List[Dict], token_budget: Optional[int] = None
+    ) -> List[Dict]:
+        start = time.perf_counter()
+        budget = token_budget or self.token_budget
+        candidates = chunk(
+            dedupe(items, self.dedupe_threshold),
+            self.chunk_tokens,
+            self.overlap_tokens,
+        )
+        if not candidates:
+            return []
+
+        scores = await self.scores(query, candidates)
+        packed, used, per_source = [], 0, {}
+        for score, candidate in sorted(
+            zip(scores, candidates), key=lambda pair: -pair[0]
+        ):
+            if used + candidate["tokens"] > budget:
+                continue
+            source = candidate["source"]
+            if per_source.get(source, 0) == self.max_chunks_per_source:
+                continue
+            per_source[source] = per_source.get(source, 0) + 1
+            packed.append({**candidate, "score": round(float(score), 4)})
+            used += candidate["tokens"]
+
+        packed_tokens.observe(
+            sum(count_tokens(i.get("content", "")) for i in items), stage="retrieved"
+        )
+        packed_tokens.observe(used, stage="packed")
+        packing_seconds.observe(time.perf_counter() - start)
+        # source order reads better than score order
+        return sorted(packed, key=lambda c: (c["source"], c["position"]))
+
+
+def number_sources(chunks: List[Dict]) -> List[Dict]:
+    """[{"id": 1, "url": ...}] for the sources of the chunks, in order of use."""
+    urls = list(dict.fromkeys(c["url"] for c in chunks))
+    return [{"id": i, "url": url} for i, url in enumerate(urls, 1)]
+
+
+def format_context(chunks: List[Dict], sources: Optional[List[Dict]] = None) -> str:
+    if sources is None:
+        return "\n\n".join(
+            f'url: {c["url"]}\ncontent: {c["content"]}' for c in chunks
+        )
+    ids = {s["url"]: s["id"] for s in sources}
+    return "\n\n".join(f'[{ids[c["url"]]}] {c["url"]}\n{c["content"]}' for c in chunks)
+
+
+def cited(text: str, sources: List[Dict]) -> List[Dict]:
+    """Sources referenced as [n] in the generated text."""
+    numbers = {int(n) for n in re.findall(r"\[(\d+)\]", text or "")}
+    return [s for s in sources if s["id"] in numbers]
+
+
+def format_sources(sources: List[Dict]) -> str:
+    return "Sources:\n" + "\n".join(f'[{s["id"]}] {s["url"]}' for s in sources)
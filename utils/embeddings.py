@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from typing import List, Sequence
+
+import numpy as np
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+logger = logging.getLogger(__name__)
+
+
+# ===================== Local Embeddings =====================
+# chromadb's default embedding function runs all-MiniLM-L6-v2 on onnxruntime,
+# one instance is shared by every component that needs local embeddings.
+
+_embedding_function = None
+
+
+def get_embedding_function():
+    global _embedding_function
+    if _embedding_function is None:
+        _embedding_function = DefaultEmbeddingFunction()
+    return _embedding_function
+
+
+def set_embedding_function(embedding_function):
+    """Swap the shared embedding function (any callable: List[str] -> vectors)."""
+    global _embedding_function
+    _embedding_function = embedding_function
+
+
+def embed(texts: Sequence[str]) -> np.ndarray:
+    vectors = get_embedding_function()(list(texts))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+async def aembed(texts: Sequence[str]) -> np.ndarray:
+    return await asyncio.to_thread(embed, texts)
+
+
+def cosine_similarity(queries: np.ndarray, documents: np.ndarray) -> np.ndarray:
+    """Both inputs are expected to be L2 normalized, as returned by `embed`."""
+    return np.atleast_2d(queries) @ np.atleast_2d(documents).T
+
+
+def to_list(vectors: np.ndarray) -> List[List[float]]:
+    return [vector.tolist() for vector in np.atleast_2d(vectors)]
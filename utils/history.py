@@ -0,0 +1,187 @@
+import time
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from utils import prompts
+from utils.prompt_builder import build_messages
+from utils.llm_limiter import llm_priority
+from utils.metrics import metrics
+from utils.tokens import count_message_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryManager:
+    """
+    Keeps the conversation history of a thread bounded: the latest turns
+    within `window` messages and `token_budget` tokens stay verbatim, older
+    ones are folded into `history_summary` by a background LLM call.
+
+    The summary is made off the hot path: `append` starts it and returns, the
+    next turn of the thread picks it up in `fold` if it has finished. Turns
+    waiting for their summary stay in the history until then. Pending
+    summaries only live in this process, after a restart or when the next
+    turn lands on another worker they are started again; once the history
+    reaches `hard_limit` times the window the summary is made inline, so
+    turns are never dropped unsummarized unless that call fails. At most
+    `max_pending` summaries are kept, for `pending_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        llm,
+        window: int = 6,
+        token_budget: int = 1500,
+        max_message_tokens: int = 400,
+        summary_max_tokens: int = 300,
+        hard_limit: float = 2.0,
+        max_pending: int = 1000,
+        pending_ttl: float = 3600.0,
+    ):
+        self.llm = llm
+        self.window = window
+        self.token_budget = token_budget
+        self.max_message_tokens = max_message_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.hard_limit = hard_limit
+        self.max_pending = max_pending
+        self.pending_ttl = pending_ttl
+        # thread_id -> (started at, task returning (summary, summarized turns))
+        self.pending: "OrderedDict[str, Tuple[float, asyncio.Task]]" = OrderedDict()
+
+        self.summaries = metrics.counter(
+            "history_summaries_total", "Background history summarizations"
+        )
+        self.dropped = metrics.counter(
+            "history_dropped_total", "Messages dropped without being summarized"
+        )
+
+    def _overflow(self, history: List[Dict]) -> int:
+        """Number of leading messages outside the window / token budget."""
+        keep, tokens = 0, 0
+        for message in reversed(history):
+            tokens += count_message_tokens([message])
+            if keep >= self.window or (keep and tokens > self.token_budget):
+                break
+            keep += 1
+        return len(history) - keep
+
+    async def _summarize(self, summary: str, turns: List[Dict]) -> Tuple[str, List]:
+        transcript = "\n".join(f'{m["role"]}: {m["content"]}' for m in turns)
+        messages = build_messages(
+            prompts.HISTORY_SUMMARY_PROMPT,
+            sections={
+                "Current summary": summary or "(empty)",
+                "Turns to merge": transcript,
+            },
+        )
+        # no callbacks: the calling node's stream would forward the summary
+        # tokens as part of its own reply
+        with llm_priority("batch"):
+            response = await self.llm.ainvoke(messages, config={"callbacks": []})
+        self.summaries.inc()
+        return truncate_tokens(response.content, self.summary_max_tokens), turns
+
+    def fold(
+        self, thread_id: str, history: List[Dict], summary: str
+    ) -> Tuple[List[Dict], str]:
+        """Apply the thread's finished background summary, if any."""
+        entry = self.pending.get(thread_id)
+        if entry is None or not entry[1].done():
+            return history, summary
+        task = self.pending.pop(thread_id)[1]
+        if task.cancelled() or task.exception() is not None:
+            logger.warning(
+                "History summary failed for %s: %s",
+                thread_id,
+                None if task.cancelled() else task.exception(),
+            )
+            return history, summary
+
+        new_summary, turns = task.result()
+        if history[: len(turns)] != turns:
+            # history was rewritten meanwhile, the summary no longer applies
+            return history, summary
+        return history[len(turns) :], new_summary
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.pending_ttl
+        expired = [
+            thread_id
+            for thread_id, (started_at, _) in self.pending.items()
+            if started_at < cutoff
+        ]
+        expired += list(self.pending)[: max(0, len(self.pending) - self.max_pending)]
+        for thread_id in expired:
+            entry = self.pending.pop(thread_id, None)
+            if entry is not None:
+                entry[1].cancel()
+
+    async def append(
+        self,
+        thread_id: str,
+        history: List[Dict],
+        summary: str,
+        *messages: Dict,
+    ) -> Tuple[List[Dict], str]:
+        """
+        Returns the history with the new messages and the summary, and starts
+        summarizing the messages that fell out of the window.
+        """
+        history = list(history or []) + [
+            {
+                "role": m["role"],
+                "content": truncate_tokens(m["content"], self.max_message_tokens),
+            }
+            for m in messages
+        ]
+        overflow = self._overflow(history)
+        if not overflow:
+            return history, summary
+
+        hard_window = int(self.window * self.hard_limit)
+        if len(history) > hard_window:
+            # the background summary never came back (restart, other worker
+            # or still running), summarize inline rather than lose the turns
+            entry = self.pending.pop(thread_id, None)
+            if entry is not None:
+                entry[1].cancel()
+            try:
+                summary, _ = await self._summarize(summary, history[:overflow])
+                return history[overflow:], summary
+            except Exception as e:
+                dropped = len(history) - hard_window
+                self.dropped.inc(dropped)
+                logger.warning(
+                    "Dropped %s history messages of %s, summary failed: %s",
+                    dropped,
+                    thread_id,
+                    e,
+                )
+                history = history[dropped:]
+                overflow -= dropped
+
+        if overflow > 0 and thread_id not in self.pending:
+            self.pending[thread_id] = (
+                time.monotonic(),
+                asyncio.create_task(
+                    self._summarize(summary, history[:overflow]),
+                    context=contextvars.Context(),
+                ),
+            )
+            self._evict()
+        return history, summary
+
+    def context(self, history: List[Dict], summary: str) -> Tuple[Optional[str], List]:
+        """Summary and the latest messages that fit the window and budget."""
+        return summary or None, history[self._overflow(history) :]
+
+    async def close(self):
+        tasks = [task for _, task in self.pending.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.pending.clear()
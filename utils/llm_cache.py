@@ -0,0 +1,243 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import chromadb
+from chromadb.config import Settings
+from langchain_core.messages import SystemMessage
+
+from utils.backoff import Backoff
+from utils.embeddings import aembed, to_list
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+cache_lookups = metrics.counter(
+    "llm_cache_lookups_total", "Structured LLM calls answered from the cache or not"
+)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def _split_messages(messages) -> Tuple[str, str]:
+    system, user = [], []
+    for message in messages:
+        target = system if isinstance(message, SystemMessage) else user
+        content = message.content
+        target.append(content if isinstance(content, str) else json.dumps(content))
+    return "\n".join(system), "\n".join(user)
+
+
+class LLMResponseCache:
+    """
+    Response cache for structured LLM calls.
+    Exact tier: LRU keyed on (model, system prompt, normalized user text, schema).
+    Semantic tier: chromadb collection of user texts, a nearest neighbour within
+    `similarity_threshold` under the same (model, system prompt, schema) is a hit.
+    Only the schemas in `semantic_schemas` use it, a near-identical plan must
+    not get another plan's cost estimates. After an embedding or chromadb
+    error the tier is skipped for `retry_backoff` seconds, doubling up to
+    `max_backoff`. The collection holds at most `semantic_max_entries`
+    texts, past that the oldest tenth is deleted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        semantic: bool = True,
+        similarity_threshold: float = 0.92,
+        persist_path: Optional[str] = None,
+        collection_name: str = "llm_response_cache",
+        semantic_schemas: Iterable[str] = ("MainRouter", "Query"),
+        retry_backoff: float = 30.0,
+        max_backoff: float = 600.0,
+        semantic_max_entries: int = 10000,
+    ):
+        self.max_entries = max_entries
+        self.semantic_max_entries = semantic_max_entries
+        self.similarity_threshold = similarity_threshold
+        self.exact: "OrderedDict[str, Dict]" = OrderedDict()
+        self.semantic = semantic
+        self.semantic_schemas = set(semantic_schemas)
+        self.backoff = Backoff(retry_backoff, max_backoff)
+        self.persist_path = persist_path
+        self.collection_name = collection_name
+        self.collection = None
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    def _get_collection(self):
+        if self.collection is None:
+            settings = Settings(anonymized_telemetry=False)
+            client = (
+                chromadb.PersistentClient(path=self.persist_path, settings=settings)
+                if self.persist_path
+                else chromadb.EphemeralClient(settings=settings)
+            )
+            self.collection = client.get_or_create_collection(
+                name=self.collection_name, metadata={"hnsw:space": "cosine"}
+            )
+        return self.collection
+
+    def _prune(self) -> int:
+        """Deletes the oldest semantic entries once the collection is over its cap."""
+        collection = self._get_collection()
+        count = collection.count()
+        if count <= self.semantic_max_entries:
+            return 0
+        entries = collection.get(include=["metadatas"])
+        oldest = sorted(
+            zip(entries["ids"], entries["metadatas"]),
+            key=lambda entry: (entry[1] or {}).get("created_at", 0.0),
+        )
+        keep = self.semantic_max_entries - self.semantic_max_entries // 10
+        ids = [id_ for id_, _ in oldest[: count - keep]]
+        collection.delete(ids=ids)
+        return len(ids)
+
+    @staticmethod
+    def namespace(model: str, system: str, schema_name: str) -> str:
+        payload = json.dumps([model, system, schema_name])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def exact_key(namespace: str, user: str) -> str:
+        payload = json.dumps([namespace, _normalize(user)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _semantic(self, schema_name: str) -> bool:
+        return (
+            self.semantic
+            and schema_name in self.semantic_schemas
+            and self.backoff.available()
+        )
+
+    def _semantic_failed(self, action: str, e: Exception):
+        delay = self.backoff.failed()
+        logger.warning(
+            "Semantic LLM cache %s failed, skipping it for %ss: %s", action, delay, e
+        )
+
+    async def get(self, namespace: str, user: str, schema_name: str) -> Optional[Dict]:
+        key = self.exact_key(namespace, user)
+        if key in self.exact:
+            self.exact.move_to_end(key)
+            self.hits["exact"] += 1
+            return self.exact[key]
+
+        if self._semantic(schema_name):
+            try:
+                embedding = await aembed([_normalize(user)])
+                result = await asyncio.to_thread(
+                    self._get_collection().query,
+                    query_embeddings=to_list(embedding),
+                    n_results=1,
+                    where={"namespace": namespace},
+                )
+                self.backoff.succeeded()
+                if result["ids"] and result["ids"][0]:
+                    similarity = 1.0 - result["distances"][0][0]
+                    if similarity >= self.similarity_threshold:
+                        self.hits["semantic"] += 1
+                        return json.loads(result["metadatas"][0][0]["response"])
+            except Exception as e:
+                self._semantic_failed("lookup", e)
+
+        self.misses += 1
+        return None
+
+    async def set(self, namespace: str, user: str, schema_name: str, response: Dict):
+        key = self.exact_key(namespace, user)
+        self.exact[key] = response
+        self.exact.move_to_end(key)
+        while len(self.exact) > self.max_entries:
+            self.exact.popitem(last=False)
+
+        if self._semantic(schema_name):
+            try:
+                embedding = await aembed([_normalize(user)])
+                await asyncio.to_thread(
+                    self._get_collection().upsert,
+                    ids=[key],
+                    embeddings=to_list(embedding),
+                    documents=[_normalize(user)],
+                    metadatas=[
+                        {
+                            "namespace": namespace,
+                            "response": json.dumps(response),
+                            "created_at": time.time(),
+                        }
+                    ],
+                )
+                await asyncio.to_thread(self._prune)
+                self.backoff.succeeded()
+            except Exception as e:
+                self._semantic_failed("write", e)
+
+    def stats(self) -> Dict:
+        lookups = self.hits["exact"] + self.hits["semantic"] + self.misses
+        return {
+            "exact_hits": self.hits["exact"],
+            "semantic_hits": self.hits["semantic"],
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "exact_entries": len(self.exact),
+        }
+
+
+class CachedStructuredLLM:
+    def __init__(self, runnable, schema, cache: LLMResponseCache, model: str):
+        self.runnable = runnable
+        self.schema = schema
+        self.cache = cache
+        self.model = model
+
+    async def ainvoke(self, messages, config=None, **kwargs) -> Any:
+        system, user = _split_messages(messages)
+        namespace = self.cache.namespace(self.model, system, self.schema.__name__)
+
+        cached = await self.cache.get(namespace, user, self.schema.__name__)
+        cache_lookups.inc(
+            schema=self.schema.__name__, outcome="miss" if cached is None else "hit"
+        )
+        if cached is not None:
+            return self.schema.model_validate(cached)
+
+        response = await self.runnable.ainvoke(messages, config=config, **kwargs)
+        await self.cache.set(
+            namespace, user, self.schema.__name__, response.model_dump()
+        )
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.runnable, name)
+
+
+class CachedLLM:
+    """
+    Wraps a chat model so `with_structured_output(...)` calls go through the
+    response cache, everything else is passed to the wrapped model untouched.
+    """
+
+    def __init__(self, llm, cache: LLMResponseCache):
+        self.llm = llm
+        self.cache = cache
+        self.model = getattr(llm, "model", type(llm).__name__)
+
+    def with_structured_output(self, schema, **kwargs):
+        runnable = self.llm.with_structured_output(schema, **kwargs)
+        if kwargs.get("include_raw") or not (
+            isinstance(schema, type) and hasattr(schema, "model_validate")
+        ):
+            return runnable
+        return CachedStructuredLLM(runnable, schema, self.cache, self.model)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
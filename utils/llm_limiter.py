@@ -0,0 +1,133 @@
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Union
+
+from utils.metrics import metrics
+
+# lower value is served first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+_llm_priority = contextvars.ContextVar("llm_priority", default="batch")
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """Run the LLM calls made inside the block with the given priority class."""
+    token = _llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        _llm_priority.reset(token)
+
+
+class LLMQueueTimeout(Exception):
+    pass
+
+
+class PriorityLimiter:
+    """
+    Caps in-flight LLM calls, waiters are served by priority class then
+    arrival order, and give up after the queue timeout of their class.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        queue_timeout: Union[float, Dict[str, float], None] = None,
+    ):
+        self.max_in_flight = max_in_flight
+        if not isinstance(queue_timeout, dict):
+            queue_timeout = {name: queue_timeout for name in PRIORITIES}
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiters = []
+        self.counter = itertools.count()
+
+        self.in_flight_gauge = metrics.gauge("llm_in_flight", "LLM calls in flight")
+        self.queued_gauge = metrics.gauge(
+            "llm_queue_depth", "LLM calls waiting for a slot"
+        )
+        self.wait_time = metrics.histogram(
+            "llm_queue_wait_seconds", "Time LLM calls waited for a slot"
+        )
+        self.rejections = metrics.counter(
+            "llm_queue_rejections_total", "LLM calls rejected after the queue timeout"
+        )
+
+    async def acquire(self, priority: str):
+        start = time.perf_counter()
+        if self.in_flight < self.max_in_flight and not self.waiters:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(
+                self.waiters,
+                (PRIORITIES.get(priority, len(PRIORITIES)), next(self.counter), future),
+            )
+            self.queued_gauge.inc(priority=priority)
+            try:
+                await asyncio.wait_for(future, self.queue_timeout.get(priority))
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # the slot was handed over while we were giving up
+                    self.release()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejections.inc(priority=priority)
+                    raise LLMQueueTimeout(
+                        f"LLM queue timeout after {time.perf_counter() - start:.1f}s "
+                        f"({priority} priority, {self.in_flight} calls in flight)"
+                    )
+                raise
+            finally:
+                self.queued_gauge.dec(priority=priority)
+
+        self.wait_time.observe(time.perf_counter() - start, priority=priority)
+        self.in_flight_gauge.set(self.in_flight)
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                # hand the slot straight to the next waiter
+                future.set_result(True)
+                return
+        self.in_flight -= 1
+        self.in_flight_gauge.set(self.in_flight)
+
+
+class ConcurrencyLimitedLLM:
+    """
+    Wraps the shared chat model so every ainvoke / astream call, structured
+    or not, holds a limiter slot while it runs.
+    """
+
+    def __init__(self, llm, limiter: PriorityLimiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    async def ainvoke(self, *args, **kwargs):
+        await self.limiter.acquire(_llm_priority.get())
+        try:
+            return await self.llm.ainvoke(*args, **kwargs)
+        finally:
+            self.limiter.release()
+
+    async def astream(self, *args, **kwargs):
+        await self.limiter.acquire(_llm_priority.get())
+        try:
+            async for chunk in self.llm.astream(*args, **kwargs):
+                yield chunk
+        finally:
+            self.limiter.release()
+
+    def with_structured_output(self, schema, **kwargs):
+        return ConcurrencyLimitedLLM(
+            self.llm.with_structured_output(schema, **kwargs), self.limiter
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
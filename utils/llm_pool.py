@@ -0,0 +1,302 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_ollama import ChatOllama
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import HumanMessage
+from pydantic import ValidationError
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# errors caused by the model output, retrying on another endpoint won't help
+NON_RETRYABLE = (OutputParserException, ValidationError)
+
+HEALTH_PATHS = {"ollama": "/api/version", "vllm": "/health"}
+
+
+def _make_llm(backend: str, model: str, base_url: Optional[str], options: Dict):
+    if backend == "ollama":
+        # keep_alive keeps the model (and its prompt cache) loaded between
+        # calls, a num_ctx that differs between calls forces a reload
+        return ChatOllama(model=model, base_url=base_url, **options)
+    if backend == "vllm":
+        # vLLM serves the OpenAI API, langchain-openai is only needed for this backend
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            model=model,
+            base_url=f"{base_url.rstrip('/')}/v1",
+            api_key=options.pop("api_key", "EMPTY"),
+            **options,
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+class Endpoint:
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        backend: str = "ollama",
+        base_url: Optional[str] = None,
+        weight: float = 1.0,
+        health_path: Optional[str] = None,
+        options: Optional[Dict] = None,
+        callbacks: Optional[List] = None,
+    ):
+        self.name = name
+        self.model = model
+        self.backend = backend
+        self.base_url = base_url or "http://localhost:11434"
+        self.weight = weight
+        self.health_path = health_path or HEALTH_PATHS.get(backend, "/")
+        options = dict(options or {})
+        if callbacks:
+            options["callbacks"] = callbacks
+        self.llm = _make_llm(backend, model, self.base_url, options)
+        self.structured: Dict[Any, Any] = {}
+        self.outstanding = 0
+        self.healthy = True
+        self.unhealthy_since = 0.0
+
+    def structured_llm(self, schema, kwargs: Dict):
+        key = (schema, tuple(sorted(kwargs.items())))
+        if key not in self.structured:
+            self.structured[key] = self.llm.with_structured_output(schema, **kwargs)
+        return self.structured[key]
+
+
+class LLMPool:
+    """
+    Pool of inference endpoints (Ollama or vLLM) behind one chat model
+    interface. Calls go to the healthy endpoint with the fewest outstanding
+    requests per unit of weight, and fail over to the next endpoint on error.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Dict],
+        health_check_interval: float = 15.0,
+        failure_cooldown: float = 30.0,
+        health_check_timeout: float = 2.0,
+        options: Optional[Dict] = None,
+        callbacks: Optional[List] = None,
+    ):
+        if not endpoints:
+            raise ValueError("LLMPool needs at least one endpoint")
+        # `options` are the defaults for every endpoint of the same backend
+        self.endpoints = [
+            Endpoint(
+                **{
+                    **endpoint,
+                    "options": {
+                        **(options or {}).get(endpoint.get("backend", "ollama"), {}),
+                        **endpoint.get("options", {}),
+                    },
+                },
+                callbacks=callbacks,
+            )
+            for endpoint in endpoints
+        ]
+        self.model = "|".join(sorted({e.model for e in self.endpoints}))
+        self.health_check_interval = health_check_interval
+        self.failure_cooldown = failure_cooldown
+        self.health_check_timeout = health_check_timeout
+        self.health_task: Optional[asyncio.Task] = None
+
+        self.outstanding = metrics.gauge(
+            "llm_endpoint_outstanding", "Requests in flight per endpoint"
+        )
+        self.healthy = metrics.gauge(
+            "llm_endpoint_healthy", "1 when the endpoint passes health checks"
+        )
+        self.requests = metrics.counter(
+            "llm_endpoint_requests_total", "Requests per endpoint and outcome"
+        )
+        self.failovers = metrics.counter(
+            "llm_failovers_total", "Requests retried on another endpoint"
+        )
+        for endpoint in self.endpoints:
+            self.healthy.set(1, endpoint=endpoint.name)
+
+    # ---------------- selection ----------------
+
+    def _available(self, tried: set) -> List[Endpoint]:
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.name not in tried]
+        available = [
+            e
+            for e in candidates
+            if e.healthy or now - e.unhealthy_since > self.failure_cooldown
+        ]
+        if not available and candidates:
+            # everything is down, try the one that failed longest ago
+            available = [min(candidates, key=lambda e: e.unhealthy_since)]
+        return available
+
+    def select(self, tried: Optional[set] = None) -> Optional[Endpoint]:
+        available = self._available(tried or set())
+        if not available:
+            return None
+
+        def load(endpoint: Endpoint) -> float:
+            return (endpoint.outstanding + 1) / endpoint.weight
+
+        best = min(load(e) for e in available)
+        return random.choice([e for e in available if load(e) == best])
+
+    def _mark(self, endpoint: Endpoint, healthy: bool):
+        if not healthy:
+            if endpoint.healthy:
+                logger.warning("LLM endpoint %s marked unhealthy", endpoint.name)
+            # every failure restarts the cooldown, a still dead endpoint is
+            # retried once per cooldown rather than on every call after it
+            endpoint.unhealthy_since = time.monotonic()
+        elif not endpoint.healthy:
+            logger.info("LLM endpoint %s is healthy again", endpoint.name)
+        endpoint.healthy = healthy
+        self.healthy.set(1 if healthy else 0, endpoint=endpoint.name)
+
+    # ---------------- calls ----------------
+
+    async def _call(self, get_runnable, method: str, *args, **kwargs):
+        tried = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self.select(tried)
+            if endpoint is None:
+                raise last_error
+            if tried:
+                self.failovers.inc()
+            tried.add(endpoint.name)
+
+            endpoint.outstanding += 1
+            self.outstanding.set(endpoint.outstanding, endpoint=endpoint.name)
+            try:
+                result = await getattr(get_runnable(endpoint), method)(*args, **kwargs)
+                self.requests.inc(endpoint=endpoint.name, outcome="ok")
+                self._mark(endpoint, True)
+                return result
+            except NON_RETRYABLE:
+                self.requests.inc(endpoint=endpoint.name, outcome="bad_output")
+                raise
+            except Exception as e:
+                logger.warning("LLM endpoint %s failed: %s", endpoint.name, e)
+                self.requests.inc(endpoint=endpoint.name, outcome="error")
+                self._mark(endpoint, False)
+                last_error = e
+            finally:
+                endpoint.outstanding -= 1
+                self.outstanding.set(endpoint.outstanding, endpoint=endpoint.name)
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self._call(lambda e: e.llm, "ainvoke", *args, **kwargs)
+
+    async def astream(self, *args, **kwargs):
+        # no failover for streams, tokens may already have reached the caller
+        endpoint = self.select()
+        endpoint.outstanding += 1
+        try:
+            async for chunk in endpoint.llm.astream(*args, **kwargs):
+                yield chunk
+            self._mark(endpoint, True)
+        except NON_RETRYABLE:
+            raise
+        except Exception:
+            self._mark(endpoint, False)
+            raise
+        finally:
+            endpoint.outstanding -= 1
+
+    def with_structured_output(self, schema, **kwargs):
+        return PooledStructuredLLM(self, schema, kwargs)
+
+    async def warmup(self, prompt: str = "Reply with OK.") -> Dict[str, Any]:
+        """
+        One short generation per endpoint so the model is loaded, and kept
+        loaded by keep_alive, before the first request. Returns the seconds
+        each endpoint took or its error.
+        """
+
+        async def warm(endpoint: Endpoint):
+            start = time.perf_counter()
+            try:
+                await endpoint.llm.ainvoke([HumanMessage(content=prompt)])
+            except Exception as e:
+                logger.warning("Warm-up of LLM endpoint %s failed: %s", endpoint.name, e)
+                self._mark(endpoint, False)
+                return endpoint.name, f"failed: {e}"
+            self._mark(endpoint, True)
+            return endpoint.name, round(time.perf_counter() - start, 3)
+
+        return dict(await asyncio.gather(*(warm(e) for e in self.endpoints)))
+
+    # ---------------- health checks ----------------
+
+    async def check_health(self):
+        async with httpx.AsyncClient(timeout=self.health_check_timeout) as client:
+            responses = await asyncio.gather(
+                *[
+                    client.get(f"{e.base_url.rstrip('/')}{e.health_path}")
+                    for e in self.endpoints
+                ],
+                return_exceptions=True,
+            )
+        for endpoint, response in zip(self.endpoints, responses):
+            healthy = (
+                not isinstance(response, Exception) and response.status_code == 200
+            )
+            self._mark(endpoint, healthy)
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.warning("LLM health check failed: %s", e)
+            await asyncio.sleep(self.health_check_interval)
+
+    async def start(self):
+        if self.health_task is None and self.health_check_interval:
+            self.health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+            await asyncio.gather(self.health_task, return_exceptions=True)
+            self.health_task = None
+
+    def status(self) -> List[Dict]:
+        return [
+            {
+                "name": e.name,
+                "backend": e.backend,
+                "base_url": e.base_url,
+                "model": e.model,
+                "weight": e.weight,
+                "healthy": e.healthy,
+                "outstanding": e.outstanding,
+            }
+            for e in self.endpoints
+        ]
+
+
+class PooledStructuredLLM:
+    def __init__(self, pool: LLMPool, schema, kwargs: Dict):
+        self.pool = pool
+        self.schema = schema
+        self.kwargs = kwargs
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self.pool._call(
+            lambda e: e.structured_llm(self.schema, self.kwargs),
+            "ainvoke",
+            *args,
+            **kwargs,
+        )
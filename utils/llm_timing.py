@@ -0,0 +1,107 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120)
+
+
+class LLMTimingCallback(BaseCallbackHandler):
+    """
+    Splits every chat model call into prefill (prompt processing) and decode
+    (generation) time per graph node. Ollama reports both durations and the
+    number of prompt tokens it actually evaluated, a drop of the latter means
+    the server reused a cached prefix. Other backends are timed from the
+    first streamed token, calls that don't stream only get a total.
+    Calls that never report an end (cancelled runs, closed streams) are
+    dropped after `stale_after` seconds or beyond `max_runs` in flight.
+    """
+
+    # timestamps must be taken when the event happens, not in an executor
+    run_inline = True
+
+    def __init__(self, max_runs: int = 1000, stale_after: float = 600.0):
+        self.max_runs = max_runs
+        self.stale_after = stale_after
+        # in start order, the oldest call is always first
+        self.runs: "OrderedDict[UUID, Dict[str, Any]]" = OrderedDict()
+        self.prefill = metrics.histogram(
+            "llm_prefill_seconds", "Prompt processing time", buckets=LATENCY_BUCKETS
+        )
+        self.decode = metrics.histogram(
+            "llm_decode_seconds", "Generation time", buckets=LATENCY_BUCKETS
+        )
+        self.total = metrics.histogram(
+            "llm_call_seconds", "Wall time of LLM calls", buckets=LATENCY_BUCKETS
+        )
+        self.prompt_tokens = metrics.counter(
+            "llm_prefill_tokens_total", "Prompt tokens evaluated by the server"
+        )
+        self.completion_tokens = metrics.counter(
+            "llm_completion_tokens_total", "Tokens generated"
+        )
+
+    def on_chat_model_start(
+        self,
+        serialized,
+        messages,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ):
+        now = time.perf_counter()
+        self.runs[run_id] = {
+            "node": (metadata or {}).get("langgraph_node", "none"),
+            "start": now,
+            "first_token": None,
+        }
+        while self.runs and (
+            len(self.runs) > self.max_runs
+            or next(iter(self.runs.values()))["start"] < now - self.stale_after
+        ):
+            self.runs.popitem(last=False)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self.runs.get(run_id)
+        if run is not None and run["first_token"] is None:
+            run["first_token"] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            return
+        end, node = time.perf_counter(), run["node"]
+        self.total.observe(end - run["start"], node=node)
+
+        info = self._ollama_info(response)
+        if info.get("prompt_eval_duration") is not None:
+            self.prefill.observe(info["prompt_eval_duration"] / 1e9, node=node)
+            self.decode.observe(info.get("eval_duration", 0) / 1e9, node=node)
+            self.prompt_tokens.inc(info.get("prompt_eval_count") or 0, node=node)
+            self.completion_tokens.inc(info.get("eval_count") or 0, node=node)
+        elif run["first_token"] is not None:
+            self.prefill.observe(run["first_token"] - run["start"], node=node)
+            self.decode.observe(end - run["first_token"], node=node)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self.runs.pop(run_id, None)
+
+    @staticmethod
+    def _ollama_info(response) -> Dict[str, Any]:
+        try:
+            generation = response.generations[0][0]
+        except (IndexError, AttributeError):
+            return {}
+        info = dict(generation.generation_info or {})
+        message = getattr(generation, "message", None)
+        if message is not None:
+            info.update(getattr(message, "response_metadata", {}) or {})
+        return info
@@ -0,0 +1,187 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+# ===================== In-process Metrics =====================
+# Small process-wide registry of counters, gauges and histograms,
+# every component records into `metrics` and readers take a snapshot().
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.values: Dict[LabelKey, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0.0)
+
+    def snapshot(self) -> Dict:
+        # worker threads (asyncio.to_thread) record while /metrics reads
+        with self.lock:
+            items = list(self.values.items())
+        values = [{"labels": dict(key), "value": value} for key, value in items]
+        return {"type": "counter", "values": values}
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self) -> Dict:
+        snapshot = super().snapshot()
+        snapshot["type"] = "gauge"
+        return snapshot
+
+
+class Histogram:
+    def __init__(
+        self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[LabelKey, Dict] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.values.setdefault(
+                key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            items = [
+                (key, {**series, "buckets": list(series["buckets"])})
+                for key, series in self.values.items()
+            ]
+        values = []
+        for key, series in items:
+            count = series["count"]
+            values.append(
+                {
+                    "labels": dict(key),
+                    "count": count,
+                    "sum": series["sum"],
+                    "mean": series["sum"] / count if count else 0.0,
+                    "buckets": dict(zip(self.buckets, series["buckets"])),
+                }
+            )
+        return {"type": "histogram", "values": values}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(
+        self,
+        name: str,
+        description: str = "",
+        buckets: Optional[Sequence[float]] = None,
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, description, buckets or DEFAULT_BUCKETS
+        )
+
+    def _metrics(self):
+        with self.lock:
+            return list(self.metrics.items())
+
+    def snapshot(self) -> Dict:
+        return {name: metric.snapshot() for name, metric in self._metrics()}
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for name, metric in sorted(self._metrics()):
+            snapshot = metric.snapshot()
+            if metric.description:
+                lines.append(f"# HELP {name} {_escape_help(metric.description)}")
+            lines.append(f"# TYPE {name} {snapshot['type']}")
+            for series in snapshot["values"]:
+                labels = series["labels"]
+                if snapshot["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(series['value'])}")
+                    continue
+                # bucket counts are cumulative already, see Histogram.observe
+                for bound, count in series["buckets"].items():
+                    bucket_labels = _labels({**labels, "le": _number(bound)})
+                    lines.append(f"{name}_bucket{bucket_labels} {count}")
+                inf_labels = _labels({**labels, "le": "+Inf"})
+                lines.append(f"{name}_bucket{inf_labels} {series['count']}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(series['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {series['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = _escape_help(str(value)).replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value != value or value in (float("inf"), float("-inf")):
+        return {"inf": "+Inf", "-inf": "-Inf"}.get(str(value), "NaN")
+    return str(int(value)) if value == int(value) else repr(float(value))
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,53 @@
+import re
+from typing import Dict, List, Union
+
+# PLANNER_PROMPT emits lines like:
+# 1. step: ...  || time stamp: ... || dependency : ...
+STEP_LINE = re.compile(r"^\s*(?:[-*]\s*)?(\d+)\s*[.)]\s*(.+?)\s*$")
+FIELD = re.compile(
+    r"^\s*\**\s*(step|time\s*stamp|dependency|dependencies)\s*\**\s*:\s*\**\s*", re.I
+)
+
+
+def _field_name(raw: str) -> str:
+    raw = re.sub(r"\s+", " ", raw.lower())
+    if raw.startswith("time"):
+        return "time"
+    if raw.startswith("depend"):
+        return "dependency"
+    return "step"
+
+
+def parse_plan_steps(plan: Union[str, List[str]]) -> List[Dict]:
+    """
+    Parse the numbered plan into a list of
+    {"number": int, "step": str, "time": str, "dependency": str}.
+    Lines that are not numbered steps are ignored.
+    """
+    text = "\n".join(plan) if isinstance(plan, list) else (plan or "")
+
+    steps = []
+    for line in text.splitlines():
+        match = STEP_LINE.match(line)
+        if not match:
+            continue
+        step = {"number": int(match.group(1)), "step": "", "time": "", "dependency": ""}
+        for i, part in enumerate(match.group(2).split("||")):
+            field = FIELD.match(part)
+            name = _field_name(field.group(1)) if field else ("step" if i == 0 else "")
+            if name:
+                value = part[field.end():] if field else part
+                # markdown bold around the value, "**Step:** x" or "**x**"
+                step[name] = value.strip().strip("*").strip()
+        if step["step"]:
+            steps.append(step)
+    return steps
+
+
+def format_steps(steps: List[Dict]) -> str:
+    return "\n".join(f'{s["number"]}. {s["step"]}' for s in steps)
+
+
+def chunk_steps(steps: List[Dict], chunk_size: int) -> List[List[Dict]]:
+    chunk_size = max(1, chunk_size)
+    return [steps[i : i + chunk_size] for i in range(0, len(steps), chunk_size)]
@@ -0,0 +1,41 @@
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+# ===================== Prompt Assembly =====================
+# Inference servers reuse the KV cache of the longest prompt prefix they have
+# already seen, so every prompt is laid out from most to least static:
+#   system prompt (same for every call of the agent)
+#   -> conversation summary / history (append-only within a thread)
+#   -> project task (same for every call of the thread)
+#   -> sections (search results, steps, ...) that change from call to call
+# and each part is rendered the same way byte for byte.
+
+
+def _clean(text: str) -> str:
+    # trailing spaces and stray newlines would break byte-identical prefixes
+    return "\n".join(line.rstrip() for line in (text or "").strip().splitlines())
+
+
+def build_messages(
+    system: str,
+    task: Optional[str] = None,
+    sections: Optional[Dict[str, str]] = None,
+    history: Sequence[BaseMessage] = (),
+    summary: Optional[str] = None,
+) -> List[BaseMessage]:
+    messages: List[BaseMessage] = [SystemMessage(content=_clean(system))]
+    if summary:
+        messages.append(
+            SystemMessage(content=f"Earlier conversation summary:\n{_clean(summary)}")
+        )
+    messages.extend(history)
+
+    parts = []
+    if task is not None:
+        parts.append(f"Project:\n{_clean(task)}")
+    for title, body in (sections or {}).items():
+        if body:
+            parts.append(f"{title}:\n{_clean(body)}")
+    messages.append(HumanMessage(content="\n\n".join(parts)))
+    return messages
@@ -0,0 +1,283 @@
+import re
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from agents import states
+from utils import prompts
+from utils.prompt_builder import build_messages
+from utils.backoff import Backoff
+from utils.embeddings import aembed, embed, cosine_similarity
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("planner_agent", "market_study_agent", "chat")
+
+KEYWORD_RULES = {
+    "planner_agent": [
+        r"\bplan(ning)?\b",
+        r"\brenovat",
+        r"\bfinishing\b",
+        r"\b(build|construct)",
+        r"\bfit[- ]?out\b",
+        r"\binstall",
+        r"\bschedule\b",
+        r"\btimeline\b",
+        r"\bestimat",
+        r"\bbudget\b",
+        r"\bi (want|need|would like) to (do|build|renovate|start|design|open|make|set up|organi[sz]e)\b",
+    ],
+    "market_study_agent": [
+        r"\bmarket (study|research|analysis|trends?)\b",
+        r"\bcompetitors?\b",
+        r"\bcompetition analysis\b",
+        r"\bfeasibility study\b",
+        r"\btarget (audience|customers)\b",
+    ],
+    "chat": [
+        r"^\s*(hi|hello|hey|thanks|thank you)\b",
+        r"^\s*(what|why|how|who|when|can you|could you)\b.*\?\s*$",
+        r"\bexplain\b",
+        r"\bwhat do you mean\b",
+    ],
+}
+
+EXAMPLES = {
+    "planner_agent": [
+        "I want to do finishing works to my room",
+        "Plan the renovation of my kitchen",
+        "I need a plan to build a small house",
+        "Help me organise the fit-out of a new office",
+        "Create a project plan to open a restaurant",
+        "Schedule and estimate the cost of painting my flat",
+    ],
+    "market_study_agent": [
+        "Do a market study for a coffee shop in my city",
+        "Who are the competitors for a mobile car wash business",
+        "What are the market trends for electric bikes",
+        "Is there demand for a co-working space in this area",
+        "Analyze the market for handmade furniture",
+    ],
+    "chat": [
+        "Hello, how are you",
+        "Can you explain what a critical path is",
+        "Thanks, that was helpful",
+        "What did you mean by the second step",
+        "Give me some ideas for my project",
+    ],
+}
+
+
+class RouteDecision(BaseModel):
+    next_node: str
+    confidence: float
+    source: str
+    scores: Dict[str, float] = {}
+
+
+# decisions made up front by route_many for the runs of one batch, only the
+# tasks started inside `routed` see them
+_routed: contextvars.ContextVar[Optional[Dict[str, RouteDecision]]] = (
+    contextvars.ContextVar("routed", default=None)
+)
+
+
+@contextmanager
+def routed(decisions: Dict[str, RouteDecision]):
+    """Runs started inside the block reuse these decisions for their texts."""
+    token = _routed.set(decisions)
+    try:
+        yield
+    finally:
+        _routed.reset(token)
+
+
+class IntentRouter:
+    """
+    Local router in front of the MANAGER_PROMPT call.
+    Keyword rules and a nearest-centroid classifier over local embeddings
+    score every route, the LLM is only asked when the best score is below
+    `confidence_threshold`. After an embedding error the classifier is
+    skipped for `retry_backoff` seconds, doubling up to `max_backoff`, and
+    routing falls back to the rules.
+    """
+
+    def __init__(
+        self,
+        llm,
+        confidence_threshold: float = 0.7,
+        rule_weight: float = 0.5,
+        embeddings: bool = True,
+        temperature: float = 0.05,
+        examples: Optional[Dict[str, List[str]]] = None,
+        retry_backoff: float = 30.0,
+        max_backoff: float = 600.0,
+    ):
+        self.llm = llm
+        self.confidence_threshold = confidence_threshold
+        self.rule_weight = rule_weight
+        self.use_embeddings = embeddings
+        self.backoff = Backoff(retry_backoff, max_backoff)
+        self.temperature = temperature
+        self.examples = {route: list(EXAMPLES[route]) for route in ROUTES}
+        for route, extra in (examples or {}).items():
+            self.examples.setdefault(route, []).extend(extra)
+        self.rules = {
+            route: [re.compile(p, re.IGNORECASE) for p in patterns]
+            for route, patterns in KEYWORD_RULES.items()
+        }
+        self.centroids: Optional[np.ndarray] = None
+        self.lock = asyncio.Lock()
+
+        self.decisions = metrics.counter(
+            "router_decisions_total", "Routing decisions by route and source"
+        )
+        self.confidence = metrics.histogram(
+            "router_confidence",
+            "Confidence of the winning route",
+            buckets=(0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0),
+        )
+        self.latency = metrics.histogram(
+            "router_latency_seconds", "Time spent routing a request"
+        )
+
+    def warmup(self):
+        if self.centroids is None and self.use_embeddings:
+            centroids = []
+            for route in ROUTES:
+                vectors = embed(self.examples[route])
+                centroid = vectors.mean(axis=0)
+                centroids.append(centroid / np.linalg.norm(centroid))
+            self.centroids = np.stack(centroids)
+
+    def _rule_scores(self, text: str) -> Optional[Dict[str, float]]:
+        hits = {
+            route: sum(1 for rule in rules if rule.search(text))
+            for route, rules in self.rules.items()
+        }
+        total = sum(hits.values())
+        if not total:
+            return None
+        return {route: hits[route] / total for route in ROUTES}
+
+    async def _embedding_scores(
+        self, texts: List[str]
+    ) -> List[Optional[Dict[str, float]]]:
+        if not self.use_embeddings or not self.backoff.available():
+            return [None] * len(texts)
+        try:
+            async with self.lock:
+                if self.centroids is None:
+                    await asyncio.to_thread(self.warmup)
+            similarity = cosine_similarity(await aembed(texts), self.centroids)
+        except Exception as e:
+            delay = self.backoff.failed()
+            logger.warning(
+                "Embedding router unavailable, using rules only for %ss: %s", delay, e
+            )
+            return [None] * len(texts)
+        self.backoff.succeeded()
+        scores = []
+        for row in similarity:
+            logits = row / self.temperature
+            probabilities = np.exp(logits - logits.max())
+            probabilities /= probabilities.sum()
+            scores.append(dict(zip(ROUTES, probabilities.tolist())))
+        return scores
+
+    def _combine(
+        self,
+        rule_scores: Optional[Dict[str, float]],
+        embedding_scores: Optional[Dict[str, float]],
+    ) -> RouteDecision:
+        if rule_scores and embedding_scores:
+            scores = {
+                route: self.rule_weight * rule_scores[route]
+                + (1 - self.rule_weight) * embedding_scores[route]
+                for route in ROUTES
+            }
+            source = "rules+embeddings"
+        elif rule_scores or embedding_scores:
+            scores = rule_scores or embedding_scores
+            source = "rules" if rule_scores else "embeddings"
+        else:
+            return RouteDecision(next_node="chat", confidence=0.0, source="none")
+
+        best = max(scores, key=scores.get)
+        return RouteDecision(
+            next_node=best, confidence=scores[best], source=source, scores=scores
+        )
+
+    async def classify_many(self, texts: List[str]) -> List[RouteDecision]:
+        """Local decisions for many texts, embedded in one call."""
+        embedding_scores = await self._embedding_scores(texts)
+        return [
+            self._combine(self._rule_scores(text), scores)
+            for text, scores in zip(texts, embedding_scores)
+        ]
+
+    async def classify(self, text: str) -> RouteDecision:
+        """Local decision only, may be below the confidence threshold."""
+        return (await self.classify_many([text]))[0]
+
+    async def _decide(self, text: str, decision: RouteDecision) -> RouteDecision:
+        if decision.confidence >= self.confidence_threshold:
+            return decision
+        messages = build_messages(prompts.MANAGER_PROMPT, task=text)
+        response = await self.llm.with_structured_output(states.MainRouter).ainvoke(
+            messages
+        )
+        return RouteDecision(
+            next_node=response.next_node,
+            confidence=decision.confidence,
+            source="llm",
+            scores=decision.scores,
+        )
+
+    def _record(self, decision: RouteDecision, elapsed: float):
+        self.decisions.inc(route=decision.next_node, source=decision.source)
+        self.confidence.observe(decision.confidence, route=decision.next_node)
+        self.latency.observe(elapsed, source=decision.source)
+        logger.info(
+            "Routed to %s via %s (confidence %.2f, %.1f ms)",
+            decision.next_node,
+            decision.source,
+            decision.confidence,
+            elapsed * 1000,
+        )
+
+    async def route(self, text: str) -> RouteDecision:
+        decision = (_routed.get() or {}).get(text)
+        if decision is not None:
+            return decision
+
+        start = time.perf_counter()
+        decision = await self._decide(text, await self.classify(text))
+        self._record(decision, time.perf_counter() - start)
+        return decision
+
+    async def route_many(self, texts: List[str]) -> List[RouteDecision]:
+        """
+        Routes a batch of texts: one embedding call for all of them, the
+        uncertain ones go to the LLM concurrently. Runs started inside
+        `routed(...)` with the result don't pay again when they reach their
+        main agent.
+        """
+        start = time.perf_counter()
+        decisions = await asyncio.gather(
+            *(
+                self._decide(text, decision)
+                for text, decision in zip(texts, await self.classify_many(texts))
+            )
+        )
+        elapsed = (time.perf_counter() - start) / max(1, len(texts))
+        for decision in decisions:
+            self._record(decision, elapsed)
+        return decisions
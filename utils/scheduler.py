@@ -0,0 +1,258 @@
+import re
+import heapq
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+# ===================== Scheduling Engine =====================
+# Deterministic critical path scheduling of a parsed plan (see plan_parser):
+# dependency DAG -> topological order -> CPM forward/backward pass -> slack
+# -> resource levelling onto a limited number of parallel lanes.
+
+EPSILON = 1e-9
+
+DURATION = re.compile(
+    r"(\d+(?:\.\d+)?)(?:\s*(?:-|to|–)\s*(\d+(?:\.\d+)?))?\s*"
+    r"(hours?|hrs?|h|days?|d|weeks?|wks?|w|months?)\b",
+    re.I,
+)
+NO_DEPENDENCY = re.compile(
+    r"^\s*(none|n/?a|no(ne| dependency)?|-|—|nil)?\s*\.?\s*$", re.I
+)
+
+
+def parse_duration(
+    text: str,
+    default: float = 1.0,
+    hours_per_day: float = 8.0,
+    days_per_week: float = 7.0,
+) -> float:
+    """Duration in days, ranges ("2-3 days") count as their mean."""
+    text = (text or "").lower().replace("half a day", "0.5 day")
+    match = DURATION.search(text)
+    if not match:
+        return default
+    low = float(match.group(1))
+    high = float(match.group(2)) if match.group(2) else low
+    value = (low + high) / 2
+    unit = match.group(3)[0]
+    if unit == "h":
+        return value / hours_per_day
+    if unit == "w":
+        return value * days_per_week
+    if unit == "m":
+        return value * 30
+    return value
+
+
+def parse_dependencies(text: str, steps_by_number: Dict[int, Dict]) -> List[int]:
+    if not text or NO_DEPENDENCY.match(text):
+        return []
+    numbers = [int(n) for n in re.findall(r"\d+", text)]
+    if not numbers:
+        # dependency given by name instead of number
+        lowered = text.lower()
+        numbers = [
+            number
+            for number, step in steps_by_number.items()
+            if step["step"] and step["step"].lower() in lowered
+        ]
+    return list(dict.fromkeys(n for n in numbers if n in steps_by_number))
+
+
+def _topological_order(nodes: List[int], dependencies: Dict[int, List[int]]):
+    indegree = {n: len(dependencies[n]) for n in nodes}
+    successors = defaultdict(list)
+    for node in nodes:
+        for dependency in dependencies[node]:
+            successors[dependency].append(node)
+
+    queue = deque(sorted(n for n in nodes if indegree[n] == 0))
+    order = []
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        for successor in successors[node]:
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                queue.append(successor)
+    return order, successors
+
+
+def build_schedule(
+    steps: List[Dict],
+    max_parallel: Optional[int] = None,
+    default_duration: float = 1.0,
+    hours_per_day: float = 8.0,
+    days_per_week: float = 7.0,
+) -> Dict:
+    """
+    `steps` as returned by parse_plan_steps. Returns the per-step CPM values,
+    the levelled start/finish/lane of each step, the critical path and
+    the project duration, all in days.
+    """
+    warnings = []
+    by_number = {}
+    for step in steps:
+        if step["number"] in by_number:
+            warnings.append(f"Duplicate step number {step['number']}, kept the first")
+            continue
+        by_number[step["number"]] = step
+    nodes = list(by_number)
+
+    duration = {
+        n: parse_duration(
+            by_number[n].get("time", ""),
+            default_duration,
+            hours_per_day,
+            days_per_week,
+        )
+        for n in nodes
+    }
+    dependencies = {}
+    for n in nodes:
+        parsed = parse_dependencies(by_number[n].get("dependency", ""), by_number)
+        dependencies[n] = [d for d in parsed if d != n]
+
+    order, successors = _topological_order(nodes, dependencies)
+    if len(order) < len(nodes):
+        # cycle: drop the edges that point forward in the numbering and retry
+        cyclic = set(nodes) - set(order)
+        for n in cyclic:
+            dropped = [d for d in dependencies[n] if d in cyclic and d > n]
+            if dropped:
+                warnings.append(f"Step {n}: ignored circular dependency on {dropped}")
+                dependencies[n] = [d for d in dependencies[n] if d not in dropped]
+        order, successors = _topological_order(nodes, dependencies)
+        for n in set(nodes) - set(order):
+            dependencies[n] = []
+        if len(order) < len(nodes):
+            order, successors = _topological_order(nodes, dependencies)
+
+    # ---------------- CPM forward / backward pass ----------------
+    earliest_start, earliest_finish = {}, {}
+    for n in order:
+        earliest_start[n] = max(
+            (earliest_finish[d] for d in dependencies[n]), default=0.0
+        )
+        earliest_finish[n] = earliest_start[n] + duration[n]
+    critical_duration = max(earliest_finish.values(), default=0.0)
+
+    latest_start, latest_finish = {}, {}
+    for n in reversed(order):
+        latest_finish[n] = min(
+            (latest_start[s] for s in successors[n]), default=critical_duration
+        )
+        latest_start[n] = latest_finish[n] - duration[n]
+    slack = {n: latest_start[n] - earliest_start[n] for n in order}
+    critical = {n for n in order if abs(slack[n]) < EPSILON}
+
+    critical_path = []
+    current = min(
+        (n for n in critical if not any(d in critical for d in dependencies[n])),
+        key=lambda n: (earliest_start[n], n),
+        default=None,
+    )
+    while current is not None:
+        critical_path.append(current)
+        current = min(
+            (
+                s
+                for s in successors[current]
+                if s in critical
+                and abs(earliest_start[s] - earliest_finish[current]) < EPSILON
+            ),
+            default=None,
+        )
+
+    # ---------------- resource levelling ----------------
+    # serial schedule generation: eligible steps by least latest start,
+    # each placed on the lane that frees up first
+    remaining = {n: len(dependencies[n]) for n in order}
+    ready_at = {n: 0.0 for n in order}
+    eligible = [
+        (latest_start[n], earliest_start[n], n) for n in order if remaining[n] == 0
+    ]
+    heapq.heapify(eligible)
+    lanes = []  # heap of (free_at, lane)
+    start, finish, lane_of = {}, {}, {}
+
+    while eligible:
+        _, _, n = heapq.heappop(eligible)
+        if lanes and (
+            lanes[0][0] <= ready_at[n] + EPSILON
+            or (max_parallel and len(lanes) >= max_parallel)
+        ):
+            free_at, lane = heapq.heappop(lanes)
+        else:
+            free_at, lane = 0.0, len(lanes) + 1
+        start[n] = max(free_at, ready_at[n])
+        finish[n] = start[n] + duration[n]
+        lane_of[n] = lane
+        heapq.heappush(lanes, (finish[n], lane))
+
+        for s in successors[n]:
+            ready_at[s] = max(ready_at[s], finish[n])
+            remaining[s] -= 1
+            if remaining[s] == 0:
+                heapq.heappush(eligible, (latest_start[s], earliest_start[s], s))
+
+    scheduled = [
+        {
+            "number": n,
+            "step": by_number[n]["step"],
+            "duration": round(duration[n], 3),
+            "dependencies": dependencies[n],
+            "earliest_start": round(earliest_start[n], 3),
+            "earliest_finish": round(earliest_finish[n], 3),
+            "latest_start": round(latest_start[n], 3),
+            "latest_finish": round(latest_finish[n], 3),
+            "slack": round(slack[n], 3),
+            "critical": n in critical,
+            "start": round(start[n], 3),
+            "finish": round(finish[n], 3),
+            "lane": lane_of[n],
+        }
+        for n in sorted(order, key=lambda n: (start[n], lane_of[n]))
+    ]
+    return {
+        "unit": "days",
+        "steps": scheduled,
+        "project_duration": round(max(finish.values(), default=0.0), 3),
+        "critical_path_duration": round(critical_duration, 3),
+        "critical_path": critical_path,
+        "lanes": len(lanes),
+        "warnings": warnings,
+    }
+
+
+def _days(value: float) -> str:
+    return f"{value:g} day" if value == 1 else f"{value:g} days"
+
+
+def format_schedule(schedule: Dict) -> str:
+    lines = [
+        f"**Estimated Total Project Duration: {_days(schedule['project_duration'])}**",
+        f"Critical path ({_days(schedule['critical_path_duration'])}): "
+        + " -> ".join(f"Step {n}" for n in schedule["critical_path"]),
+        "",
+        "**Schedule:**",
+    ]
+    current_day = None
+    for step in schedule["steps"]:
+        day = int(step["start"]) + 1
+        if day != current_day:
+            lines.append(f"\n📅 Day {day}:")
+            current_day = day
+        after = (
+            " – starts after " + ", ".join(f"Step {d}" for d in step["dependencies"])
+            if step["dependencies"]
+            else ""
+        )
+        flag = "critical" if step["critical"] else f"slack {_days(step['slack'])}"
+        lines.append(
+            f"- Step {step['number']}: {step['step']} "
+            f"(Duration: {_days(step['duration'])}, lane {step['lane']}, {flag}){after}"
+        )
+    for warning in schedule["warnings"]:
+        lines.append(f"\n⚠️ {warning}")
+    return "\n".join(lines)
@@ -0,0 +1,338 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===================== Run Telemetry =====================
+# Callback handler attached to every graph run: one OpenTelemetry span per
+# run, graph node, LLM call and tool call (parented the way they nest), and
+# per-node metrics for the /metrics endpoint. Spans are no-ops until the
+# deployment installs an OpenTelemetry SDK / exporter.
+
+tracer = trace.get_tracer("project_manager")
+
+NODE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+
+def _thread_id(metadata: Optional[Dict]) -> str:
+    return str((metadata or {}).get("thread_id", ""))
+
+
+def _token_usage(response) -> Dict[str, int]:
+    """Prompt / completion tokens of an LLM result, whatever the backend."""
+    try:
+        generation = response.generations[0][0]
+    except (IndexError, AttributeError):
+        return {}
+    message = getattr(generation, "message", None)
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {
+            "prompt": usage.get("input_tokens", 0),
+            "completion": usage.get("output_tokens", 0),
+        }
+    info = dict(generation.generation_info or {})
+    info.update(getattr(message, "response_metadata", {}) or {})
+    if "prompt_eval_count" in info or "eval_count" in info:
+        return {
+            "prompt": info.get("prompt_eval_count") or 0,
+            "completion": info.get("eval_count") or 0,
+        }
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return {
+        "prompt": usage.get("prompt_tokens", 0),
+        "completion": usage.get("completion_tokens", 0),
+    }
+
+
+class RunTelemetry(BaseCallbackHandler):
+    """
+    Records duration, outcome, tokens and cost of graph nodes, LLM calls and
+    tool calls by node, and keeps the per-thread totals of the last
+    `max_threads` threads for the usage endpoint. Prices are per 1000 tokens.
+    Runs that never report an end (cancelled jobs, closed streams) are
+    dropped, and their spans ended, after `stale_after` seconds or beyond
+    `max_runs` in flight.
+    """
+
+    run_inline = True
+
+    def __init__(
+        self,
+        prompt_price: float = 0.0,
+        completion_price: float = 0.0,
+        max_threads: int = 1000,
+        max_runs: int = 10000,
+        stale_after: float = 3600.0,
+    ):
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.max_threads = max_threads
+        self.max_runs = max_runs
+        self.stale_after = stale_after
+        # both in start order, the oldest entry is always first
+        self.runs: "OrderedDict[UUID, Dict[str, Any]]" = OrderedDict()
+        # run_id -> (parent_run_id, started at) of runs without a span
+        self.parents: "OrderedDict[UUID, Tuple[Optional[UUID], float]]" = (
+            OrderedDict()
+        )
+        self.threads: "OrderedDict[str, Dict]" = OrderedDict()
+
+        self.node_seconds = metrics.histogram(
+            "node_seconds", "Wall time of graph node runs", buckets=NODE_BUCKETS
+        )
+        self.node_runs = metrics.counter(
+            "node_runs_total", "Graph node runs by outcome"
+        )
+        self.llm_calls = metrics.counter(
+            "llm_calls_total", "LLM calls by node and outcome"
+        )
+        self.llm_tokens = metrics.counter(
+            "llm_tokens_total", "Prompt and completion tokens by node"
+        )
+        self.llm_cost = metrics.counter("llm_cost_total", "LLM cost by node")
+        self.tool_seconds = metrics.histogram(
+            "tool_seconds", "Wall time of tool calls", buckets=NODE_BUCKETS
+        )
+
+    # ---------------- spans ----------------
+
+    def _parent_span(self, parent_run_id: Optional[UUID]):
+        # intermediate runnables get no span, use the closest ancestor's
+        while parent_run_id is not None:
+            run = self.runs.get(parent_run_id)
+            if run is not None:
+                return run["span"]
+            parent_run_id = self.parents.get(parent_run_id, (None, 0.0))[0]
+        return None
+
+    def _evict(self, now: float):
+        cutoff = now - self.stale_after
+        while self.runs and (
+            len(self.runs) > self.max_runs
+            or next(iter(self.runs.values()))["start"] < cutoff
+        ):
+            _, run = self.runs.popitem(last=False)
+            run["span"].set_attribute("project_manager.outcome", "abandoned")
+            run["span"].end()
+        while self.parents and (
+            len(self.parents) > self.max_runs
+            or next(iter(self.parents.values()))[1] < cutoff
+        ):
+            self.parents.popitem(last=False)
+
+    def _start(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        kind: str,
+        name: str,
+        metadata: Optional[Dict],
+    ):
+        parent = self._parent_span(parent_run_id)
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        node = (metadata or {}).get("langgraph_node", "")
+        thread_id = _thread_id(metadata)
+        span = tracer.start_span(
+            f"{kind} {name}",
+            context=context,
+            attributes={
+                "project_manager.node": node,
+                "project_manager.thread_id": thread_id,
+            },
+        )
+        now = time.perf_counter()
+        self.runs[run_id] = {
+            "kind": kind,
+            "name": name,
+            "node": node,
+            "thread_id": thread_id,
+            "span": span,
+            "start": now,
+        }
+        self._evict(now)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None):
+        self.parents.pop(run_id, None)
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            return None
+        run["seconds"] = time.perf_counter() - run["start"]
+        span = run["span"]
+        if error is None:
+            run["outcome"] = "ok"
+        elif type(error).__name__ == "GraphInterrupt":
+            # interrupts pause the run for the human, they are not failures
+            run["outcome"] = "interrupted"
+        else:
+            run["outcome"] = "error"
+        if run["outcome"] == "error":
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+        span.set_attribute("project_manager.outcome", run["outcome"])
+        span.end()
+        return run
+
+    def _usage(self, thread_id: str) -> Dict:
+        usage = self.threads.pop(thread_id, None) or {
+            "nodes": {},
+            "llm": {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost": 0.0,
+            },
+            "tools": {},
+        }
+        self.threads[thread_id] = usage
+        while len(self.threads) > self.max_threads:
+            self.threads.popitem(last=False)
+        return usage
+
+    # ---------------- graph runs and nodes ----------------
+
+    def on_chain_start(
+        self,
+        serialized,
+        inputs,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ):
+        name = kwargs.get("name") or ""
+        if parent_run_id is None:
+            self._start(run_id, None, "run", name or "graph", metadata)
+        elif name and name == (metadata or {}).get("langgraph_node"):
+            self._start(run_id, parent_run_id, "node", name, metadata)
+        else:
+            now = time.perf_counter()
+            self.parents[run_id] = (parent_run_id, now)
+            self._evict(now)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        self._record_chain(self._end(run_id))
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs):
+        self._record_chain(self._end(run_id, error))
+
+    def _record_chain(self, run: Optional[Dict]):
+        if run is None or run["kind"] != "node":
+            return
+        node = run["name"]
+        self.node_seconds.observe(run["seconds"], node=node)
+        self.node_runs.inc(node=node, outcome=run["outcome"])
+        stats = self._usage(run["thread_id"])["nodes"].setdefault(
+            node, {"runs": 0, "seconds": 0.0}
+        )
+        stats["runs"] += 1
+        stats["seconds"] += run["seconds"]
+
+    # ---------------- LLM calls ----------------
+
+    def on_chat_model_start(
+        self,
+        serialized,
+        messages,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name", "chat_model")
+        self._start(run_id, parent_run_id, "llm", name, metadata)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        run = self.runs.get(run_id)
+        if run is None:
+            return
+        tokens = _token_usage(response)
+        prompt, completion = tokens.get("prompt", 0), tokens.get("completion", 0)
+        cost = (prompt * self.prompt_price + completion * self.completion_price) / 1000
+        run["span"].set_attribute("gen_ai.usage.input_tokens", prompt)
+        run["span"].set_attribute("gen_ai.usage.output_tokens", completion)
+        self._end(run_id)
+
+        node = run["node"] or "none"
+        self.llm_calls.inc(node=node, outcome="ok")
+        self.llm_tokens.inc(prompt, node=node, type="prompt")
+        self.llm_tokens.inc(completion, node=node, type="completion")
+        if cost:
+            self.llm_cost.inc(cost, node=node)
+        llm = self._usage(run["thread_id"])["llm"]
+        llm["calls"] += 1
+        llm["prompt_tokens"] += prompt
+        llm["completion_tokens"] += completion
+        llm["cost"] += cost
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        run = self._end(run_id, error)
+        if run is not None:
+            self.llm_calls.inc(node=run["node"] or "none", outcome="error")
+
+    # ---------------- tool calls ----------------
+
+    def on_tool_start(
+        self,
+        serialized,
+        input_str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, "tool", name, metadata)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        self._record_tool(self._end(run_id))
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        self._record_tool(self._end(run_id, error))
+
+    def _record_tool(self, run: Optional[Dict]):
+        if run is None:
+            return
+        self.tool_seconds.observe(
+            run["seconds"], tool=run["name"], node=run["node"] or "none"
+        )
+        stats = self._usage(run["thread_id"])["tools"].setdefault(
+            run["name"], {"calls": 0, "seconds": 0.0}
+        )
+        stats["calls"] += 1
+        stats["seconds"] += run["seconds"]
+
+    def usage(self, thread_id: str) -> Dict:
+        """Totals of the thread's runs in this process."""
+        usage = self.threads.get(thread_id) or {"nodes": {}, "llm": {}, "tools": {}}
+        return {"thread_id": thread_id, **usage}
+
+
+_telemetry: Optional[RunTelemetry] = None
+
+
+def configure_telemetry(settings: Optional[Dict] = None) -> Optional[RunTelemetry]:
+    """Create the run telemetry handler, `enabled: false` turns it off."""
+    global _telemetry
+    settings = dict(settings or {})
+    if not settings.pop("enabled", True):
+        _telemetry = None
+        return None
+    _telemetry = RunTelemetry(**settings)
+    return _telemetry
+
+
+def get_telemetry() -> Optional[RunTelemetry]:
+    return _telemetry
@@ -0,0 +1,22 @@
+import math
+from typing import Dict, Iterable
+
+# rough token count for budgeting prompts, llama style tokenizers average
+# about 4 characters per token on English text
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def count_message_tokens(messages: Iterable[Dict]) -> int:
+    # a few tokens of role / separator overhead per message
+    return sum(count_tokens(m.get("content", "")) + 4 for m in messages)
+
+
+def truncate_tokens(text: str, max_tokens: int, suffix: str = " …") -> str:
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text or "") <= limit:
+        return text
+    return text[: max(0, limit - len(suffix))].rstrip() + suffix